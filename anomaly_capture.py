@@ -0,0 +1,235 @@
+# anomaly_capture.py
+# A screenshot and a DOM diff of the results pages that look wrong, and ONLY of
+# those. A screenshot of every page would multiply the disk use and slow every
+# keyword down, so on the normal path this costs a few dict lookups. Evidence
+# is saved when:
+#   rank_move   a competitor moved more than config.ANOMALY_RANK_MOVE positions
+#               against its last rank in the history (rank_analytics.py)
+#   no_organic  a results page parsed to zero organic results
+#   captcha     Google showed a CAPTCHA
+#   consent     Google showed its cookie-consent page instead of results
+#
+# One folder per capture, config.ANOMALY_CAPTURE_PATH/<date>/<time>-<keyword>-<reason>/:
+#   info.json       reason, keyword, device, target, page, URL and the rank moves
+#   page.html       the page as the browser (or the HTTP tier) got it
+#   screenshot.png  browser pages only
+#   dom.diff        unified diff of the page's DOM outline against the newest
+#                   archived page (serp_archive.py) of the same keyword, target
+#                   and page number with other contents. The outline has one
+#                   line per element - tag, id and classes, indented by depth,
+#                   no text - so the diff shows the markup that changed, not
+#                   every new snippet.
+# For a rank move the browser is on the last results page checked; the earlier
+# pages are in the SERP archive. Like archiving, a capture never interrupts a
+# scrape, and a run saves at most config.ANOMALY_MAX_CAPTURES of them.
+
+import asyncio
+import datetime
+import difflib
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import urllib.parse
+
+import config
+import fetch_planner
+import offline_dom
+import rank_analytics
+import rank_records
+import search_targets
+import serp_archive
+
+RANK_MOVE = "rank_move"
+NO_ORGANIC = "no_organic"
+CAPTCHA = "captcha"
+CONSENT = "consent"
+
+_lock = threading.Lock()
+_last_ranks_by_segment = {}
+_captured = set()  # (keyword, device, target, page, reason) saved in this run
+
+
+def enabled():
+    return config.ENABLE_ANOMALY_CAPTURE
+
+
+# --- 1. TRIGGERS ---
+def _last_ranks(segment):
+    # {(keyword key, competitor): rank} from the newest snapshot holding each
+    # pair. The history file is read once per run and segment.
+    with _lock:
+        if segment not in _last_ranks_by_segment:
+            try:
+                history = rank_analytics.load_history(segment).drop_duplicates(["keyword", "competitor"], keep="last")
+                _last_ranks_by_segment[segment] = {
+                    (fetch_planner.keyword_key(keyword), competitor): int(rank)
+                    for keyword, competitor, rank in zip(history["keyword"], history["competitor"], history["rank"])
+                }
+            except Exception as e:
+                logging.warning(f"Could not read the rank history for anomaly checks: {e}")
+                _last_ranks_by_segment[segment] = {}
+        return _last_ranks_by_segment[segment]
+
+
+def previous_ranks(job, segment=None):
+    # {url: last rank in the history} of the job's competitor URLs ({} when off).
+    # segment: the history segment; by default the device for the device's default
+    # market (the scripts), else the target key (run_matrix.py).
+    if not enabled():
+        return {}
+    target = job.target
+    if segment:
+        segments = [segment]
+    elif target == search_targets.default_target(target.device):
+        segments = [target.device, target.key]
+    else:
+        segments = [target.key]
+    key = fetch_planner.keyword_key(job.keyword)
+    previous = {}
+    for history_segment in segments:
+        last = _last_ranks(history_segment)
+        for row in job.rows:
+            for name, spec in config.COMPETITORS.items():
+                url = row[spec['url_column']]
+                if isinstance(url, str) and url.strip() and (key, name) in last:
+                    previous.setdefault(url, last[(key, name)])
+    return previous
+
+
+def rank_moves(previous, ranks):
+    # [{url, previous, rank}] of the URLs that moved more than ANOMALY_RANK_MOVE
+    # positions. Not found counts as just past the last page, like the analytics.
+    floor = rank_analytics.not_found_floor()
+    moves = []
+    for url, before in previous.items():
+        now = ranks.get(url)
+        change = (floor if now == rank_records.NOT_FOUND_RANK else now) - (floor if before == rank_records.NOT_FOUND_RANK else before)
+        if abs(change) > config.ANOMALY_RANK_MOVE:
+            moves.append({"url": url, "previous": rank_records.rank_text(before), "rank": rank_records.rank_text(now)})
+    return moves
+
+
+def empty_page_reason(page_url, html=""):
+    # Why a page has no organic results: CONSENT, CAPTCHA or NO_ORGANIC.
+    page_url = page_url or ""
+    host = urllib.parse.urlparse(page_url).hostname or ""
+    if host.startswith("consent.") or 'action="https://consent.google.' in html:
+        return CONSENT
+    if "/sorry/" in page_url or "g-recaptcha" in html:
+        return CAPTCHA
+    return NO_ORGANIC
+
+
+# --- 2. DOM DIFF ---
+def dom_outline(html):
+    # One line per element: "  div#id.class1.class2", two spaces per level. No text.
+    lines = []
+    stack = [(child, 0) for child in reversed(offline_dom.parse(html).children)]
+    while stack:
+        node, depth = stack.pop()
+        name = node.tag + (f"#{node.get('id')}" if node.get("id") else "") + "".join(f".{c}" for c in node.classes)
+        lines.append("  " * depth + name)
+        stack.extend((child, depth + 1) for child in reversed(node.children))
+    return lines
+
+
+def baseline_page(keyword, device, page, html, target=None):
+    # The newest archived page of the same market with other contents than `html`,
+    # or None. Another market's page would differ for reasons of its own.
+    if not serp_archive.enabled():
+        return None
+    sha256 = hashlib.sha256(html.encode("utf-8")).hexdigest()
+    for entry in serp_archive.find_pages(keyword=keyword, device=device, page=page):
+        if entry["target"] == target and entry["html_sha256"] != sha256:
+            return entry
+    return None
+
+
+def dom_diff(html, baseline_html, baseline_name):
+    return "".join(difflib.unified_diff(
+        [line + "\n" for line in dom_outline(baseline_html)], [line + "\n" for line in dom_outline(html)],
+        fromfile=baseline_name, tofile="this page", n=2))
+
+
+# --- 3. SAVING ---
+def _claim(keyword, device, target, page, reason):
+    # True when this anomaly should be saved: not seen before, and under the cap.
+    with _lock:
+        entry = (keyword, device, target, page, reason)
+        if entry in _captured or len(_captured) >= config.ANOMALY_MAX_CAPTURES:
+            return False
+        _captured.add(entry)
+        return True
+
+
+def save_capture(reason, keyword, device, page, html, screenshot=None, page_url=None, target=None, moves=None):
+    # Writes the capture folder. Returns its path, or None. Never raises.
+    try:
+        now = datetime.datetime.now()
+        slug = re.sub(r"[^\w-]+", "-", keyword.lower()).strip("-")[:60] or "keyword"
+        base = os.path.join(config.ANOMALY_CAPTURE_PATH, now.date().isoformat(), f"{now:%H%M%S}-{slug}-{reason}")
+        folder, n = base, 1
+        while os.path.exists(folder):  # same keyword and reason twice in one second (another target)
+            n += 1
+            folder = f"{base}-{n}"
+        os.makedirs(folder)
+        info = {
+            "reason": reason, "keyword": keyword, "device": device, "target": target, "page": page,
+            "page_url": page_url, "captured_at": now.isoformat(timespec="seconds"), "moves": moves, "baseline": None,
+        }
+        with open(os.path.join(folder, "page.html"), "w", encoding="utf-8") as f:
+            f.write(html)
+        if screenshot:
+            with open(os.path.join(folder, "screenshot.png"), "wb") as f:
+                f.write(screenshot)
+
+        baseline = baseline_page(keyword, device, page, html, target)
+        if baseline is not None:
+            baseline_html = serp_archive.read_blob(baseline["html_sha256"]).decode("utf-8")
+            info["baseline"] = {"archive_id": baseline["id"], "captured_at": baseline["captured_at"], "page_url": baseline["page_url"]}
+            with open(os.path.join(folder, "dom.diff"), "w", encoding="utf-8") as f:
+                f.write(dom_diff(html, baseline_html, f"archive page {baseline['id']} ({baseline['captured_at']})"))
+        with open(os.path.join(folder, "info.json"), "w", encoding="utf-8") as f:
+            json.dump(info, f, indent=2, ensure_ascii=False)
+        logging.warning(f"Anomaly '{reason}' on page {page} of '{keyword}': evidence saved to '{folder}'.")
+        return folder
+    except Exception as e:
+        logging.warning(f"Could not save the '{reason}' capture of '{keyword}': {e}")
+        return None
+
+
+def capture_html(reason, keyword, device, page, html, page_url=None, target=None, moves=None):
+    # The HTTP tier: no screenshot, just the HTML and its DOM diff.
+    if not enabled() or not _claim(keyword, device, target, page, reason):
+        return None
+    return save_capture(reason, keyword, device, page, html, None, page_url, target, moves)
+
+
+def capture_driver_page(driver, reason, keyword, device, page, target=None, moves=None):
+    # Selenium: the page the driver is on, with a screenshot of the viewport.
+    if not enabled() or not _claim(keyword, device, target, page, reason):
+        return None
+    try:
+        html = driver.page_source
+        screenshot = driver.get_screenshot_as_png()
+        page_url = driver.current_url
+    except Exception as e:
+        logging.warning(f"Could not read the page for the '{reason}' capture: {e}")
+        return None
+    return save_capture(reason, keyword, device, page, html, screenshot, page_url, target, moves)
+
+
+async def capture_playwright_page(page, reason, keyword, device, page_num, target=None, moves=None):
+    # Playwright: the diff and file writes run off the event loop.
+    if not enabled() or not _claim(keyword, device, target, page_num, reason):
+        return None
+    try:
+        html = await page.content()
+        screenshot = await page.screenshot(full_page=True)
+    except Exception as e:
+        logging.warning(f"Could not read the page for the '{reason}' capture: {e}")
+        return None
+    return await asyncio.to_thread(save_capture, reason, keyword, device, page_num, html, screenshot, page.url, target, moves)
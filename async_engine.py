@@ -0,0 +1,263 @@
+# async_engine.py
+# asyncio scraping engine built on Playwright.
+#
+# The Selenium scripts need one OS thread per browser and block on every sleep.
+# This engine drives many isolated browser contexts inside ONE Chromium (see
+# context_pool.py) from a single event loop, so dozens of SERP fetches can be in flight at once while
+# pauses, CAPTCHA waits and Sheet writes only suspend the keyword they belong to.
+#
+# It reports the same per-keyword ranks, and writes the same Sheet cells, as main.py.
+#
+# Usage:
+#   python async_engine.py                  # config.ASYNC_CONCURRENCY workers
+#   python async_engine.py --concurrency 16 --headless
+#   python async_engine.py --device mobile  # Pixel 5 emulation in every context
+
+import argparse
+import asyncio
+import logging
+import random
+import traceback
+from contextlib import asynccontextmanager
+
+import config
+import serp_selectors
+import serp_parser
+import pacing
+import notifications
+import context_pool
+import search_targets
+import selector_registry
+import sheet_io
+import storage
+import rank_analytics
+import rank_records
+import replay
+import log_setup
+import serp_archive
+import fetch_planner
+import anomaly_capture
+
+try:
+    from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
+except ImportError:  # Optional dependency: pip install playwright && playwright install chromium
+    async_playwright = None
+    PlaywrightTimeoutError = TimeoutError
+
+
+# --- 1. LOGGING SETUP ---
+def setup_logging(name='async_ranking_automation', per_process=False):
+    # Queued, rotating text + JSON logs (log_setup.py). Each worker task sets its
+    # own log context, so records from concurrent keywords stay attributable.
+    return log_setup.setup_logging(name, per_process=per_process)
+
+
+# --- 2. PAGE HELPERS ---
+async def wait_out_captcha(page, keyword, device="desktop", page_num=1, target=None):
+    # Returns True if there is no CAPTCHA (or it was solved in time).
+    if not await page.query_selector(serp_selectors.CAPTCHA_IFRAME):
+        return True
+    logging.warning(f"!!! CAPTCHA DETECTED for keyword '{keyword}'!!! Pausing this worker for up to {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f} minutes for manual intervention.")
+    log_setup.set_context(phase="captcha")
+    await anomaly_capture.capture_playwright_page(page, anomaly_capture.CAPTCHA, keyword, device, page_num, target)
+    await asyncio.to_thread(notifications.send_error_email, *notifications.captcha_paused_email(keyword))
+    try:
+        # Resolves when the iframe leaves the DOM; no polling loop needed.
+        await page.wait_for_selector(serp_selectors.CAPTCHA_IFRAME, state="detached", timeout=config.CAPTCHA_WAIT_TIMEOUT * 1000)
+        logging.info(f">>> CAPTCHA SOLVED for '{keyword}'! Resuming worker. <<<")
+        log_setup.set_context(phase="scrape")
+        return True
+    except PlaywrightTimeoutError:
+        logging.error(f"CAPTCHA not solved within the {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f} minute time limit. Aborting keyword '{keyword}'.")
+        await asyncio.to_thread(notifications.send_error_email, *notifications.captcha_timeout_email(keyword))
+        return False
+
+
+# --- 3. CORE SCRAPING LOGIC ---
+async def scrape_keyword(context, keyword, urls_to_find, target=None, previous_ranks=None):
+    # Returns a rank_records.KeywordRanks, or None if the keyword was aborted on a CAPTCHA.
+    # previous_ranks: {url: last rank} (anomaly_capture.previous_ranks) to check for big moves.
+    device = target.device if target else "desktop"
+    target_key = target.key if target else None
+    log_setup.set_context(phase="search")
+    page = await context.new_page()
+    try:
+        await page.goto(search_targets.search_url(keyword, target), wait_until="domcontentloaded")
+
+        ranks_found_so_far = rank_records.KeywordRanks(urls_to_find)
+        current_rank_offset = 0
+        current_absolute_offset = 0
+
+        for page_num in range(1, config.MAX_PAGES_TO_CHECK + 1):
+            log_setup.set_context(phase="scrape", page=page_num)
+            logging.info(f"--- Scraping Page {page_num} for '{keyword}' ---")
+            try:
+                await page.wait_for_selector(selector_registry.readiness_selector(device), timeout=config.READINESS_TIMEOUT * 1000)
+            except PlaywrightTimeoutError:
+                logging.warning(f"No result blocks appeared on page {page_num} for '{keyword}'.")
+
+            if not await wait_out_captcha(page, keyword, device, page_num, target_key):
+                return None
+
+            blocks = await selector_registry.extract_blocks_async(page, device)
+            selector_registry.observe_page(device, blocks, current_rank_offset, keyword, page.url)
+            logging.info(f"SERP features on page {page_num} for '{keyword}': {serp_parser.feature_summary(blocks)}")
+            result_urls = serp_parser.organic_urls(blocks)
+            await serp_archive.archive_playwright_page(page, keyword, device, current_rank_offset, result_urls, target_key)
+            if not result_urls:
+                # Evidence for an empty page (or a consent/CAPTCHA page in its place).
+                await anomaly_capture.capture_playwright_page(page, anomaly_capture.empty_page_reason(page.url), keyword, device, page_num, target_key)
+            positions = serp_parser.competitor_positions(blocks, urls_to_find, current_rank_offset, current_absolute_offset)
+            for url, rank in ranks_found_so_far.add_page(result_urls, current_rank_offset, page_num).items():
+                position = positions[url]
+                logging.info(f"SUCCESS: Found '{url}' at rank {rank} on page {page_num} for '{keyword}' (absolute rank {position['absolute_rank']}, {position['top']}px from top)")
+
+            await pacing.human_pause_async("after_scrape")
+
+            if ranks_found_so_far.all_found():
+                logging.info(f"All competitors found for '{keyword}'.")
+                break
+
+            next_button = await selector_registry.find_next_button_async(page, device)
+            if not next_button:
+                logging.info(f"No 'Next' button found for '{keyword}'. Reached the end of results.")
+                break
+            await pacing.human_pause_async("before_next_page")
+            async with page.expect_navigation(wait_until="domcontentloaded"):
+                await next_button.click()
+            current_rank_offset += 10
+            current_absolute_offset += len(blocks)
+
+        moves = anomaly_capture.rank_moves(previous_ranks or {}, ranks_found_so_far)
+        if moves:
+            await anomaly_capture.capture_playwright_page(page, anomaly_capture.RANK_MOVE, keyword, device, page_num, target_key, moves)
+        return ranks_found_so_far
+    finally:
+        await page.close()
+
+
+# --- 4. WORKERS ---
+# One job per unique keyword, fanned out to all of its rows (fetch_planner.py).
+KeywordJob = fetch_planner.KeywordJob
+
+
+def jobs_from_rows(df, indices_to_process, target):
+    return fetch_planner.plan_for_target(df, indices_to_process, target)
+
+
+async def keyword_worker(worker_id, pools, queue, on_result):
+    while True:
+        try:
+            job = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        log_setup.set_context(worker=worker_id, keyword=job.keyword, target=job.target.key, device=job.target.device)
+        logging.info(f"[worker {worker_id}] --- Processing keyword: '{job.keyword}' ({job.target.key}) ---")
+        context = await pools.acquire(job.target)
+        try:
+            ranks = await scrape_keyword(context, job.keyword, job.urls_to_find, job.target, anomaly_capture.previous_ranks(job))
+        except selector_registry.SelectorDriftError:
+            raise
+        except Exception as e:
+            # One failing keyword must not cancel the other workers.
+            logging.error(f"[worker {worker_id}] Error while scraping '{job.keyword}': {e}", exc_info=True)
+            ranks = None
+        finally:
+            await pools.release(job.target, context)
+
+        if ranks is not None:
+            logging.info(f"Finished scraping for '{job.keyword}' ({job.target.key}). Final ranks: {ranks}")
+            replay.event("ranks", keyword=job.keyword, device=job.target.device, target=job.target.key, ranks=ranks.to_dict())
+            await on_result(job, ranks)
+
+        await pacing.human_pause_async("between_keywords")
+
+
+@asynccontextmanager
+async def browser_pools(concurrency=None, headless=None):
+    # One Chromium and its context pools, closed on exit.
+    if async_playwright is None:
+        raise RuntimeError("The async engine needs Playwright: pip install playwright && playwright install chromium")
+    concurrency = concurrency or config.ASYNC_CONCURRENCY
+    headless = config.ASYNC_HEADLESS if headless is None else headless
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless, args=["--disable-blink-features=AutomationControlled"])
+        pools = context_pool.ContextPools(browser, size=concurrency)
+        try:
+            yield pools
+        finally:
+            await pools.close()
+            await browser.close()
+
+
+async def run_workers(workers):
+    # Waits for all worker tasks. On selector drift (or any other fatal error)
+    # stops every worker, not just the one that hit it.
+    tasks = [asyncio.ensure_future(worker) for worker in workers]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_jobs(jobs, on_result, concurrency=None, headless=None):
+    # Runs the jobs in the given order on `concurrency` workers sharing one browser.
+    concurrency = concurrency or config.ASYNC_CONCURRENCY
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async with browser_pools(concurrency, headless) as pools:
+        await run_workers(keyword_worker(i + 1, pools, queue, on_result) for i in range(min(concurrency, len(jobs))))
+
+
+async def run_engine(df, indices_to_process, on_result, concurrency=None, headless=None, device="desktop"):
+    jobs = jobs_from_rows(df, indices_to_process, search_targets.default_target(device))
+    await run_jobs(jobs, on_result, concurrency, headless)
+
+
+def sheet_result_writer(worksheet):
+    # gspread is blocking and not thread-safe: write from a worker thread, one job (all its rows) per request.
+    lock = asyncio.Lock()
+
+    async def on_result(job, ranks):
+        async with lock:
+            await asyncio.to_thread(sheet_io.write_job_ranks, worksheet, job, ranks)
+
+    return on_result
+
+
+# --- 5. MAIN EXECUTION BLOCK ---
+async def main(concurrency=None, headless=None, device="desktop"):
+    logging.info(f"--- Starting ASYNC Ranking Automation Engine ({device}) ---")
+    try:
+        worksheet = await asyncio.to_thread(storage.open_worksheet)
+        df = await asyncio.to_thread(sheet_io.get_data_from_sheet, worksheet)
+
+        indices_to_process = list(df.index)
+        random.shuffle(indices_to_process)
+        indices_to_process = indices_to_process[:config.KEYWORDS_PER_BATCH]
+        logging.info(f"Processing a batch of {len(indices_to_process)} keywords.")
+
+        await run_engine(df, indices_to_process, sheet_result_writer(worksheet), concurrency, headless, device)
+        await asyncio.to_thread(rank_analytics.run_stage, worksheet, device)
+    except selector_registry.SelectorDriftError as e:
+        logging.critical(f"Stopping the run: {e}")
+    except Exception as e:
+        logging.critical(f"A critical, unhandled error occurred: {e}", exc_info=True)
+        await asyncio.to_thread(notifications.send_error_email, *notifications.crash_email(traceback.format_exc()))
+    finally:
+        logging.info("--- ASYNC Ranking Automation Engine Finished ---")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape keyword ranks with many concurrent browser contexts.")
+    parser.add_argument("--concurrency", type=int, default=None, help="Number of keywords in flight (default: config.ASYNC_CONCURRENCY).")
+    parser.add_argument("--headless", action="store_true", help="Run Chromium without a window.")
+    parser.add_argument("--device", choices=["desktop", "mobile"], default="desktop", help="Emulation profile for every browser context.")
+    args = parser.parse_args()
+    setup_logging()
+    replay.start_run("async_engine", args.device)
+    asyncio.run(main(args.concurrency, True if args.headless else None, args.device))
@@ -2,21 +2,204 @@
 import os
 
 # --- Project Paths ---
-PROJECT_ROOT = r"C:\Users\Abhishek Yadav\Documents\40 Keywork Rank Tracking"
+# RANK_TRACKER_ROOT overrides it, e.g. on a worker machine with another layout.
+PROJECT_ROOT = os.environ.get("RANK_TRACKER_ROOT", r"C:\Users\Abhishek Yadav\Documents\40 Keywork Rank Tracking")
+
+# --- LOGGING (log_setup.py) ---
+LOG_DIR = PROJECT_ROOT
+# Logs are appended to and roll over at this size, and at the first record of each new day...
+LOG_MAX_MB = 20
+LOG_ROTATE_DAILY = True
+# ...keeping this many old files (name.log.1, name.log.2, ...).
+LOG_BACKUP_COUNT = 14
+# Also write name.jsonl: one JSON record per line with run id, keyword, device, phase and elapsed time.
+LOG_JSON = True
 
 # --- DEDICATED PROFILE SETUP (IN A SAFE LOCATION) ---
 # We will ONLY use this path. Chrome will create 'Default' inside it automatically.
 CHROME_PROFILE_PATH = r"C:\Users\Abhishek Yadav\Documents\40 Keywork Rank Tracking\Chrome-Master-Profile" 
 
+# --- PROFILE SNAPSHOTS (profile_manager.py) ---
+# Golden snapshots of the logged-in profile, and per-worker clones of them.
+PROFILE_STORE_PATH = os.path.join(PROJECT_ROOT, "Chrome-Profiles")
+# When True, every run gets its own clone instead of sharing CHROME_PROFILE_PATH,
+# so several scripts/workers can run at the same time.
+USE_PROFILE_CLONES = False
+PROFILE_CLONE_MODE = "minimal"  # "minimal" (cookies + local state) or "full"
+PROFILE_SNAPSHOTS_TO_KEEP = 2
+PROFILE_CLONE_MAX_AGE_HOURS = 12
+
 # --- Google Sheets Config ---
 SHEET_NAME = "40 Keywork Rank Tracking"
 WORKSHEET_NAME = "Ranking"
 GCP_CREDENTIALS_PATH = os.path.join(PROJECT_ROOT, "gcp_credentials.json")
-SEARCH_COUNTRY_CODE = "en-US"
+
+# --- STORAGE BACKEND (storage.py) ---
+# "sheets" reads and writes the Google Sheet directly. "local" uses the file
+# "<SHEET_NAME> - <worksheet>.<LOCAL_DATA_FORMAT>" in LOCAL_DATA_DIR instead (the
+# same layout as the sheet); `python storage.py sync` then pushes the ranks in one batch.
+STORAGE_BACKEND = "sheets"
+LOCAL_DATA_DIR = PROJECT_ROOT
+LOCAL_DATA_FORMAT = "csv"  # or "parquet" (needs pyarrow)
+# Rank cells buffered between two (atomic) rewrites of the local file.
+LOCAL_FLUSH_EVERY = 100
+
+# --- SEARCH MARKET ---
+# gl= takes a two-letter COUNTRY code and hl= a LANGUAGE code. (The old
+# SEARCH_COUNTRY_CODE = "en-US" was a locale, which Google ignored as a country.)
+SEARCH_COUNTRY = "in"
+SEARCH_LANGUAGE = "en"
+
+# --- RUN MATRIX (run_matrix.py) ---
+# Every keyword is ranked once per target in a single run. Each target's ranks
+# go to its own worksheet, a copy of WORKSHEET_NAME named by RESULT_WORKSHEET_TEMPLATE.
+RUN_TARGETS = [
+    {"country": "in", "language": "en", "device": "desktop"},
+    {"country": "in", "language": "en", "device": "mobile"},
+]
+RESULT_WORKSHEET_TEMPLATE = "{worksheet} - {target}"
 
 # --- Scraping Config ---
 SEARCH_URL = "https://www.google.com"
 KEYWORDS_PER_BATCH = 40
+MAX_PAGES_TO_CHECK = 5
+# Featured snippets are tagged as their own SERP feature (serp_parser.py). When
+# True, a snippet with a title still takes an organic rank, as it always has.
+COUNT_FEATURED_SNIPPET_AS_ORGANIC = True
+# Stop the run (and send one alert) after this many keywords in a row have zero
+# organic results on page 1 with every selector set - Google's markup has changed.
+SELECTOR_DRIFT_THRESHOLD = 3
+
+# --- COMPETITOR COLUMNS ---
+# For each competitor: the sheet column holding its URL, and the (1-based)
+# column number its rank is written to.
+COMPETITORS = {
+    'ICICI': {'url_column': 'ICICI URL', 'col': 6},
+    'Kotak': {'url_column': 'Kotak URL', 'col': 7},
+    'HDFC': {'url_column': 'HDFC URL', 'col': 8},
+    'SBI': {'url_column': 'SBI URL', 'col': 9},
+}
+
+# --- HTTP FETCH TIER (http_fetch.py) ---
+# Try each keyword with plain HTTP requests first; the browser is only started
+# for keywords that hit a consent page, a CAPTCHA or unreadable HTML.
+ENABLE_HTTP_FETCH_TIER = True
+HTTP_TIMEOUT = 15
+# Give up on the HTTP tier for the rest of a run after this many escalations in a row.
+HTTP_TIER_MAX_CONSECUTIVE_ESCALATIONS = 3
+# Cookies exported from the logged-in master profile, used to seed the HTTP client.
+# They are a live Google session: the file is written owner-only (0600); keep it
+# out of backups and shared folders.
+HTTP_COOKIES_PATH = os.path.join(PROJECT_ROOT, "profile_cookies.json")
+
+# --- SERP ARCHIVE (serp_archive.py) ---
+# The raw HTML of every results page is kept, compressed and stored once per
+# distinct content, so odd ranks can be checked against what Google showed.
+ENABLE_SERP_ARCHIVE = True
+SERP_ARCHIVE_PATH = os.path.join(PROJECT_ROOT, "SERP-Archive")
+ARCHIVE_SCREENSHOTS = False  # full-page PNGs are ~20x the size of the HTML
+SERP_ARCHIVE_ZSTD_LEVEL = 10
+SERP_ARCHIVE_RETENTION_DAYS = 30
+SERP_ARCHIVE_MAX_MB = 2048
+
+# --- RANK ANALYTICS (rank_analytics.py) ---
+# Every run's ranks are appended here and compared with the previous run.
+RANK_HISTORY_PATH = os.path.join(PROJECT_ROOT, "rank_history.csv")
+# One summary email per run lists every ranking that moved at least this many positions.
+RANK_CHANGE_ALERT_THRESHOLD = 5
+RANK_VOLATILITY_WINDOW = 10  # runs
+
+# --- ANOMALY CAPTURE (anomaly_capture.py) ---
+# A screenshot and a DOM diff, saved only for rank jumps, empty result pages,
+# CAPTCHAs and consent pages. The normal path saves nothing extra.
+ENABLE_ANOMALY_CAPTURE = True
+ANOMALY_CAPTURE_PATH = os.path.join(PROJECT_ROOT, "Anomalies")
+# A competitor moving MORE than this many positions since its last recorded rank.
+ANOMALY_RANK_MOVE = 10
+# A CAPTCHA storm or markup drift must not fill the disk.
+ANOMALY_MAX_CAPTURES = 50
+
+# --- REPRODUCIBLE RUNS (replay.py) ---
+# Seed for the keyword order, User-Agents and pauses. None = a new seed every run (it is logged).
+RUN_SEED = None
+# Record each run's timeline (and archive its pages) so it can be replayed offline.
+RECORD_RUNS = False
+RECORDINGS_PATH = os.path.join(PROJECT_ROOT, "Recordings")
+
+# --- RECOMPUTE (recompute.py) ---
+# Backfills ranks from the archive with a process pool.
+RECOMPUTE_WORKERS = None  # None = one process per CPU
+RECOMPUTE_CHUNK_SIZE = 2000  # archived pages per task
+
+# --- ASYNC ENGINE CONFIG (async_engine.py) ---
+# Number of keywords scraped at the same time, each in its own browser context.
+# Also the cap on live contexts across all the markets of a run.
+ASYNC_CONCURRENCY = 8
+ASYNC_HEADLESS = False
+# Each worker gets an isolated browser context inside one shared Chromium
+# (context_pool.py). A context is discarded after this many keywords.
+MAX_KEYWORDS_PER_CONTEXT = 5
+DESKTOP_VIEWPORT = (1366, 768)
+
+# --- WORK QUEUE (work_queue.py) ---
+# Coordinator/worker mode: one machine queues the keywords, any number of
+# machines (each with its own IP) scrape them, and the coordinator writes all
+# the ranks to the sheet in one batch at the end.
+WORK_QUEUE_PATH = os.path.join(PROJECT_ROOT, "work_queue.sqlite")
+QUEUE_HOST = "127.0.0.1"  # "0.0.0.0" to accept workers from other machines
+QUEUE_PORT = 8765
+QUEUE_TOKEN = ""  # shared secret the workers send; set it whenever QUEUE_HOST is not local
+QUEUE_VISIBILITY_TIMEOUT = 120  # seconds a lease lives without a heartbeat
+QUEUE_HEARTBEAT_INTERVAL = 30
+QUEUE_MAX_ATTEMPTS = 3
+QUEUE_RETRY_DELAY = 60  # seconds before a failed job is retried, times the attempt number
+QUEUE_POLL_INTERVAL = 10
+
+# --- SINGLE-KEYWORD RANK API (rank_api.py) ---
+RANK_API_HOST = "127.0.0.1"
+RANK_API_PORT = 8766
+# Browser contexts kept warm, i.e. keywords fetched at once.
+RANK_API_CONCURRENCY = 2
+# Seconds an answer (or an archived SERP) is reused for the same keyword.
+RANK_API_CACHE_TTL = 900
+# Seconds a request waits for its answer (a CAPTCHA can hold a fetch much longer).
+RANK_API_TIMEOUT = 120
+
+# --- RETRIES & CIRCUIT BREAKERS (resilience.py) ---
+# Attempts per operation, with exponential backoff (seconds) and jitter between them.
+RETRY_POLICIES = {
+    "page_load": {"attempts": 3, "base_delay": 5, "max_delay": 60},   # driver.get()
+    "element": {"attempts": 3, "base_delay": 1, "max_delay": 5},      # element lookups
+    "sheets": {"attempts": 5, "base_delay": 2, "max_delay": 60},      # reading the sheet, writing ranks
+}
+# Failed operations in a row before the browser (or Sheets client) is restarted.
+BREAKER_FAILURE_THRESHOLD = 3
+# Restarts of one component before the run is stopped...
+BREAKER_MAX_RESTARTS = 3
+# ...where every this many successful operations in a row forgive one restart,
+# so a few hiccups spread over a long run don't add up to a stop.
+BREAKER_RESTART_DECAY = 50
+# Seconds to wait before starting the replacement.
+BREAKER_COOLDOWN = 30
+
+# --- MOBILE EMULATION (Google Pixel 5) ---
+MOBILE_EMULATION = {
+    "deviceMetrics": {"width": 393, "height": 851, "pixelRatio": 3.0},
+    "userAgent": "Mozilla/5.0 (Linux; Android 11; Pixel 5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.91 Mobile Safari/537.36"
+}
+
+# --- PAGE READINESS & HUMAN PACING CONFIG ---
+# Max seconds to wait for the results to appear in the DOM. The wait ends the
+# moment they do (see page_readiness.py), so this is only an upper bound.
+READINESS_TIMEOUT = 5
+# Human-like pauses (min, max seconds) applied at each step of a search. These
+# are independent of readiness: set ENABLE_HUMAN_PACING = False to scrape at full speed.
+ENABLE_HUMAN_PACING = True
+HUMAN_PACING = {
+    "after_scrape": (2, 4),       # "reading" the page after its ranks were extracted
+    "before_next_page": (1, 2),   # before clicking the next-page button
+    "between_keywords": (5, 10),  # between two keywords
+}
 
 # --- NEW: CAPTCHA HANDLING CONFIG ---
 # The total time (in seconds) the script will wait for a CAPTCHA to be solved manually.
@@ -0,0 +1,192 @@
+# context_pool.py
+# Many isolated browser contexts multiplexed inside ONE Chromium process.
+#
+# A Playwright browser context is the incognito-equivalent of a Chrome window:
+# its own cookies, storage and cache, but it shares the browser's processes and
+# memory baseline. Each context gets its own emulation profile - a desktop user
+# agent from config.USER_AGENTS, or the Pixel 5 metrics from config.MOBILE_EMULATION -
+# so N keyword workers cost N contexts, not N Chrome processes.
+
+import asyncio
+import itertools
+import logging
+import random
+from dataclasses import dataclass
+
+import config
+
+
+@dataclass(frozen=True)
+class EmulationProfile:
+    device: str
+    user_agent: str
+    width: int
+    height: int
+    device_scale_factor: float = 1.0
+    is_mobile: bool = False
+    has_touch: bool = False
+
+    def context_options(self):
+        return {
+            "user_agent": self.user_agent,
+            "viewport": {"width": self.width, "height": self.height},
+            "device_scale_factor": self.device_scale_factor,
+            "is_mobile": self.is_mobile,
+            "has_touch": self.has_touch,
+        }
+
+
+# --- 1. PROFILES ---
+def desktop_profiles():
+    width, height = config.DESKTOP_VIEWPORT
+    return [EmulationProfile("desktop", user_agent, width, height) for user_agent in config.USER_AGENTS]
+
+
+def mobile_profile():
+    metrics = config.MOBILE_EMULATION["deviceMetrics"]
+    return EmulationProfile(
+        "mobile",
+        config.MOBILE_EMULATION["userAgent"],
+        metrics["width"],
+        metrics["height"],
+        device_scale_factor=metrics["pixelRatio"],
+        is_mobile=True,
+        has_touch=True,
+    )
+
+
+def profiles_for_device(device):
+    if device == "mobile":
+        return [mobile_profile()]
+    if device == "desktop":
+        return desktop_profiles()
+    raise ValueError(f"Unknown device '{device}'. Expected 'desktop' or 'mobile'.")
+
+
+# --- 2. THE POOL ---
+class ContextPool:
+    # The contexts of one (device, locale). A context is thrown away and
+    # replaced after config.MAX_KEYWORDS_PER_CONTEXT keywords so cookies and
+    # history never build up the way they would in a long-lived window.
+
+    def __init__(self, browser, device="desktop", extra_options=None):
+        self.browser = browser
+        self.device = device
+        self.extra_options = extra_options or {}
+        profiles = profiles_for_device(device)
+        random.shuffle(profiles)
+        self._profiles = itertools.cycle(profiles)
+        self._idle = []
+        self._uses = {}
+
+    async def new_context(self):
+        profile = next(self._profiles)
+        context = await self.browser.new_context(**profile.context_options(), **self.extra_options)
+        context.emulation_profile = profile
+        self._uses[context] = 0
+        return context
+
+    def take_idle(self):
+        # An idle context, or None.
+        return self._idle.pop() if self._idle else None
+
+    def put_idle(self, context):
+        self._idle.append(context)
+
+    def used_up(self, context):
+        # Counts a finished keyword; True once the context has served MAX_KEYWORDS_PER_CONTEXT.
+        self._uses[context] += 1
+        return self._uses[context] >= config.MAX_KEYWORDS_PER_CONTEXT
+
+    async def discard(self, context):
+        del self._uses[context]
+        await context.close()
+
+    async def close(self):
+        for context in list(self._uses):
+            await context.close()
+        self._uses.clear()
+        self._idle.clear()
+
+
+class ContextPools:
+    # One ContextPool per (device, locale), created on first use, so a
+    # multi-market run still shares a single browser process. `size` caps the
+    # live contexts of ALL the pools together: when it is reached, a market
+    # with no idle context of its own closes an idle one of another market
+    # instead of opening one more, so a run over many targets holds at most
+    # `size` contexts, not `size` per target.
+
+    def __init__(self, browser, size=None):
+        self.browser = browser
+        self.size = size or config.ASYNC_CONCURRENCY
+        self._pools = {}
+        self._live = 0
+        self._changed = asyncio.Condition()
+
+    def pool_for(self, target):
+        key = (target.device, target.locale)
+        if key not in self._pools:
+            self._pools[key] = ContextPool(self.browser, target.device, extra_options={"locale": target.locale})
+        return self._pools[key]
+
+    def _idle_elsewhere(self, pool):
+        # (pool, idle context) of another market, or (None, None).
+        for other in self._pools.values():
+            if other is not pool:
+                context = other.take_idle()
+                if context is not None:
+                    return other, context
+        return None, None
+
+    async def _open(self, pool):
+        context = await pool.new_context()
+        profile = context.emulation_profile
+        logging.info(f"Opened {profile.device} browser context ({self._live}/{self.size} live) with User-Agent: {profile.user_agent}")
+        return context
+
+    async def _give_back_slot(self):
+        async with self._changed:
+            self._live -= 1
+            self._changed.notify_all()
+
+    async def acquire(self, target):
+        pool = self.pool_for(target)
+        async with self._changed:
+            while True:
+                context = pool.take_idle()
+                if context is not None:
+                    return context
+                if self._live < self.size:
+                    self._live += 1
+                    evicted_pool, evicted = None, None
+                    break
+                evicted_pool, evicted = self._idle_elsewhere(pool)
+                if evicted is not None:  # its slot passes to the new context
+                    break
+                await self._changed.wait()
+        try:
+            if evicted is not None:
+                logging.info(f"Closing an idle {evicted_pool.device} context ({self._live}/{self.size} live) to open one for {target.key}.")
+                await evicted_pool.discard(evicted)
+            return await self._open(pool)
+        except Exception:
+            await self._give_back_slot()
+            raise
+
+    async def release(self, target, context):
+        pool = self.pool_for(target)
+        try:
+            if pool.used_up(context):
+                await pool.discard(context)
+                context = await self._open(pool)
+        except Exception:
+            await self._give_back_slot()
+            raise
+        async with self._changed:
+            pool.put_idle(context)
+            self._changed.notify_all()
+
+    async def close(self):
+        for pool in self._pools.values():
+            await pool.close()
@@ -12,6 +12,7 @@ import shutil
 
 # This assumes config.py exists and has PROJECT_ROOT
 import config
+import profile_manager
 
 # --- Configuration ---
 MASTER_PROFILE_PATH = os.path.join(config.PROJECT_ROOT, "Chrome-Master-Profile")
@@ -47,9 +48,14 @@ if __name__ == "__main__":
 
     time.sleep(90)
     
+    # Seed the HTTP fetch tier with the new session's cookies (if the window is still open).
+    profile_manager.export_cookies(driver)
     try:
         driver.quit()
     except:
         pass
+
+    # Keep a golden copy of the logged-in profile for cheap per-worker clones.
+    profile_manager.promote_snapshot(MASTER_PROFILE_PATH)
         
     logging.info("Master profile has been created and primed. You can now run the main.py script.")
\ No newline at end of file
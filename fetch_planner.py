@@ -0,0 +1,86 @@
+# fetch_planner.py
+# Plans a batch's SERP fetches: ONE fetch per unique (keyword, target), whose
+# ranks are fanned out to every sheet row that needs them.
+#
+# Sheets repeat a lot. The same competitor URLs appear on many rows, and the
+# same keyword can appear on several rows with different competitor URLs. A
+# row-by-row run loads the same SERP once per row. The planner:
+#   - groups rows by keyword (case and extra spaces ignored); rows of that
+#     keyword OUTSIDE the batch get the fresh ranks too, at no extra fetch
+#   - searches for the union of the group's competitor URLs, in first-seen
+#     order. Identical URL lists are interned, so 40 rows sharing 4 URLs hold
+#     one list, not 40
+#   - creates one job per keyword and target (country, language, device)
+# fan_out() turns a job's ranks back into (row, column, value) cells, using
+# each row's own competitor URLs.
+
+import logging
+from dataclasses import dataclass, field
+
+import config
+import search_targets
+
+
+@dataclass
+class KeywordJob:
+    # One SERP to scrape, and the sheet rows that receive its ranks.
+    keyword: str
+    urls_to_find: list
+    target: search_targets.Target
+    rows: list = field(default_factory=list)
+
+
+# --- 1. ROWS ---
+def keyword_key(keyword):
+    return " ".join(str(keyword).split()).lower()
+
+
+def row_competitors(row):
+    # [(sheet column, url)] of the row's competitor URLs that are filled in.
+    pairs = []
+    for spec in config.COMPETITORS.values():
+        url = row[spec['url_column']]
+        if isinstance(url, str) and url.strip():
+            pairs.append((spec['col'], url))
+    return pairs
+
+
+# --- 2. PLANNING ---
+def plan_fetches(df, indices_to_process, targets):
+    # Returns {target: [KeywordJob, ...]}, in the batch's keyword order.
+    rows_by_keyword = {}
+    for _, row in df.iterrows():
+        if row_competitors(row):
+            rows_by_keyword.setdefault(keyword_key(row['Keyword']), []).append(row)
+
+    batch_keywords = []
+    for index in indices_to_process:
+        key = keyword_key(df.loc[index]['Keyword'])
+        if key not in rows_by_keyword:
+            logging.warning(f"No URLs for '{df.loc[index]['Keyword']}'. Skipping.")
+        elif key not in batch_keywords:
+            batch_keywords.append(key)
+
+    url_lists = {}
+    jobs_by_target = {target: [] for target in targets}
+    for key in batch_keywords:
+        rows = rows_by_keyword[key]
+        urls = tuple(dict.fromkeys(url for row in rows for _, url in row_competitors(row)))
+        urls_to_find = url_lists.setdefault(urls, list(urls))
+        for target in targets:
+            jobs_by_target[target].append(KeywordJob(rows[0]['Keyword'], urls_to_find, target, rows))
+
+    row_count = sum(len(rows_by_keyword[key]) for key in batch_keywords)
+    logging.info(f"Fetch plan: {len(indices_to_process)} batch rows -> {len(batch_keywords)} unique keywords "
+                 f"({len(url_lists)} distinct URL sets) x {len(targets)} target(s), ranks for {row_count} rows per target.")
+    return jobs_by_target
+
+
+def plan_for_target(df, indices_to_process, target):
+    return plan_fetches(df, indices_to_process, [target])[target]
+
+
+# --- 3. FAN-OUT ---
+def fan_out(job, ranks):
+    # [(sheet row, column, text)] for every row of the job. ranks: a rank_records.KeywordRanks.
+    return [(int(row['original_index']), col, ranks.text(url)) for row in job.rows for col, url in row_competitors(row)]
@@ -0,0 +1,172 @@
+# http_fetch.py
+# Lightweight HTTP tier: try to rank a keyword with plain /search requests
+# before paying for a browser session.
+#
+# One pooled HTTP client (keep-alive, HTTP/2 when the 'h2' package is
+# installed) is shared by the whole run, and its cookie jar is seeded with
+# the cookies exported from the master profile (config.HTTP_COOKIES_PATH).
+# Result pages are parsed with the offline parser (serp_parser.parse_html).
+# fetch_ranks() returns None - "escalate to the browser" - when Google answers
+# with a consent page, a CAPTCHA, or HTML the parser cannot read.
+#
+# If every keyword has to escalate, the tier is only an extra round trip. So
+# after config.HTTP_TIER_MAX_CONSECUTIVE_ESCALATIONS escalations in a row it
+# turns itself off for the rest of the run.
+
+import json
+import logging
+import os
+import urllib.parse
+
+import config
+import pacing
+import search_targets
+import serp_parser
+import serp_archive
+import rank_records
+import anomaly_capture
+
+try:
+    import httpx
+except ImportError:  # Optional dependency: pip install "httpx[http2]"
+    httpx = None
+
+# Why a response could not be used.
+CONSENT = "consent"
+CAPTCHA = "captcha"
+UNPARSEABLE = "unparseable"
+HTTP_ERROR = "http_error"
+# Problems that get an anomaly capture (page 1 only for UNPARSEABLE: later pages just ran out).
+ANOMALY_REASONS = {CAPTCHA: anomaly_capture.CAPTCHA, CONSENT: anomaly_capture.CONSENT, UNPARSEABLE: anomaly_capture.NO_ORGANIC}
+
+_client = None
+_consecutive_escalations = 0
+_disabled = False
+stats = {"http_keywords": 0, "escalated": 0, "requests": 0}
+
+
+# --- 1. CLIENT ---
+def load_profile_cookies(path=None):
+    # Cookies exported by profile_manager.export_cookies() (a Selenium get_cookies() dump).
+    path = path or config.HTTP_COOKIES_PATH
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_client(device="desktop"):
+    global _client
+    if _client is None:
+        try:
+            import h2  # noqa: F401  (enables HTTP/2 in httpx)
+            http2 = True
+        except ImportError:
+            http2 = False
+        user_agent = config.MOBILE_EMULATION["userAgent"] if device == "mobile" else config.USER_AGENTS[0]
+        _client = httpx.Client(
+            http2=http2,
+            follow_redirects=True,
+            timeout=config.HTTP_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60),
+            headers={
+                "User-Agent": user_agent,
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": f"{config.SEARCH_LANGUAGE}-{config.SEARCH_COUNTRY.upper()},{config.SEARCH_LANGUAGE};q=0.9",
+            },
+        )
+        for cookie in load_profile_cookies():
+            _client.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain", ""), path=cookie.get("path", "/"))
+        logging.info(f"HTTP fetch tier ready (HTTP/2: {http2}, {len(_client.cookies.jar)} profile cookies).")
+    return _client
+
+
+def close():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def enabled():
+    return config.ENABLE_HTTP_FETCH_TIER and httpx is not None and not _disabled
+
+
+# --- 2. RESPONSE CLASSIFICATION ---
+def classify_response(response, device="desktop"):
+    # Returns (problem, blocks). problem is None when the page parsed cleanly.
+    final_url = str(response.url)
+    host = urllib.parse.urlparse(final_url).hostname or ""
+    html = response.text
+    if response.status_code == 429 or "/sorry/" in final_url or 'title="reCAPTCHA"' in html or "g-recaptcha" in html:
+        return CAPTCHA, []
+    if host.startswith("consent.") or 'action="https://consent.google.' in html:
+        return CONSENT, []
+    if response.status_code != 200:
+        return HTTP_ERROR, []
+    blocks, _ = serp_parser.parse_html_with_fallback(html, device, base_url=final_url)
+    if not blocks:
+        return UNPARSEABLE, []
+    return None, blocks
+
+
+def _escalate(keyword, reason):
+    global _consecutive_escalations, _disabled
+    stats["escalated"] += 1
+    _consecutive_escalations += 1
+    logging.info(f"HTTP tier: escalating '{keyword}' to the browser ({reason}).")
+    if _consecutive_escalations >= config.HTTP_TIER_MAX_CONSECUTIVE_ESCALATIONS:
+        _disabled = True
+        logging.warning(f"HTTP tier: {_consecutive_escalations} escalations in a row; using the browser only for the rest of this run.")
+    return None
+
+
+# --- 3. RANKING OVER HTTP ---
+def fetch_ranks(keyword, urls_to_find, device="desktop", target=None, previous_ranks=None):
+    # Returns a rank_records.KeywordRanks like the browser loop, or None to escalate.
+    # previous_ranks: {url: last rank} (anomaly_capture.previous_ranks) to check for big moves.
+    global _consecutive_escalations
+    if not enabled():
+        return None
+    target = target or search_targets.default_target(device)
+    client = get_client(device)
+
+    ranks_found_so_far = rank_records.KeywordRanks(urls_to_find)
+    current_rank_offset = 0
+    for page_num in range(1, config.MAX_PAGES_TO_CHECK + 1):
+        url = search_targets.search_url(keyword, target)
+        if current_rank_offset:
+            url += f"&start={current_rank_offset}"
+        try:
+            response = client.get(url)
+            stats["requests"] += 1
+        except httpx.HTTPError as e:
+            return _escalate(keyword, f"{HTTP_ERROR}: {e}")
+
+        problem, blocks = classify_response(response, device)
+        if problem == UNPARSEABLE and page_num > 1:
+            break  # ran out of results
+        if problem:
+            if problem in ANOMALY_REASONS:
+                anomaly_capture.capture_html(ANOMALY_REASONS[problem], keyword, device, page_num, response.text, str(response.url), target.key)
+            return _escalate(keyword, problem)
+
+        result_urls = serp_parser.organic_urls(blocks)
+        serp_archive.archive_page(keyword, device, page_num, response.text, page_url=str(response.url),
+                                  rank_offset=current_rank_offset, organic_urls=result_urls, target=target.key)
+        last_page = (page_num, response)
+        for found_url, rank in ranks_found_so_far.add_page(result_urls, current_rank_offset, page_num).items():
+            logging.info(f"SUCCESS (HTTP): Found '{found_url}' at rank {rank} on page {page_num}")
+        if ranks_found_so_far.all_found():
+            break
+        pacing.human_pause("before_next_page")
+        current_rank_offset += 10
+
+    moves = anomaly_capture.rank_moves(previous_ranks or {}, ranks_found_so_far)
+    if moves:
+        # The HTML of the last results page; the earlier ones are in the SERP archive.
+        page_num, response = last_page
+        anomaly_capture.capture_html(anomaly_capture.RANK_MOVE, keyword, device, page_num, response.text, str(response.url), target.key, moves)
+    _consecutive_escalations = 0
+    stats["http_keywords"] += 1
+    return ranks_found_so_far
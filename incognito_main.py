@@ -3,91 +3,57 @@
 import time
 import random
 import logging
-import os
 import pandas as pd
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 
-# Imports for Email Notifications
-import smtplib
 import traceback
-from email.mime.text import MIMEText
 
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException
 
 from webdriver_manager.chrome import ChromeDriverManager
 
 import config
 import serp_selectors
+import page_readiness
+import pacing
+import serp_parser
+import selector_registry
+import profile_manager
+import http_fetch
+import serp_archive
+import storage
+import rank_analytics
+import rank_records
+import replay
+import log_setup
+import resilience
+import fetch_planner
+import sheet_io
+import search_targets
+import anomaly_capture
+import notifications
+
+# Which selector sets (serp_selectors.SELECTOR_SETS) this script uses.
+DEVICE = "desktop"
 
 # --- 1. LOGGING SETUP ---
-log_file_path = os.path.join(config.PROJECT_ROOT, 'ranking_automation.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file_path, mode='w'),
-        logging.StreamHandler()
-    ]
-)
+# Queued, rotating text + JSON logs (log_setup.py); earlier runs' logs are kept.
+log_setup.setup_logging('ranking_automation', DEVICE)
 
-# --- EMAIL NOTIFICATION FUNCTION (No changes needed here) ---
-def send_error_email(subject, body):
-    if not config.ENABLE_EMAIL_NOTIFICATIONS:
-        return
-    if isinstance(config.RECIPIENT_EMAIL, str):
-        recipients = [config.RECIPIENT_EMAIL]
-    else:
-        recipients = config.RECIPIENT_EMAIL
-    logging.info(f"Preparing to send error email to: {', '.join(recipients)}")
-    try:
-        msg = MIMEText(body, 'plain') # Specify plain text
-        msg['Subject'] = subject
-        msg['From'] = config.SENDER_EMAIL
-        msg['To'] = ", ".join(recipients)
-        with smtplib.SMTP(config.SMTP_SERVER, config.SMTP_PORT) as server:
-            server.starttls()
-            server.login(config.SENDER_EMAIL, config.SENDER_PASSWORD)
-            server.sendmail(config.SENDER_EMAIL, recipients, msg.as_string())
-            logging.info("Error email sent successfully.")
-    except Exception as e:
-        logging.error(f"CRITICAL: FAILED TO SEND ERROR EMAIL. Error: {e}")
-
-# --- 2. HUMAN BEHAVIOR FUNCTIONS ---
-def random_delay(min_seconds=1, max_seconds=3):
-    time.sleep(random.uniform(min_seconds, max_seconds))
-
-def human_like_typing(element, text):
-    for char in text:
-        element.send_keys(char)
-        time.sleep(random.uniform(0.08, 0.15))
-
-def find_and_type_in_search_box(driver, text):
-    try:
-        search_box = WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.CSS_SELECTOR, "[name='q']")))
-        human_like_typing(search_box, text)
-        random_delay(1, 2)
-        search_box.send_keys(Keys.RETURN)
-        return True
-    except TimeoutException:
-        logging.error("Could not find the search box. Cannot perform search.")
-        return False
-
-# --- 3. SELENIUM WEBDRIVER SETUP ---
+# --- 2. SELENIUM WEBDRIVER SETUP ---
 def get_humanlike_driver():
     logging.info("Initializing human-like Chrome WebDriver in INCOGNITO mode...")
     options = Options()
     random_user_agent = random.choice(config.USER_AGENTS)
     logging.info(f"Using User-Agent: {random_user_agent}")
     options.add_argument(f'user-agent={random_user_agent}')
-    options.add_argument(f"--user-data-dir={config.CHROME_PROFILE_PATH}")
+    # A private clone of the golden profile when config.USE_PROFILE_CLONES is on.
+    options.add_argument(f"--user-data-dir={profile_manager.profile_dir_for_run('incognito')}")
     
     # --- NEW: ADD THIS LINE TO LAUNCH IN INCOGNITO MODE ---
     options.add_argument("--incognito")
@@ -98,6 +64,8 @@ def get_humanlike_driver():
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option('useAutomationExtension', False)
     
+    page_readiness.configure_options(options)
+
     service = Service(ChromeDriverManager().install())
     driver = webdriver.Chrome(service=service, options=options)
     
@@ -108,7 +76,7 @@ def get_humanlike_driver():
     driver.set_page_load_timeout(45)
     return driver
 
-# --- 4. GOOGLE SHEETS FUNCTIONS ---
+# --- 3. GOOGLE SHEETS FUNCTIONS ---
 def connect_to_gsheet():
     logging.info(f"Connecting to Google Sheet: '{config.SHEET_NAME}'")
     scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
@@ -126,208 +94,197 @@ def get_data_from_sheet(sheet):
     logging.info(f"Successfully fetched {len(df)} keywords.")
     return df
 
-# --- 5. CORE SCRAPING LOGIC ---
-def find_competitor_ranks(driver, competitor_urls, rank_offset=0):
-    ranks = {url: "Not Found" for url in competitor_urls if url}
+# --- 4. CORE SCRAPING LOGIC ---
+def find_competitor_ranks(driver, ranks, rank_offset=0, keyword=None, page_num=1):
+    # Adds this page to `ranks` (a rank_records.KeywordRanks). Returns the {url: rank} newly found.
+    newly_found = {}
     try:
-        WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.CSS_SELECTOR, serp_selectors.RESULT_CONTAINER)))
-        all_potential_blocks = driver.find_elements(By.CSS_SELECTOR, serp_selectors.RESULT_CONTAINER)
-        clean_organic_results = []
-        for block in all_potential_blocks:
-            try:
-                if block.find_elements(By.CSS_SELECTOR, "[data-text-ad]"): continue
-                h3_element = block.find_element(By.CSS_SELECTOR, "h3")
-                if not h3_element.text.strip(): continue
-                clean_organic_results.append(block)
-            except NoSuchElementException:
-                continue
-        for rank, organic_block in enumerate(clean_organic_results, start=1 + rank_offset):
-            try:
-                link_element = organic_block.find_element(By.CSS_SELECTOR, serp_selectors.LINK_CONTAINER)
-                url = link_element.get_attribute('href')
-                if not url: continue
-                for competitor_url in ranks.keys():
-                    if competitor_url in url and ranks[competitor_url] == "Not Found":
-                        ranks[competitor_url] = rank
-            except NoSuchElementException:
-                continue
+        # One round trip per selector set: every block is tagged (ad, featured snippet,
+        # local pack, PAA, organic) with its absolute rank, organic rank and pixel offset.
+        blocks = resilience.call("element", lambda: selector_registry.extract_blocks(driver, DEVICE))
+        # Zero organic results on page 1 of several keywords in a row = markup drift: stop the run.
+        selector_registry.observe_page(DEVICE, blocks, rank_offset, keyword, driver.current_url)
+        logging.info(f"SERP features on this page: {serp_parser.feature_summary(blocks)}")
+        result_urls = serp_parser.organic_urls(blocks)
+        # Archived under the market's key, like the HTTP tier and the async engine.
+        target_key = search_targets.default_target(DEVICE).key
+        serp_archive.archive_driver_page(driver, keyword, DEVICE, rank_offset, result_urls, target_key)
+        if not result_urls:
+            # Evidence for an empty page (or a consent/CAPTCHA page in its place).
+            anomaly_capture.capture_driver_page(driver, anomaly_capture.empty_page_reason(driver.current_url), keyword, DEVICE, page_num, target_key)
+        newly_found = ranks.add_page(result_urls, rank_offset, page_num)
+        for url, position in serp_parser.competitor_positions(blocks, ranks.urls, rank_offset).items():
+            logging.info(f"'{url}' appears as {position['type']} (absolute rank {position['absolute_rank']} on this page, {position['top']}px from top)")
+    except selector_registry.SelectorDriftError:
+        raise
     except Exception as e:
         logging.error(f"An error occurred during scraping on this page: {e}")
-    return ranks
+    return newly_found
 
-# --- 6. MAIN EXECUTION BLOCK ---
+# --- 5. MAIN EXECUTION BLOCK ---
 if __name__ == "__main__":
 #    logging.info("Attempting to terminate any running Chrome processes...")
 #    os.system("taskkill /F /IM chrome.exe >nul 2>&1")
     time.sleep(3)
 
     logging.info("--- Starting Ranking Automation Script ---")
+    # Seeds the keyword shuffle, User-Agent and pauses; records the run if config.RECORD_RUNS.
+    replay.start_run("incognito_main", DEVICE)
     
-    driver = None
+    # Started lazily, and each restarted on its own when it breaks (resilience.py).
+    browser = resilience.Breaker("browser", get_humanlike_driver, close=lambda driver: driver.quit(), is_broken=resilience.is_dead_session)
+    sheets = resilience.Breaker("Sheets client", lambda: storage.open_worksheet() if storage.is_local() else connect_to_gsheet(), is_broken=resilience.needs_reauth)
     try:
-        worksheet = connect_to_gsheet()
-        df = get_data_from_sheet(worksheet)
+        df = resilience.call("sheets", get_data_from_sheet, sheets)
         
         indices_to_process = list(df.index)
         random.shuffle(indices_to_process)
         indices_to_process = indices_to_process[:config.KEYWORDS_PER_BATCH]
         logging.info(f"Processing a batch of {len(indices_to_process)} keywords.")
+        # One SERP fetch per unique keyword; its ranks go to every row of that keyword.
+        jobs = fetch_planner.plan_for_target(df, indices_to_process, search_targets.default_target(DEVICE))
 
-        driver = get_humanlike_driver()
-
-        for i, index in enumerate(indices_to_process):
-            row = df.loc[index]
-            keyword = row['Keyword']
-            original_row_index = row['original_index']
-            logging.info(f"\n--- Processing keyword {i+1}/{len(indices_to_process)}: '{keyword}' ---")
-            
-            competitors = {'ICICI': {'url': row['ICICI URL'], 'col': 6}, 'Kotak': {'url': row['Kotak URL'], 'col': 7}, 'HDFC': {'url': row['HDFC URL'], 'col': 8}, 'SBI': {'url': row['SBI URL'], 'col': 9}}
-            urls_to_find = [comp['url'] for comp in competitors.values() if comp['url']]
-            
-            if not urls_to_find:
-                logging.warning(f"No URLs for '{keyword}'. Skipping.")
-                continue
-            
-            driver.get(config.SEARCH_URL)
-            random_delay(1, 3)
-            
-            if not find_and_type_in_search_box(driver, keyword):
-                continue
+        for i, job in enumerate(jobs):
+            try:
+                keyword = job.keyword
+                urls_to_find = job.urls_to_find
+                log_setup.set_context(keyword=keyword)
+                logging.info(f"\n--- Processing keyword {i+1}/{len(jobs)}: '{keyword}' ({len(job.rows)} row(s)) ---")
+
+                log_setup.set_context(phase="http")
+                # --- HTTP FETCH TIER: a plain request instead of a browser page load, when Google allows it ---
+                # Last recorded ranks, to spot big moves worth a screenshot (anomaly_capture.py).
+                previous_ranks = anomaly_capture.previous_ranks(job)
+                http_ranks = http_fetch.fetch_ranks(keyword, urls_to_find, DEVICE, previous_ranks=previous_ranks)
+                if http_ranks is not None:
+                    logging.info(f"Finished scraping for '{keyword}' over HTTP. Final ranks: {http_ranks}")
+                    replay.event("ranks", keyword=keyword, device=DEVICE, target=job.target.key, tier="http", ranks=http_ranks.to_dict())
+                    resilience.call("sheets", lambda sheet: sheet_io.write_job_ranks(sheet, job, http_ranks), sheets)
+                    pacing.human_pause("between_keywords")
+                    continue
+
+                log_setup.set_context(phase="search")
+                # The browser is only started once a keyword actually needs it.
+                # The same market (gl=, hl=) as the HTTP tier, not the IP's.
+                resilience.call("page_load", lambda driver: driver.get(search_targets.search_url(keyword, job.target)), browser)
+                driver = browser.get()  # a new browser if the old one had to be restarted
             
-            MAX_PAGES_TO_CHECK = 5
-            ranks_found_so_far = {url: "Not Found" for url in urls_to_find}
-            current_rank_offset = 0
-            captcha_detected = False
-
-            for page_num in range(1, MAX_PAGES_TO_CHECK + 1):
-                logging.info(f"--- Scraping Page {page_num} for '{keyword}' ---")
-                random_delay(2, 4)
-
-                # --- NEW: INTELLIGENT CAPTCHA HANDLING LOGIC ---
-                try:
-                    # Check if the captcha iframe is present on the page
-                    driver.find_element(By.CSS_SELECTOR, 'iframe[title="reCAPTCHA"]')
+                MAX_PAGES_TO_CHECK = 5
+                ranks_found_so_far = rank_records.KeywordRanks(urls_to_find)
+                current_rank_offset = 0
+                captcha_detected = False
+
+                for page_num in range(1, MAX_PAGES_TO_CHECK + 1):
+                    log_setup.set_context(phase="scrape", page=page_num)
+                    logging.info(f"--- Scraping Page {page_num} for '{keyword}' ---")
+                    # Start as soon as the results (or a CAPTCHA) are in the DOM. The one readiness wait per page.
+                    if not page_readiness.wait_for_selector(driver, selector_registry.readiness_selector(DEVICE), config.READINESS_TIMEOUT):
+                        logging.warning("No result blocks appeared on this page.")
+
+                    # --- NEW: INTELLIGENT CAPTCHA HANDLING LOGIC ---
+                    try:
+                        # Check if the captcha iframe is present on the page
+                        resilience.call("element", lambda: driver.find_element(By.CSS_SELECTOR, serp_selectors.CAPTCHA_IFRAME))
                     
-                    # If found, start the waiting process for manual intervention
-                    logging.warning(f"!!! CAPTCHA DETECTED for keyword '{keyword}'!!! Pausing for up to {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f} minutes for manual intervention.")
+                        # If found, start the waiting process for manual intervention
+                        logging.warning(f"!!! CAPTCHA DETECTED for keyword '{keyword}'!!! Pausing for up to {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f} minutes for manual intervention.")
+                        log_setup.set_context(phase="captcha")
+                        anomaly_capture.capture_driver_page(driver, anomaly_capture.CAPTCHA, keyword, DEVICE, page_num, job.target.key)
                     
-                    # Send an email notification asking for manual intervention
-                    email_subject = f"ACTION REQUIRED: Ranking Scraper Paused by CAPTCHA"
-                    email_body = f"""
-Hello,
-
-The automated Ranking Scraper has been paused by a Google security check (CAPTCHA) and requires your immediate attention.
-
-Keyword being processed: "{keyword}"
-
-Please find the browser window opened by the script and solve the CAPTCHA puzzle.
-
-The script will wait for up to {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f} minutes. If the CAPTCHA is not solved within this time, it will skip this keyword and continue.
-
-- Automated System
-"""
-                    send_error_email(email_subject, email_body)
-
-                    # Start the waiting loop
-                    start_time = time.time()
-                    captcha_solved = False
-                    while time.time() - start_time < config.CAPTCHA_WAIT_TIMEOUT:
-                        try:
-                            # Keep checking if the captcha is still there
-                            driver.find_element(By.CSS_SELECTOR, 'iframe[title="reCAPTCHA"]')
-                            logging.info(f"Captcha still present. Waiting for {config.CAPTCHA_CHECK_INTERVAL} more seconds...")
-                            time.sleep(config.CAPTCHA_CHECK_INTERVAL)
-                        except NoSuchElementException:
-                            # Captcha is gone! It was likely solved.
-                            logging.info(">>> CAPTCHA SOLVED! Resuming script. <<<")
-                            captcha_solved = True
-                            break # Exit the waiting loop
-
-                    # After the loop, check if it was solved or timed out
-                    if not captcha_solved:
-                        logging.error(f"CAPTCHA not solved within the {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f} minute time limit. Aborting keyword '{keyword}'.")
+                        # Send an email notification asking for manual intervention
+                        notifications.send_error_email(*notifications.captcha_paused_email(keyword))
+
+                        # Start the waiting loop
+                        start_time = time.time()
+                        captcha_solved = False
+                        next_reminder = start_time + 60
+                        while time.time() - start_time < config.CAPTCHA_WAIT_TIMEOUT:
+                            try:
+                                # Keep checking if the captcha is still there
+                                driver.find_element(By.CSS_SELECTOR, serp_selectors.CAPTCHA_IFRAME)
+                                # A reminder once a minute, not on every check.
+                                if time.time() >= next_reminder:
+                                    logging.info(f"Captcha still present. Waited {(time.time() - start_time) / 60:.0f} of {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f} minutes...")
+                                    next_reminder += 60
+                                time.sleep(config.CAPTCHA_CHECK_INTERVAL)
+                            except NoSuchElementException:
+                                # Captcha is gone! It was likely solved.
+                                logging.info(">>> CAPTCHA SOLVED! Resuming script. <<<")
+                                log_setup.set_context(phase="scrape")
+                                captcha_solved = True
+                                # Solving it loads the results page: wait for it before reading it.
+                                page_readiness.wait_for_selector(driver, selector_registry.readiness_selector(DEVICE), config.READINESS_TIMEOUT)
+                                break # Exit the waiting loop
+
+                        # After the loop, check if it was solved or timed out
+                        if not captcha_solved:
+                            logging.error(f"CAPTCHA not solved within the {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f} minute time limit. Aborting keyword '{keyword}'.")
                         
-                        # Send a timeout notification email
-                        email_subject_timeout = "Ranking Scraper Alert: CAPTCHA Timed Out"
-                        email_body_timeout = f"""
-Hello,
-
-This is an alert that the Ranking Scraper, which was paused for a CAPTCHA, has timed out.
-
-Keyword: "{keyword}"
-
-The CAPTCHA was not solved within the {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f}-minute time limit. The script has now aborted this keyword and will proceed with its run.
-
-No action is required. This is an informational alert.
-
-- Automated System
-"""
-                        send_error_email(email_subject_timeout, email_body_timeout)
+                            # Send a timeout notification email
+                            notifications.send_error_email(*notifications.captcha_timeout_email(keyword))
                         
-                        captcha_detected = True # Set flag to skip to the next keyword
-                        break # Break from the page loop for this keyword
+                            captcha_detected = True # Set flag to skip to the next keyword
+                            break # Break from the page loop for this keyword
                 
-                except NoSuchElementException:
-                    # No captcha found, proceed as normal
-                    pass
+                    except NoSuchElementException:
+                        # No captcha found, proceed as normal
+                        pass
                 
-                page_ranks = find_competitor_ranks(driver, urls_to_find, current_rank_offset)
+                    newly_found = find_competitor_ranks(driver, ranks_found_so_far, current_rank_offset, keyword, page_num)
 
-                for url, rank in page_ranks.items():
-                    if rank != "Not Found" and ranks_found_so_far[url] == "Not Found":
-                        ranks_found_so_far[url] = rank
+                    for url, rank in newly_found.items():
                         logging.info(f"SUCCESS: Found '{url}' at rank {rank} on page {page_num}")
 
-                if all(rank != "Not Found" for rank in ranks_found_so_far.values()):
-                    logging.info("All competitors found. Moving to next keyword.")
-                    break
+                    pacing.human_pause("after_scrape")
+
+                    if ranks_found_so_far.all_found():
+                        logging.info("All competitors found. Moving to next keyword.")
+                        break
 
-                try:
-                    next_button = driver.find_element(By.CSS_SELECTOR, serp_selectors.NEXT_PAGE_BUTTON)
+                    next_button = resilience.call("element", lambda: selector_registry.find_next_button(driver, DEVICE))
+                    if next_button is None:
+                        logging.info("No 'Next' button found. Reached the end of results.")
+                        break
                     logging.info("Moving to next page...")
-                    random_delay(1, 2)
+                    pacing.human_pause("before_next_page")
+                    page_readiness.mark_document(driver)
                     next_button.click()
                     current_rank_offset += 10 
-                except NoSuchElementException:
-                    logging.info("No 'Next' button found. Reached the end of results.")
-                    break
             
-            if not captcha_detected:
-                logging.info(f"Finished scraping for '{keyword}'. Final ranks: {ranks_found_so_far}")
-                for name, data in competitors.items():
-                    if data['url']:
-                        rank_to_write = ranks_found_so_far.get(data['url'], "Not Found")
-                        worksheet.update_cell(original_row_index, data['col'], str(rank_to_write))
+                if not captcha_detected:
+                    logging.info(f"Finished scraping for '{keyword}'. Final ranks: {ranks_found_so_far}")
+                    moves = anomaly_capture.rank_moves(previous_ranks, ranks_found_so_far)
+                    if moves:
+                        anomaly_capture.capture_driver_page(driver, anomaly_capture.RANK_MOVE, keyword, DEVICE, page_num, job.target.key, moves)
+                    replay.event("ranks", keyword=keyword, device=DEVICE, target=job.target.key, tier="browser", ranks=ranks_found_so_far.to_dict())
+                    resilience.call("sheets", lambda sheet: sheet_io.write_job_ranks(sheet, job, ranks_found_so_far), sheets)
             
-            time.sleep(random.uniform(5, 10))
+                pacing.human_pause("between_keywords")
+            except (selector_registry.SelectorDriftError, resilience.CircuitOpenError):
+                raise
+            except Exception as e:
+                # One keyword that still fails after its retries must not end the run.
+                logging.error(f"Skipping keyword '{keyword}' after an error: {e}", exc_info=True)
+                if resilience.is_dead_session(e) and browser.component is not None:
+                    browser.trip(e)
+
+        # --- RANK ANALYTICS: compare with the previous run, one summary email ---
+        log_setup.set_context(keyword=None, phase="analytics")
+        rank_analytics.run_stage(sheets.get(), DEVICE)
             
+    except selector_registry.SelectorDriftError as e:
+        # The drift alert email has already been sent. Nothing more to salvage in this run.
+        logging.critical(f"Stopping the run: {e}")
+
     except Exception as e:
         logging.critical(f"A critical, unhandled error occurred: {e}", exc_info=True)
         
         # --- Human-Readable Crash Email with Technical Details ---
-        email_subject = "Ranking Scraper Alert: Script CRASHED"
-        technical_details = traceback.format_exc()
-        email_body = f"""
-Hello,
-
-The automated Ranking Scraper has stopped due to an unexpected technical error. The script did not complete its run.
-
-The technical team has been notified with the details below.
-
-No action is required from you at this time.
-
-- Automated System
-
-----------------------------------------------------
---- TECHNICAL DETAILS FOR DEBUGGING ---
-----------------------------------------------------
-
-{technical_details}
-"""
-        send_error_email(email_subject, email_body)
+        notifications.send_error_email(*notifications.crash_email(traceback.format_exc()))
         
     finally:
-        if driver:
+        http_fetch.close()
+        if browser.component is not None:
             logging.info("Closing WebDriver.")
-            driver.quit()
+            browser.close()
         logging.info("--- Ranking Automation Script Finished ---")
\ No newline at end of file
@@ -0,0 +1,157 @@
+# log_setup.py
+# Logging for every script: non-blocking, structured and kept across runs.
+#
+# NON-BLOCKING: the scraping thread (or event loop) only puts records on an
+# in-memory queue (QueueHandler). A QueueListener thread does the file and
+# console writes, so a slow disk or console never stalls the browser loop.
+#
+# STRUCTURED: besides the usual human-readable <name>.log, each record goes to
+# <name>.jsonl as one JSON object with the run id, host, pid and the current
+# context: device, worker, keyword, target, phase ("http", "search", "scrape",
+# "captcha", ...), page, and `elapsed` = seconds since the keyword started. The
+# "Finished scraping" line's `elapsed` is therefore the keyword's duration.
+# Set the context with set_context(); it is per thread and per asyncio task, so
+# concurrent workers' records stay attributable.
+#
+# KEPT ACROSS RUNS: the files are appended to (not overwritten) and roll over at
+# config.LOG_MAX_MB and at the first record of each new day, keeping
+# config.LOG_BACKUP_COUNT old files (ranking_automation.log.1, .2, ...).
+
+import atexit
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import socket
+import time
+
+import config
+
+CONSOLE_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+CONTEXT_FIELDS = ("device", "worker", "keyword", "target", "phase", "page")
+
+_context = contextvars.ContextVar("log_context", default={})
+_listener = None
+_run = {}
+
+
+# --- 1. CONTEXT ---
+def set_context(**fields):
+    # Adds fields to the current thread's/task's log context. A new keyword
+    # resets the phase, the page and the elapsed-time clock; None removes a field.
+    context = dict(_context.get())
+    if "keyword" in fields:
+        for field in ("phase", "page", "keyword_started"):
+            context.pop(field, None)
+        if fields["keyword"] is not None:
+            context["keyword_started"] = time.monotonic()
+    context.update(fields)
+    _context.set({k: v for k, v in context.items() if v is not None})
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    # Runs in the thread (or task) that logs, before the record is queued, so the
+    # context snapshot is that thread's. Also renders the message, keeping the
+    # traceback apart so the JSON record can hold it in its own field.
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        context = _context.get()
+        for field in CONTEXT_FIELDS:
+            setattr(record, field, getattr(record, field, context.get(field)))
+        started = context.get("keyword_started")
+        record.elapsed = round(time.monotonic() - started, 2) if started is not None else None
+        record.run_id = _run.get("run_id")
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+# --- 2. FORMAT & FILES ---
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "run_id": getattr(record, "run_id", None),
+            "host": _run.get("host"),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        for field in CONTEXT_FIELDS + ("elapsed",):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RotatingLogFile(logging.handlers.RotatingFileHandler):
+    # Size rotation (RotatingFileHandler) plus a rollover on the first record of a new day.
+
+    def __init__(self, filename, max_bytes, backup_count, daily=True):
+        super().__init__(filename, mode="a", maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.daily = daily
+        self._day = datetime.date.fromtimestamp(os.path.getmtime(filename)) if os.path.exists(filename) else datetime.date.today()
+
+    def shouldRollover(self, record):
+        if self.daily and datetime.date.fromtimestamp(record.created) != self._day and os.path.exists(self.baseFilename):
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self._day = datetime.date.today()
+
+
+# --- 3. SETUP ---
+def setup_logging(name, device=None, per_process=False):
+    # Replaces the scripts' logging.basicConfig(). `name` is the log file name
+    # without extension; per_process adds the pid, for several processes of the
+    # same kind on one machine (each file must have a single writer to rotate).
+    # Returns the run id. Calling it again in the same process does nothing.
+    global _listener
+    if _listener is not None:
+        return _run["run_id"]
+    if per_process:
+        name = f"{name}-{os.getpid()}"
+    _run["host"] = socket.gethostname()
+    _run["run_id"] = f"{datetime.datetime.now():%Y-%m-%dT%H-%M-%S}-{_run['host']}-{os.getpid()}"
+    if device:
+        set_context(device=device)
+
+    os.makedirs(config.LOG_DIR, exist_ok=True)
+    max_bytes = int(config.LOG_MAX_MB * 1024 * 1024)
+    text_file = RotatingLogFile(os.path.join(config.LOG_DIR, f"{name}.log"), max_bytes, config.LOG_BACKUP_COUNT, config.LOG_ROTATE_DAILY)
+    text_file.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+    handlers = [text_file, console]
+    if config.LOG_JSON:
+        json_file = RotatingLogFile(os.path.join(config.LOG_DIR, f"{name}.jsonl"), max_bytes, config.LOG_BACKUP_COUNT, config.LOG_ROTATE_DAILY)
+        json_file.setFormatter(JsonFormatter())
+        handlers.append(json_file)
+
+    # Unbounded, so put() never waits on the writer thread.
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_ContextQueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Drains the queue and closes the files on exit, crash included.
+    atexit.register(_listener.stop)
+    logging.info(f"Run id {_run['run_id']}; logging to '{text_file.baseFilename}'.")
+    return _run["run_id"]
@@ -0,0 +1,120 @@
+# notifications.py
+# Email alerts and their templates, shared by every entry point.
+
+import logging
+import smtplib
+from email.mime.text import MIMEText
+
+import config
+
+
+def send_error_email(subject, body):
+    if not config.ENABLE_EMAIL_NOTIFICATIONS:
+        return
+    recipients = config.RECIPIENT_EMAIL if isinstance(config.RECIPIENT_EMAIL, list) else [config.RECIPIENT_EMAIL]
+    logging.info(f"Preparing to send error email to: {', '.join(recipients)}")
+    try:
+        msg = MIMEText(body, 'plain')
+        msg['Subject'] = subject
+        msg['From'] = config.SENDER_EMAIL
+        msg['To'] = ", ".join(recipients)
+        with smtplib.SMTP(config.SMTP_SERVER, config.SMTP_PORT) as server:
+            server.starttls()
+            server.login(config.SENDER_EMAIL, config.SENDER_PASSWORD)
+            server.sendmail(config.SENDER_EMAIL, recipients, msg.as_string())
+            logging.info("Error email sent successfully.")
+    except Exception as e:
+        logging.error(f"CRITICAL: FAILED TO SEND ERROR EMAIL. Error: {e}")
+
+
+def captcha_paused_email(keyword):
+    subject = "ACTION REQUIRED: Ranking Scraper Paused by CAPTCHA"
+    body = f"""
+Hello,
+
+The automated Ranking Scraper has been paused by a Google security check (CAPTCHA) and requires your immediate attention.
+
+Keyword being processed: "{keyword}"
+
+Please find the browser window opened by the script and solve the CAPTCHA puzzle.
+
+The script will wait for up to {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f} minutes. If the CAPTCHA is not solved within this time, it will skip this keyword and continue.
+
+- Automated System
+"""
+    return subject, body
+
+
+def captcha_timeout_email(keyword):
+    subject = "Ranking Scraper Alert: CAPTCHA Timed Out"
+    body = f"""
+Hello,
+
+This is an alert that the Ranking Scraper, which was paused for a CAPTCHA, has timed out.
+
+Keyword: "{keyword}"
+
+The CAPTCHA was not solved within the {config.CAPTCHA_WAIT_TIMEOUT / 60:.0f}-minute time limit. The script has now aborted this keyword and will proceed with its run.
+
+No action is required. This is an informational alert.
+
+- Automated System
+"""
+    return subject, body
+
+
+def crash_email(technical_details):
+    subject = "Ranking Scraper Alert: Script CRASHED"
+    body = f"""
+Hello,
+
+The automated Ranking Scraper has stopped due to an unexpected technical error. The script did not complete its run.
+
+The technical team has been notified with the details below.
+
+No action is required from you at this time.
+
+- Automated System
+
+----------------------------------------------------
+--- TECHNICAL DETAILS FOR DEBUGGING ---
+----------------------------------------------------
+
+{technical_details}
+"""
+    return subject, body
+
+
+def selector_drift_email(device, versions, keyword, page_url, feature_summary=""):
+    subject = "Ranking Scraper Alert: Google SERP markup changed (run stopped)"
+    body = f"""
+Hello,
+
+The Ranking Scraper stopped because several keywords in a row returned ZERO organic results on the {device} SERP.
+
+This almost always means Google changed its page markup and the CSS selectors no longer match.
+
+Selector sets tried: {versions}
+Last keyword: "{keyword}"
+Page URL: {page_url}
+What was detected on the page: {feature_summary}
+
+To fix it, add a new selector set at the top of SELECTOR_SETS["{device}"] in serp_selectors.py and rerun.
+
+- Automated System
+"""
+    return subject, body
+
+
+def rank_change_email(segment, mover_count, summary):
+    subject = f"Ranking Report: {mover_count} ranking(s) moved significantly ({segment})"
+    body = f"""
+Hello,
+
+The latest ranking run finished. These rankings moved by {config.RANK_CHANGE_ALERT_THRESHOLD} or more positions since the previous run.
+
+{summary}
+
+- Automated System
+"""
+    return subject, body
@@ -0,0 +1,212 @@
+# offline_dom.py
+# A tiny, dependency-free HTML tree with just enough CSS selector support to run
+# serp_selectors.py against saved or HTTP-fetched pages (no browser needed).
+#
+# Supported selectors: selector lists (a, b), descendant combinators (a b), and
+# compound selectors made of a tag, #id, .class, [attr], [attr="v"], [attr*="v"],
+# [attr^="v"] and [attr$="v"]. That covers everything in serp_selectors.py.
+
+import re
+from html.parser import HTMLParser
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+    "param", "source", "track", "wbr",
+}
+# Their content is not markup, and never holds results.
+SKIP_CONTENT_ELEMENTS = {"script", "style", "noscript", "template"}
+
+
+class Node:
+    __slots__ = ("tag", "attrs", "children", "parent", "text_parts")
+
+    def __init__(self, tag, attrs=None, parent=None):
+        self.tag = tag
+        self.attrs = attrs or {}
+        self.children = []
+        self.parent = parent
+        self.text_parts = []
+
+    @property
+    def classes(self):
+        return self.attrs.get("class", "").split()
+
+    def get(self, name, default=None):
+        return self.attrs.get(name, default)
+
+    def text(self):
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            parts.extend(node.text_parts)
+            stack.extend(reversed(node.children))
+        return " ".join(" ".join(parts).split())
+
+    def iter(self):
+        # All descendants, in document order.
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def contains(self, other):
+        while other is not None:
+            if other is self:
+                return True
+            other = other.parent
+        return False
+
+    def select(self, selector):
+        compiled = compile_selector(selector)
+        return [node for node in self.iter() if _matches_any(node, compiled)]
+
+    def select_one(self, selector):
+        compiled = compile_selector(selector)
+        for node in self.iter():
+            if _matches_any(node, compiled):
+                return node
+        return None
+
+    def matches(self, selector):
+        return _matches_any(self, compile_selector(selector))
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node("#document")
+        self.current = self.root
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self.skip_depth:
+            if tag in SKIP_CONTENT_ELEMENTS:
+                self.skip_depth += 1
+            return
+        node = Node(tag, {k: (v or "") for k, v in attrs}, self.current)
+        self.current.children.append(node)
+        if tag in SKIP_CONTENT_ELEMENTS:
+            self.skip_depth = 1
+        elif tag not in VOID_ELEMENTS:
+            self.current = node
+
+    def handle_startendtag(self, tag, attrs):
+        if not self.skip_depth:
+            self.current.children.append(Node(tag, {k: (v or "") for k, v in attrs}, self.current))
+
+    def handle_endtag(self, tag):
+        if self.skip_depth:
+            if tag in SKIP_CONTENT_ELEMENTS:
+                self.skip_depth -= 1
+            return
+        node = self.current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:  # ignore stray end tags
+            self.current = node.parent
+
+    def handle_data(self, data):
+        if not self.skip_depth and data.strip():
+            self.current.text_parts.append(data)
+
+
+def parse(html):
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+# --- SELECTOR ENGINE ---
+_ATTR_RE = re.compile(r"""\[\s*([\w:-]+)\s*(?:([*^$]?=)\s*(?:"([^"]*)"|'([^']*)'|([^\]\s]*))\s*)?\]""")
+_SIMPLE_RE = re.compile(r"([#.]?)([\w-]+)")
+_cache = {}
+
+
+def _compile_compound(text):
+    attrs = []
+    for m in _ATTR_RE.finditer(text):
+        value = next((v for v in m.group(3, 4, 5) if v is not None), None)
+        attrs.append((m.group(1), m.group(2), value))
+    rest = _ATTR_RE.sub(" ", text).replace(" ", "")
+    tag, node_id, classes = None, None, []
+    for prefix, name in _SIMPLE_RE.findall(rest):
+        if prefix == "#":
+            node_id = name
+        elif prefix == ".":
+            classes.append(name)
+        else:
+            tag = name.lower()
+    return tag, node_id, classes, attrs
+
+
+def _split_outside_brackets(text, separator):
+    parts, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch == "[":
+            depth += 1
+        elif ch == "]":
+            depth -= 1
+        elif depth == 0 and (ch == separator or (separator == " " and ch.isspace())):
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def compile_selector(selector):
+    if selector not in _cache:
+        _cache[selector] = [
+            [_compile_compound(compound) for compound in _split_outside_brackets(group, " ")]
+            for group in _split_outside_brackets(selector, ",")
+        ]
+    return _cache[selector]
+
+
+def _matches_compound(node, compound):
+    tag, node_id, classes, attrs = compound
+    if tag and node.tag != tag:
+        return False
+    if node_id and node.attrs.get("id") != node_id:
+        return False
+    if classes:
+        node_classes = node.classes
+        if any(c not in node_classes for c in classes):
+            return False
+    for name, op, value in attrs:
+        actual = node.attrs.get(name)
+        if actual is None:
+            return False
+        if op == "=" and actual != value:
+            return False
+        if op == "*=" and value not in actual:
+            return False
+        if op == "^=" and not actual.startswith(value):
+            return False
+        if op == "$=" and not actual.endswith(value):
+            return False
+    return True
+
+
+def _matches_chain(node, chain):
+    if not _matches_compound(node, chain[-1]):
+        return False
+    ancestor = node.parent
+    for compound in reversed(chain[:-1]):
+        while ancestor is not None and not _matches_compound(ancestor, compound):
+            ancestor = ancestor.parent
+        if ancestor is None:
+            return False
+        ancestor = ancestor.parent
+    return True
+
+
+def _matches_any(node, compiled):
+    return any(_matches_chain(node, chain) for chain in compiled)
@@ -0,0 +1,36 @@
+# pacing.py
+# Human-like pauses, kept separate from page-readiness waits (page_readiness.py).
+# Readiness decides WHEN we can read the page; pacing decides how "human" the
+# session looks. Both are tuned independently in config.py.
+
+import asyncio
+import random
+import time
+
+import config
+import replay
+
+
+def pause_length(step):
+    if not config.ENABLE_HUMAN_PACING:
+        return 0.0
+    min_seconds, max_seconds = config.HUMAN_PACING.get(step, (0, 0))
+    return random.uniform(min_seconds, max_seconds)
+
+
+def human_pause(step):
+    # Sleeps for a random time within the configured range for `step`.
+    delay = pause_length(step)
+    replay.event("pause", step=step, seconds=round(delay, 3))
+    if delay > 0:
+        time.sleep(delay)
+    return delay
+
+
+async def human_pause_async(step):
+    # Same as human_pause(), but only suspends the calling coroutine.
+    delay = pause_length(step)
+    replay.event("pause", step=step, seconds=round(delay, 3))
+    if delay > 0:
+        await asyncio.sleep(delay)
+    return delay
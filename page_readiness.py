@@ -0,0 +1,94 @@
+# page_readiness.py
+# Event-driven page readiness for the Selenium scrapers.
+#
+# The old approach was WebDriverWait(driver, 5).until(...), which re-asks the
+# browser over HTTP every 500 ms. Here the browser tells US when it is ready:
+# the wait is ONE asynchronous script that installs a MutationObserver and
+# returns the moment a matching element is inserted into the DOM, or shortly
+# after the load event when the page has none. No CDP event log is kept:
+# chromedriver would buffer every event of the run for nothing.
+#
+# Human-like pacing is NOT done here. See pacing.py.
+
+import time
+
+from selenium.common.exceptions import JavascriptException, TimeoutException, WebDriverException
+
+# Attribute we stamp on a document before leaving it, so we never mistake the
+# previous page's results for the next page's.
+STALE_MARKER = "data-rank-tracker-stale"
+
+# After the load event, how long (ms) we keep observing for results before
+# deciding the page simply has none. Google renders results server-side, so
+# this can be short.
+EMPTY_PAGE_GRACE_MS = 750
+
+# Resolves with true as soon as `selector` exists in a fresh document, or false
+# when the page finished loading (plus a short grace) without it.
+_WAIT_FOR_SELECTOR_JS = """
+const selector = arguments[0];
+const graceMs = arguments[1];
+const staleMarker = arguments[2];
+const done = arguments[arguments.length - 1];
+const root = document.documentElement;
+if (root && root.hasAttribute(staleMarker)) {
+    // Still on the page we are navigating away from. The pending navigation
+    // will unload this document and interrupt this script.
+    return;
+}
+let finished = false;
+const finish = (found) => {
+    if (finished) return;
+    finished = true;
+    observer.disconnect();
+    done(found);
+};
+const observer = new MutationObserver(() => {
+    if (document.querySelector(selector)) finish(true);
+});
+if (document.querySelector(selector)) { done(true); return; }
+observer.observe(document, {childList: true, subtree: true});
+const onLoaded = () => setTimeout(() => finish(!!document.querySelector(selector)), graceMs);
+if (document.readyState === "complete") onLoaded();
+else window.addEventListener("load", onLoaded, {once: true});
+"""
+
+
+# --- 1. BROWSER SETUP ---
+def configure_options(options):
+    # 'eager' makes driver.get() return at DOMContentLoaded instead of waiting for
+    # every image and tracker; readiness is then decided by wait_for_selector().
+    options.page_load_strategy = "eager"
+    return options
+
+
+# --- 2. READINESS WAITS ---
+def mark_document(driver):
+    # Call this right before an action that navigates away (e.g. clicking "Next").
+    try:
+        driver.execute_script(f"document.documentElement.setAttribute('{STALE_MARKER}', '1');")
+    except WebDriverException:
+        pass
+
+
+def wait_for_selector(driver, selector, timeout=5):
+    # Returns True the moment `selector` is present in the current (fresh)
+    # document, False if the page loaded without it or `timeout` passed.
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        driver.set_script_timeout(remaining)
+        try:
+            found = driver.execute_async_script(_WAIT_FOR_SELECTOR_JS, selector, EMPTY_PAGE_GRACE_MS, STALE_MARKER)
+            return bool(found)
+        except TimeoutException:
+            return False
+        except JavascriptException:
+            # The document was unloaded mid-wait (navigation committed). Observe the new one.
+            continue
+        except WebDriverException as e:
+            if "unload" in str(e).lower() or "navigat" in str(e).lower():
+                continue
+            raise
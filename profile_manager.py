@@ -0,0 +1,259 @@
+# profile_manager.py
+# Golden profile snapshots and cheap per-worker clones.
+#
+# Chrome refuses to open the same --user-data-dir twice, so every worker needs
+# its own profile directory. Instead of logging in again for each one, we keep a
+# "golden" snapshot of the logged-in master profile and clone it per worker:
+#   * "minimal" copies only what a logged-in Google session needs (cookies, the
+#     Local State file holding the cookie encryption key, preferences) - a few
+#     MB, done in milliseconds;
+#   * "full" copies the whole snapshot, using copy-on-write reflinks where the
+#     filesystem supports them (Btrfs, XFS, APFS via clonefile) and a plain copy
+#     elsewhere.
+# Hardlinks are deliberately NOT used: Chrome rewrites its SQLite files in place,
+# so a hardlinked clone would write straight through into the golden snapshot.
+#
+# Layout under config.PROFILE_STORE_PATH:
+#   golden/<timestamp>/   snapshots, newest is named in golden/CURRENT
+#   clones/<name>/        per-worker clones, each with an owner.json
+#
+# Usage:
+#   python profile_manager.py snapshot [SOURCE_DIR]   # promote a profile to golden
+#   python profile_manager.py gc                      # remove stale clones
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+import config
+
+GOLDEN_DIR = os.path.join(config.PROFILE_STORE_PATH, "golden")
+CLONES_DIR = os.path.join(config.PROFILE_STORE_PATH, "clones")
+CURRENT_POINTER = os.path.join(GOLDEN_DIR, "CURRENT")
+OWNER_FILE = "owner.json"
+
+# Everything a logged-in session needs, relative to the user-data-dir.
+MINIMAL_PROFILE_ENTRIES = [
+    "Local State",
+    os.path.join("Default", "Cookies"),
+    os.path.join("Default", "Network", "Cookies"),
+    os.path.join("Default", "Preferences"),
+    os.path.join("Default", "Secure Preferences"),
+    os.path.join("Default", "Login Data"),
+    os.path.join("Default", "Web Data"),
+    os.path.join("Default", "Local Storage"),
+]
+
+# Never worth copying into a snapshot: caches and crash dumps Chrome rebuilds itself.
+SNAPSHOT_IGNORE = shutil.ignore_patterns(
+    "Cache", "Code Cache", "GPUCache", "ShaderCache", "GrShaderCache", "GraphiteDawnCache",
+    "DawnCache", "CacheStorage", "Crashpad", "BrowserMetrics*", "Singleton*", "*.tmp", "LOCK",
+)
+
+_active_clones = []
+atexit.register(lambda: release_all())
+
+
+# --- 1. LOW-LEVEL COPY HELPERS ---
+def _reflink_or_copy(src, dst):
+    if sys.platform.startswith("linux"):
+        try:
+            import fcntl
+            FICLONE = 0x40049409
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            shutil.copystat(src, dst)
+            return dst
+        except (OSError, ImportError):
+            pass
+    elif sys.platform == "darwin":
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) == 0:
+                return dst
+        except (OSError, AttributeError):
+            pass
+    return shutil.copy2(src, dst)
+
+
+def _copy_entry(src, dst):
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, copy_function=_reflink_or_copy, ignore=SNAPSHOT_IGNORE, dirs_exist_ok=True)
+    elif os.path.exists(src):
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        _reflink_or_copy(src, dst)
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        # os.kill() on Windows terminates the process, so ask the kernel instead.
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        handle = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return exit_code.value == STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+# --- 2. GOLDEN SNAPSHOTS ---
+def current_snapshot():
+    try:
+        with open(CURRENT_POINTER) as f:
+            path = os.path.join(GOLDEN_DIR, f.read().strip())
+    except FileNotFoundError:
+        return None
+    return path if os.path.isdir(path) else None
+
+
+def promote_snapshot(source_dir):
+    # Copies a freshly logged-in profile into a new golden snapshot and makes it
+    # current. The previous snapshot stays usable until the switch is done.
+    if not os.path.isdir(source_dir):
+        raise FileNotFoundError(f"Profile directory not found: {source_dir}")
+    name = time.strftime("%Y%m%d-%H%M%S")
+    target = os.path.join(GOLDEN_DIR, name)
+    logging.info(f"Creating golden profile snapshot '{name}' from: {source_dir}")
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    staging = target + ".partial"
+    shutil.copytree(source_dir, staging, copy_function=_reflink_or_copy, ignore=SNAPSHOT_IGNORE)
+    os.replace(staging, target)
+
+    pointer_tmp = CURRENT_POINTER + ".tmp"
+    with open(pointer_tmp, "w") as f:
+        f.write(name)
+    os.replace(pointer_tmp, CURRENT_POINTER)
+    prune_snapshots()
+    logging.info(f"Golden profile snapshot '{name}' is now current.")
+    return target
+
+
+def prune_snapshots(keep=None):
+    keep = keep or config.PROFILE_SNAPSHOTS_TO_KEEP
+    if not os.path.isdir(GOLDEN_DIR):
+        return
+    snapshots = sorted(d for d in os.listdir(GOLDEN_DIR) if os.path.isdir(os.path.join(GOLDEN_DIR, d)))
+    current = os.path.basename(current_snapshot() or "")
+    for name in snapshots[:-keep]:
+        if name != current:
+            logging.info(f"Removing old golden snapshot: {name}")
+            shutil.rmtree(os.path.join(GOLDEN_DIR, name), ignore_errors=True)
+
+
+# --- 3. PER-WORKER CLONES ---
+def clone_profile(worker_name, mode=None):
+    mode = mode or config.PROFILE_CLONE_MODE
+    snapshot = current_snapshot()
+    if snapshot is None:
+        raise FileNotFoundError("No golden profile snapshot yet. Run create_master_profile.py or 'python profile_manager.py snapshot' first.")
+
+    started = time.perf_counter()
+    clone_dir = os.path.join(CLONES_DIR, f"{worker_name}-{os.getpid()}-{int(time.time() * 1000)}")
+    os.makedirs(clone_dir)
+    if mode == "minimal":
+        for entry in MINIMAL_PROFILE_ENTRIES:
+            _copy_entry(os.path.join(snapshot, entry), os.path.join(clone_dir, entry))
+    elif mode == "full":
+        _copy_entry(snapshot, clone_dir)
+    else:
+        raise ValueError(f"Unknown profile clone mode '{mode}'. Expected 'minimal' or 'full'.")
+
+    with open(os.path.join(clone_dir, OWNER_FILE), "w") as f:
+        json.dump({"pid": os.getpid(), "created": time.time(), "snapshot": os.path.basename(snapshot)}, f)
+
+    _active_clones.append(clone_dir)
+    logging.info(f"Cloned golden profile ({mode}) for '{worker_name}' in {(time.perf_counter() - started) * 1000:.0f} ms: {clone_dir}")
+    return clone_dir
+
+
+def release_clone(clone_dir):
+    shutil.rmtree(clone_dir, ignore_errors=True)
+    if clone_dir in _active_clones:
+        _active_clones.remove(clone_dir)
+
+
+def release_all():
+    for clone_dir in list(_active_clones):
+        release_clone(clone_dir)
+
+
+def gc_clones(max_age_hours=None):
+    # Removes clones whose owning process is gone or that are older than max_age_hours.
+    max_age_hours = max_age_hours or config.PROFILE_CLONE_MAX_AGE_HOURS
+    if not os.path.isdir(CLONES_DIR):
+        return 0
+    removed = 0
+    now = time.time()
+    for name in os.listdir(CLONES_DIR):
+        clone_dir = os.path.join(CLONES_DIR, name)
+        try:
+            with open(os.path.join(clone_dir, OWNER_FILE)) as f:
+                owner = json.load(f)
+            stale = not _pid_alive(owner["pid"]) or now - owner["created"] > max_age_hours * 3600
+        except (OSError, ValueError, KeyError):
+            # Half-written clone: judge by directory age only.
+            stale = now - os.path.getmtime(clone_dir) > max_age_hours * 3600
+        if stale:
+            shutil.rmtree(clone_dir, ignore_errors=True)
+            removed += 1
+    if removed:
+        logging.info(f"Garbage-collected {removed} stale profile clone(s).")
+    return removed
+
+
+def export_cookies(driver, path=None):
+    # Saves the browser's Google cookies for the HTTP fetch tier (http_fetch.py).
+    path = path or config.HTTP_COOKIES_PATH
+    try:
+        cookies = driver.get_cookies()
+    except Exception as e:
+        logging.warning(f"Could not export browser cookies: {e}")
+        return 0
+    # Session cookies: readable by this user only (os.open's mode, so never briefly world-readable).
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as f:
+        json.dump(cookies, f)
+    os.replace(tmp_path, path)
+    logging.info(f"Exported {len(cookies)} cookies for the HTTP fetch tier.")
+    return len(cookies)
+
+
+def profile_dir_for_run(worker_name):
+    # What the scripts pass to --user-data-dir.
+    if not config.USE_PROFILE_CLONES:
+        return config.CHROME_PROFILE_PATH
+    gc_clones()
+    return clone_profile(worker_name)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Manage golden Chrome profile snapshots and worker clones.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    snapshot_parser = sub.add_parser("snapshot", help="Promote a logged-in profile to the golden snapshot.")
+    snapshot_parser.add_argument("source", nargs="?", default=config.CHROME_PROFILE_PATH)
+    sub.add_parser("gc", help="Remove clones of dead processes or older than the max age.")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        promote_snapshot(args.source)
+    elif args.command == "gc":
+        gc_clones()
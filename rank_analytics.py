@@ -0,0 +1,189 @@
+# rank_analytics.py
+# Post-run analytics: which keywords moved, how volatile each ranking is, and
+# each competitor's share of the top 10, computed over typed arrays.
+#
+# Ranks are loaded as int32, with "Not Found" stored as serp_parser.NOT_FOUND_RANK.
+# For movement and volatility, a not-found URL counts as one position past the
+# last page checked (MAX_PAGES_TO_CHECK * 10 + 1). Dropping out of the results
+# then shows up as a large move, and is not a division by a string.
+#
+# After every run the ranks are appended to config.RANK_HISTORY_PATH, one
+# snapshot per run and segment (device or matrix target). The next run
+# compares against the latest snapshot. At most ONE summary email is sent per
+# run and segment, and only when something moved by RANK_CHANGE_ALERT_THRESHOLD
+# or more.
+#
+# Usage:
+#   python rank_analytics.py                      # analyze the sheet as it is now (desktop segment)
+#   python rank_analytics.py --segment mobile --worksheet "Ranking - in-en-mobile" --dry-run
+
+import argparse
+import datetime
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import config
+import notifications
+import serp_parser
+
+HISTORY_COLUMNS = ["run_id", "run_date", "segment", "keyword", "competitor", "rank"]
+# An empty rank cell: the keyword was never scraped. Such rows are left out.
+BLANK_RANK = -2
+
+
+# --- 1. TYPED RANKS ---
+def not_found_floor():
+    return config.MAX_PAGES_TO_CHECK * 10 + 1
+
+
+def to_rank_array(values):
+    # Sheet cells -> int32 ranks. "Not Found" -> NOT_FOUND_RANK, blanks -> BLANK_RANK.
+    text = pd.Series(values).astype(str).str.strip()
+    ranks = pd.to_numeric(text, errors="coerce")
+    ranks[text == serp_parser.NOT_FOUND] = serp_parser.NOT_FOUND_RANK
+    return ranks.fillna(BLANK_RANK).astype("int32").to_numpy()
+
+
+def effective_ranks(ranks):
+    # For arithmetic: not found = just past the last page checked.
+    ranks = np.asarray(ranks, dtype="int32")
+    return np.where(ranks == serp_parser.NOT_FOUND_RANK, not_found_floor(), ranks).astype("int32")
+
+
+def current_ranks(df):
+    # Long table (keyword, competitor, rank) from a get_data_from_sheet() frame.
+    frames = []
+    for name, spec in config.COMPETITORS.items():
+        column = df.columns[spec['col'] - 1]
+        frames.append(pd.DataFrame({
+            "keyword": df['Keyword'].to_numpy(),
+            "competitor": name,
+            "rank": to_rank_array(df[column].to_numpy()),
+        }))
+    ranks = pd.concat(frames, ignore_index=True)
+    ranks = ranks[ranks["rank"] != BLANK_RANK]
+    # A keyword listed twice keeps its first row, like the sheet reader does.
+    return ranks.drop_duplicates(["keyword", "competitor"]).reset_index(drop=True)
+
+
+# --- 2. HISTORY ---
+def load_history(segment=None):
+    if not os.path.exists(config.RANK_HISTORY_PATH):
+        return pd.DataFrame({c: pd.Series(dtype="int32" if c == "rank" else "object") for c in HISTORY_COLUMNS})
+    history = pd.read_csv(config.RANK_HISTORY_PATH, dtype={"run_id": str, "run_date": str, "segment": str, "keyword": str, "competitor": str, "rank": "int32"})
+    return history if segment is None else history[history["segment"] == segment]
+
+
+def append_history(ranks, segment, run_id):
+    snapshot = ranks.assign(run_id=run_id, run_date=run_id[:10], segment=segment)[HISTORY_COLUMNS]
+    write_header = not os.path.exists(config.RANK_HISTORY_PATH)
+    snapshot.to_csv(config.RANK_HISTORY_PATH, mode="a", header=write_header, index=False)
+
+
+# --- 3. METRICS ---
+def rank_changes(current, previous):
+    # One row per (keyword, competitor) present in both runs. change > 0 = moved UP.
+    merged = current.merge(previous[["keyword", "competitor", "rank"]], on=["keyword", "competitor"], suffixes=("", "_previous"))
+    merged["change"] = effective_ranks(merged["rank_previous"]) - effective_ranks(merged["rank"])
+    return merged
+
+
+def volatility(history, window):
+    # Standard deviation of each ranking over the last `window` runs.
+    run_ids = np.sort(history["run_id"].unique())[-window:]
+    recent = history[history["run_id"].isin(run_ids)].copy()
+    recent["effective_rank"] = effective_ranks(recent["rank"])
+    return recent.groupby(["keyword", "competitor"])["effective_rank"].std(ddof=0).rename("volatility").reset_index()
+
+
+def top10_share(ranks):
+    # Fraction of keywords where each competitor ranks 1-10.
+    in_top10 = (ranks["rank"] >= 1) & (ranks["rank"] <= 10)
+    return in_top10.groupby(ranks["competitor"]).mean()
+
+
+def new_run_id():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def analyze(current, history, run_id, threshold=None, window=None):
+    threshold = config.RANK_CHANGE_ALERT_THRESHOLD if threshold is None else threshold
+    window = window or config.RANK_VOLATILITY_WINDOW
+    report = {"movers": pd.DataFrame(), "volatility": pd.DataFrame(), "top10_share": top10_share(current), "previous_run": None}
+    if history.empty:
+        return report
+    previous_run = history["run_id"].max()
+    changes = rank_changes(current, history[history["run_id"] == previous_run])
+    movers = changes[np.abs(changes["change"].to_numpy()) >= threshold]
+    report["movers"] = movers.reindex(movers["change"].abs().sort_values(ascending=False).index)
+    report["volatility"] = volatility(pd.concat([history, current.assign(run_id=run_id)]), window)
+    report["previous_top10_share"] = top10_share(history[history["run_id"] == previous_run])
+    report["previous_run"] = previous_run
+    return report
+
+
+# --- 4. SUMMARY & ALERT ---
+def format_rank(rank):
+    return serp_parser.NOT_FOUND if rank == serp_parser.NOT_FOUND_RANK else str(rank)
+
+
+def summary_text(report, segment):
+    lines = [f"Segment: {segment}", f"Compared with the run of {report['previous_run']}.", ""]
+    lines.append(f"Keywords that moved {config.RANK_CHANGE_ALERT_THRESHOLD}+ positions ({len(report['movers'])}):")
+    for row in report["movers"].itertuples(index=False):
+        direction = "up" if row.change > 0 else "down"
+        lines.append(f"  {row.competitor:<8} '{row.keyword}': {format_rank(row.rank_previous)} -> {format_rank(row.rank)} ({direction} {abs(row.change)})")
+    lines += ["", "Share of keywords in the top 10:"]
+    previous_share = report.get("previous_top10_share", pd.Series(dtype=float))
+    for competitor, share in report["top10_share"].items():
+        before = f" (was {previous_share[competitor]:.0%})" if competitor in previous_share else ""
+        lines.append(f"  {competitor:<8} {share:.0%}{before}")
+    volatile = report["volatility"][report["volatility"]["volatility"] > 0] if not report["volatility"].empty else report["volatility"]
+    if not volatile.empty:
+        lines += ["", f"Most volatile rankings over the last {config.RANK_VOLATILITY_WINDOW} runs (std dev of position):"]
+        for row in volatile.nlargest(5, "volatility").itertuples(index=False):
+            lines.append(f"  {row.competitor:<8} '{row.keyword}': {row.volatility:.1f}")
+    return "\n".join(lines)
+
+
+def run_stage(worksheet, segment="desktop", send_alert=True):
+    # Called at the end of a run. Never raises: analytics must not fail a finished scrape.
+    try:
+        import sheet_io
+        current = current_ranks(sheet_io.get_data_from_sheet(worksheet))
+        history = load_history(segment)
+        run_id = new_run_id()
+        report = analyze(current, history, run_id)
+        append_history(current, segment, run_id)
+        if report["previous_run"] is None:
+            logging.info(f"Rank analytics ({segment}): first snapshot saved; nothing to compare yet.")
+            return report
+        summary = summary_text(report, segment)
+        logging.info(f"Rank analytics ({segment}):\n{summary}")
+        if send_alert and not report["movers"].empty:
+            notifications.send_error_email(*notifications.rank_change_email(segment, len(report["movers"]), summary))
+        return report
+    except Exception as e:
+        logging.error(f"Rank analytics failed for '{segment}': {e}", exc_info=True)
+        return None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Compare the current ranks with the previous run and email a summary.")
+    parser.add_argument("--worksheet", default=None, help=f"Worksheet to analyze (default: '{config.WORKSHEET_NAME}').")
+    parser.add_argument("--segment", default="desktop", help="History segment: the device, or a matrix target key.")
+    parser.add_argument("--dry-run", action="store_true", help="Print the summary without saving a snapshot or sending email.")
+    args = parser.parse_args()
+
+    import storage
+    worksheet = storage.open_worksheet(args.worksheet)
+    if args.dry_run:
+        import sheet_io
+        report = analyze(current_ranks(sheet_io.get_data_from_sheet(worksheet)), load_history(args.segment), new_run_id())
+        print(summary_text(report, args.segment) if report["previous_run"] else "No previous run to compare with.")
+    else:
+        run_stage(worksheet, args.segment)
@@ -0,0 +1,225 @@
+# rank_api.py
+# A small local HTTP/JSON API for the rank of ONE keyword, right now:
+#
+#   GET /rank?q=term+plan                         competitor URLs from the sheet row(s) of that keyword
+#   GET /rank?q=term+plan&device=mobile&country=us&language=en
+#   GET /rank?q=term+plan&url=hdfclife.com&url=iciciprulife.com    explicit URLs
+#   GET /health
+#
+# Answers come from, in order:
+#   cache     the same question answered in the last config.RANK_API_CACHE_TTL seconds
+#   archive   a SERP captured by any run within that time (serp_archive.py), if
+#             it settles every URL (all found, or all pages checked)
+#   http      the HTTP tier (http_fetch.py), when Google answers plain requests
+#   browser   a warm Playwright browser (async_engine.browser_pools), kept open
+#             between requests, so no browser start-up per request
+# Concurrent requests for the same keyword, target and URLs share ONE fetch.
+#
+# All fetching happens on one asyncio loop in a background thread. The HTTP
+# server threads only hand requests over to it and wait.
+#
+# Usage:
+#   python rank_api.py [--port 8766] [--concurrency 2] [--headless]
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import threading
+import time
+import urllib.parse
+from contextlib import AsyncExitStack
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+import fetch_planner
+import search_targets
+import rank_records
+import log_setup
+
+
+# --- 1. THE RANK SERVICE ---
+class RankService:
+
+    def __init__(self, concurrency=None, headless=None):
+        self.concurrency = concurrency or config.RANK_API_CONCURRENCY
+        self.headless = headless
+        self.competitors_by_keyword = {}
+        self._cache = {}      # key -> (monotonic time, response)
+        self._in_flight = {}  # key -> asyncio.Task
+        self._pools = None
+        self._stack = None
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def start(self):
+        import recompute
+        # Keyed by fetch_planner.keyword_key: case and extra spaces ignored.
+        self.competitors_by_keyword = recompute.competitors_from_sheet()
+        logging.info(f"Loaded the competitor URLs of {len(self.competitors_by_keyword)} keywords.")
+        asyncio.run_coroutine_threadsafe(self._open_browser(), self.loop).result()
+
+    def stop(self):
+        if self._stack is not None:
+            asyncio.run_coroutine_threadsafe(self._stack.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _open_browser(self):
+        import async_engine
+        self._stack = AsyncExitStack()
+        self._pools = await self._stack.enter_async_context(async_engine.browser_pools(self.concurrency, self.headless))
+
+    def rank(self, keyword, urls, target):
+        # Called from the HTTP threads. Returns the response dict.
+        future = asyncio.run_coroutine_threadsafe(self._rank(keyword, urls, target), self.loop)
+        return future.result(timeout=config.RANK_API_TIMEOUT)
+
+    async def _rank(self, keyword, urls, target):
+        key = (fetch_planner.keyword_key(keyword), target.key, tuple(sorted(urls)))
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < config.RANK_API_CACHE_TTL:
+            return dict(cached[1], source="cache")
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._in_flight[key] = asyncio.ensure_future(self._fetch(keyword, urls, target))
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            logging.info(f"Joining the fetch already running for '{keyword}' ({target.key}).")
+        # shield: a request that times out must not cancel the fetch the others are waiting for.
+        response = await asyncio.shield(task)
+        now = time.monotonic()
+        # Expired entries go on every insert, so a long-running API doesn't keep them all.
+        for stale in [k for k, (cached_at, _) in self._cache.items() if now - cached_at >= config.RANK_API_CACHE_TTL]:
+            del self._cache[stale]
+        self._cache[key] = (now, response)
+        return response
+
+    async def _fetch(self, keyword, urls, target):
+        import async_engine
+        import http_fetch
+
+        log_setup.set_context(keyword=keyword, target=target.key, device=target.device, phase="api")
+        start = time.perf_counter()
+        source, ranks = "archive", archived_ranks(keyword, urls, target)
+        if ranks is None:
+            source, ranks = "http", await asyncio.to_thread(http_fetch.fetch_ranks, keyword, urls, target.device, target)
+        if ranks is None:
+            source = "browser"
+            context = await self._pools.acquire(target)
+            try:
+                ranks = await async_engine.scrape_keyword(context, keyword, urls, target)
+            finally:
+                await self._pools.release(target, context)
+        if ranks is None:
+            raise RuntimeError("Google showed a CAPTCHA that was not solved in time.")
+        logging.info(f"API: '{keyword}' ({target.key}) from {source} in {time.perf_counter() - start:.1f}s: {ranks}")
+        return {
+            "keyword": keyword,
+            "target": target.key,
+            "source": source,
+            "fetched_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "seconds": round(time.perf_counter() - start, 2),
+            "ranks": [{"url": url, "rank": rank or None, "page": ranks.pages[i] or None} for i, (url, rank) in enumerate(zip(ranks.urls, ranks.ranks))],
+        }
+
+
+def archived_ranks(keyword, urls, target, max_age=None):
+    # A KeywordRanks from the newest archived capture younger than max_age, or
+    # None when there is none, or it doesn't settle every URL.
+    import serp_archive
+    max_age = config.RANK_API_CACHE_TTL if max_age is None else max_age
+    oldest = (datetime.datetime.now() - datetime.timedelta(seconds=max_age)).isoformat(timespec="seconds")
+    pages = [p for p in reversed(serp_archive.find_pages(keyword=keyword, device=target.device))
+             if p["captured_at"] >= oldest and p["target"] == target.key]
+    starts = [i for i, p in enumerate(pages) if p["page"] == 1]
+    if not starts:
+        return None
+    capture = [pages[starts[-1]]]
+    for page in pages[starts[-1] + 1:]:
+        if page["page"] != capture[-1]["page"] + 1:
+            break
+        capture.append(page)
+    if any(page["organic_urls"] is None for page in capture):
+        return None
+    ranks = rank_records.KeywordRanks(urls)
+    for page in capture:
+        ranks.add_page(page["organic_urls"], page["rank_offset"], page["page"])
+    settled = ranks.all_found() or len(capture) >= config.MAX_PAGES_TO_CHECK
+    return ranks if settled else None
+
+
+# --- 2. HTTP FRONT END ---
+class _RankHandler(BaseHTTPRequestHandler):
+    service = None  # set by serve()
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        if url.path == "/health":
+            self._reply(200, {"ok": True, "keywords": len(self.service.competitors_by_keyword)})
+            return
+        if url.path != "/rank":
+            self._reply(404, {"error": "not found"})
+            return
+        keyword = " ".join(params.get("q", [""])[0].split())
+        if not keyword:
+            self._reply(400, {"error": "missing q="})
+            return
+        try:
+            target = search_targets.make_target(params.get("country", [None])[0], params.get("language", [None])[0], params.get("device", ["desktop"])[0])
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+            return
+        urls = params.get("url") or [url for _, url in self.service.competitors_by_keyword.get(fetch_planner.keyword_key(keyword), [])]
+        if not urls:
+            self._reply(404, {"error": f"'{keyword}' is not in the sheet; pass the URLs to look for as url=..."})
+            return
+        try:
+            self._reply(200, self.service.rank(keyword, urls, target))
+        except TimeoutError:
+            self._reply(504, {"error": f"no answer within {config.RANK_API_TIMEOUT}s; the fetch goes on, and its result will be cached"})
+        except Exception as e:
+            logging.error(f"API: ranking '{keyword}' failed: {e}", exc_info=True)
+            self._reply(503, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        logging.debug(f"rank api http: {format % args}")
+
+
+def serve(service, host=None, port=None):
+    # Serves the API from a background thread. Returns the server (call .shutdown()).
+    handler = type("RankHandler", (_RankHandler,), {"service": service})
+    server = ThreadingHTTPServer((host or config.RANK_API_HOST, port or config.RANK_API_PORT), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Rank API listening on http://{server.server_address[0]}:{server.server_address[1]}/rank?q=...")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve single-keyword ranks over HTTP, from a warm browser.")
+    parser.add_argument("--host", default=None, help=f"Listen address (default: config.RANK_API_HOST = {config.RANK_API_HOST}).")
+    parser.add_argument("--port", type=int, default=None, help=f"Port (default: {config.RANK_API_PORT}).")
+    parser.add_argument("--concurrency", type=int, default=None, help="Browser contexts, i.e. keywords fetched at once (default: config.RANK_API_CONCURRENCY).")
+    parser.add_argument("--headless", action="store_true", help="Run Chromium without a window.")
+    args = parser.parse_args()
+
+    log_setup.setup_logging("rank_api")
+    service = RankService(args.concurrency, True if args.headless else None)
+    service.start()
+    server = serve(service, args.host, args.port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        logging.info("Stopping the rank API.")
+    finally:
+        server.shutdown()
+        service.stop()
@@ -0,0 +1,125 @@
+# rank_records.py
+# Compact, typed rank results.
+#
+# Ranks are plain ints: serp_parser.NOT_FOUND_RANK (0) means "not found". The
+# "Not Found" text only appears where a human reads it: the sheet cell and the
+# log line (rank_text()).
+#
+#   KeywordRanks  the ranks of ONE keyword while it is being scraped (replaces the
+#                 {url: "Not Found"} dicts): array-backed, first page found wins
+#   RankRecord    one result row (keyword id, competitor id, segment, page, rank)
+#   RankBatch     many results stored column-wise in typed arrays, with keywords,
+#                 competitors and segments (device, or a (date, device, target)
+#                 tuple) interned to small ints - for large runs and backfills
+
+from array import array
+from dataclasses import dataclass
+
+import serp_parser
+
+NOT_FOUND_RANK = serp_parser.NOT_FOUND_RANK
+
+
+def rank_text(rank):
+    # What the sheet shows: "7" or "Not Found".
+    return serp_parser.NOT_FOUND if rank == NOT_FOUND_RANK else str(rank)
+
+
+# --- 1. ONE KEYWORD ---
+class KeywordRanks:
+    __slots__ = ("urls", "ranks", "pages", "_index")
+
+    def __init__(self, urls):
+        self.urls = [url for url in dict.fromkeys(urls) if url]
+        self.ranks = array("i", [NOT_FOUND_RANK] * len(self.urls))
+        self.pages = array("b", [0] * len(self.urls))  # page each URL was found on
+        self._index = {url: i for i, url in enumerate(self.urls)}
+
+    def add_page(self, result_urls, rank_offset, page_num):
+        # Keeps the first rank found for each URL. Returns {url: rank} newly found on this page.
+        newly_found = {}
+        for i, rank in enumerate(serp_parser.match_ranks(result_urls, self.urls, rank_offset)):
+            if rank != NOT_FOUND_RANK and self.ranks[i] == NOT_FOUND_RANK:
+                self.ranks[i] = rank
+                self.pages[i] = page_num
+                newly_found[self.urls[i]] = rank
+        return newly_found
+
+    def get(self, url):
+        i = self._index.get(url)
+        return NOT_FOUND_RANK if i is None else self.ranks[i]
+
+    def text(self, url):
+        return rank_text(self.get(url))
+
+    def all_found(self):
+        return NOT_FOUND_RANK not in self.ranks
+
+    def to_dict(self):
+        # {url: int rank}, e.g. for JSON (work_queue.py).
+        return dict(zip(self.urls, self.ranks))
+
+    @classmethod
+    def from_dict(cls, ranks):
+        keyword_ranks = cls(ranks.keys())
+        for i, url in enumerate(keyword_ranks.urls):
+            keyword_ranks.ranks[i] = int(ranks[url])
+        return keyword_ranks
+
+    def __repr__(self):
+        # Same look as the old dicts in the log: {'url': 3, 'other': 'Not Found'}
+        return repr({url: rank if rank != NOT_FOUND_RANK else serp_parser.NOT_FOUND for url, rank in zip(self.urls, self.ranks)})
+
+
+# --- 2. MANY KEYWORDS ---
+@dataclass(frozen=True, slots=True)
+class RankRecord:
+    keyword_id: int
+    competitor_id: int
+    segment_id: int
+    page: int
+    rank: int
+
+
+class RankBatch:
+    # Column-wise: ~13 bytes per result instead of a dict and several str objects.
+
+    def __init__(self):
+        self.keyword_ids = array("i")
+        self.competitor_ids = array("i")
+        self.segment_ids = array("h")
+        self.pages = array("b")
+        self.ranks = array("i")
+        self.keywords = []
+        self.competitors = []
+        self.segments = []
+        self._lookup = ({}, {}, {})
+
+    def _intern(self, table, values, value):
+        i = table.get(value)
+        if i is None:
+            i = table[value] = len(values)
+            values.append(value)
+        return i
+
+    def add(self, keyword, competitor, segment, page, rank):
+        keyword_lookup, competitor_lookup, segment_lookup = self._lookup
+        self.keyword_ids.append(self._intern(keyword_lookup, self.keywords, keyword))
+        self.competitor_ids.append(self._intern(competitor_lookup, self.competitors, competitor))
+        self.segment_ids.append(self._intern(segment_lookup, self.segments, segment))
+        self.pages.append(page)
+        self.ranks.append(rank)
+
+    def __len__(self):
+        return len(self.ranks)
+
+    def __iter__(self):
+        for i in range(len(self.ranks)):
+            yield RankRecord(self.keyword_ids[i], self.competitor_ids[i], self.segment_ids[i], self.pages[i], self.ranks[i])
+
+    def rows(self):
+        # (keyword, competitor, segment, page, rank) with the names resolved.
+        for record in self:
+            yield (self.keywords[record.keyword_id], self.competitors[record.competitor_id],
+                   self.segments[record.segment_id], record.page, record.rank)
+
@@ -0,0 +1,258 @@
+# rank_tracker.py
+# One command line for everything: scraping runs, resuming a queued run,
+# profiles, recomputing from the archive, the single-keyword rank API, a parser
+# benchmark and a status view.
+#
+# Only argparse, sqlite3 and config are imported up front. Each subcommand
+# imports what it needs when it runs: `run` and `profile` start the usual
+# scripts (and so pandas, gspread, Selenium or Playwright, and their log files),
+# while `status` and `resume --check` only read the local SQLite/CSV files and
+# answer in a fraction of a second.
+#
+# Usage:
+#   python rank_tracker.py run [--script main|incognito|mobile|async|matrix] [script options...]
+#   python rank_tracker.py resume [--check]
+#   python rank_tracker.py profile create|refresh
+#   python rank_tracker.py recompute [recompute.py options...]
+#   python rank_tracker.py api [rank_api.py options...]
+#   python rank_tracker.py bench [--pages 200] [--device mobile]
+#   python rank_tracker.py status
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import config
+
+# `run` script name -> module
+RUN_SCRIPTS = {
+    "main": "main",
+    "incognito": "incognito_main",
+    "mobile": "mobile_main",
+    "async": "async_engine",
+    "matrix": "run_matrix",
+}
+PROFILE_SCRIPTS = {"create": "create_master_profile", "refresh": "refresh_profile"}
+
+
+# --- 1. HELPERS ---
+def run_script(module, args=()):
+    # Runs a script exactly as `python <module>.py args...` would, in this process.
+    import runpy
+    sys.argv = [f"{module}.py", *args]
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+def read_only(path):
+    # None when the file does not exist yet: a status check must not create it.
+    if not os.path.exists(path):
+        return None
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def unfinished_jobs():
+    # {state: count} of the work queue's jobs whose ranks are not in the sheet
+    # yet: queued, leased, and done or failed but not written.
+    connection = read_only(config.WORK_QUEUE_PATH)
+    if connection is None:
+        return {}
+    try:
+        rows = connection.execute("SELECT state, COUNT(*) FROM jobs WHERE written = 0 GROUP BY state").fetchall()
+    except sqlite3.OperationalError:
+        try:  # a queue file from before the `written` column
+            rows = connection.execute("SELECT state, COUNT(*) FROM jobs WHERE state IN ('queued', 'leased') GROUP BY state").fetchall()
+        except sqlite3.OperationalError:
+            return {}
+    finally:
+        connection.close()
+    return dict(rows)
+
+
+def queued_run_settings():
+    # The targets and worksheet mode the queued run was started with ({} if unknown).
+    import json
+    connection = read_only(config.WORK_QUEUE_PATH)
+    if connection is None:
+        return {}
+    try:
+        return {key: json.loads(value) for key, value in connection.execute("SELECT key, value FROM meta")}
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        connection.close()
+
+
+def describe_pending(pending):
+    labels = {"done": "done (not written yet)", "failed": "failed (not reported yet)"}
+    return ", ".join(f"{count} {labels.get(state, state)}" for state, count in sorted(pending.items()))
+
+
+def last_line(path):
+    # The last line of a text file, without reading all of it.
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = f.read().decode("utf-8", errors="replace").splitlines()
+    return lines[-1] if lines else ""
+
+
+# --- 2. SUBCOMMANDS ---
+def cmd_run(args):
+    run_script(RUN_SCRIPTS[args.script], args.passthrough)
+
+
+def cmd_resume(args):
+    pending = unfinished_jobs()
+    if not pending:
+        print(f"Nothing to resume: no unfinished jobs in '{config.WORK_QUEUE_PATH}'.")
+        return 0
+    import search_targets
+    settings = queued_run_settings()
+    targets = [search_targets.make_target(**fields) for fields in settings.get("targets", [])]
+    print(f"Unfinished jobs: {describe_pending(pending)}" + (f" ({', '.join(t.key for t in targets)})" if targets else "") + ".")
+    if args.check:
+        return 1
+    # The coordinator picks up an unfinished queue instead of starting a new batch,
+    # with the targets stored in it; the flags only matter for older queue files.
+    if settings.get("per_target_worksheets"):
+        run_script("work_queue", ["coordinator", "--matrix"])
+    else:
+        run_script("work_queue", ["coordinator", "--device", targets[0].device if targets else args.device])
+    return 0
+
+
+def cmd_profile(args):
+    run_script(PROFILE_SCRIPTS[args.action])
+
+
+def cmd_recompute(args):
+    import recompute
+    recompute.main(args.passthrough)
+
+
+def cmd_api(args):
+    run_script("rank_api", args.passthrough)
+
+
+def cmd_bench(args):
+    # Offline parser throughput on the newest archived pages, and how often it
+    # agrees with the organic results recorded when each page was scraped.
+    import json
+    import serp_archive
+    import serp_parser
+
+    connection = read_only(os.path.join(config.SERP_ARCHIVE_PATH, "index.sqlite"))
+    if connection is None:
+        print(f"No SERP archive in '{config.SERP_ARCHIVE_PATH}' to benchmark.")
+        return 1
+    clause, params = ("WHERE p.device = ?", [args.device]) if args.device else ("", [])
+    with connection:
+        rows = connection.execute(
+            "SELECT p.device, p.page_url, p.organic_urls, p.html_sha256, b.codec FROM pages p"
+            f" JOIN blobs b ON b.sha256 = p.html_sha256 {clause} ORDER BY p.id DESC LIMIT ?", params + [args.pages]).fetchall()
+    connection.close()
+    pages = []
+    for device, page_url, organic_urls, sha256, codec in rows:
+        try:
+            pages.append((device, page_url, organic_urls, serp_archive.read_stored(sha256, codec).decode("utf-8")))
+        except OSError:
+            continue
+    if not pages:
+        print("No archived pages to benchmark.")
+        return 1
+
+    parsed, agree, recorded = 0, 0, 0
+    start = time.perf_counter()
+    for device, page_url, organic_urls, html in pages:
+        blocks, selector_set = serp_parser.parse_html_with_fallback(html, device, base_url=page_url)
+        parsed += selector_set is not None
+        if organic_urls is not None:
+            recorded += 1
+            agree += serp_parser.organic_urls(blocks) == json.loads(organic_urls)
+    elapsed = time.perf_counter() - start
+    print(f"Parsed {len(pages)} archived pages in {elapsed:.2f}s: {elapsed / len(pages) * 1000:.1f} ms/page, {len(pages) / elapsed:.0f} pages/s.")
+    print(f"  a selector set matched: {parsed}/{len(pages)}")
+    if recorded:
+        print(f"  same organic results as the live scrape: {agree}/{recorded}")
+    return 0
+
+
+def cmd_status(args):
+    print(f"Project root:   {config.PROJECT_ROOT}")
+    print(f"Storage:        {config.STORAGE_BACKEND}" + (f" ({config.LOCAL_DATA_DIR})" if config.STORAGE_BACKEND == "local" else f" ('{config.WORKSHEET_NAME}')"))
+
+    pending = unfinished_jobs()
+    print("Work queue:     " + (f"{describe_pending(pending)} (resume with `rank_tracker.py resume`)" if pending else "nothing unfinished"))
+
+    if os.path.exists(config.RANK_HISTORY_PATH):
+        run_id = last_line(config.RANK_HISTORY_PATH).split(",", 1)[0]
+        print(f"Last analyzed:  {run_id}")
+    else:
+        print("Last analyzed:  never")
+
+    connection = read_only(os.path.join(config.SERP_ARCHIVE_PATH, "index.sqlite"))
+    if connection is None:
+        print("SERP archive:   empty")
+    else:
+        with connection:
+            pages, last_date = connection.execute("SELECT COUNT(*), MAX(run_date) FROM pages").fetchone()
+            stored = connection.execute("SELECT COALESCE(SUM(stored_bytes), 0) FROM blobs").fetchone()[0]
+        connection.close()
+        print(f"SERP archive:   {pages} pages, {stored / 1024 / 1024:.1f} MB, last capture {last_date or '-'}")
+
+    recordings = sorted(os.listdir(config.RECORDINGS_PATH)) if os.path.isdir(config.RECORDINGS_PATH) else []
+    print(f"Recordings:     {len(recordings)}" + (f", latest {recordings[-1]}" if recordings else ""))
+    capture_days = sorted(os.listdir(config.ANOMALY_CAPTURE_PATH)) if os.path.isdir(config.ANOMALY_CAPTURE_PATH) else []
+    captures = sum(len(os.listdir(os.path.join(config.ANOMALY_CAPTURE_PATH, day))) for day in capture_days)
+    print(f"Anomalies:      {captures} captures" + (f", latest on {capture_days[-1]}" if capture_days else ""))
+    print(f"Master profile: {'present' if os.path.isdir(config.CHROME_PROFILE_PATH) else 'MISSING (rank_tracker.py profile create)'}")
+    return 0
+
+
+# --- 3. COMMAND LINE ---
+def build_parser():
+    parser = argparse.ArgumentParser(prog="rank_tracker.py", description="Keyword rank tracking: run, resume, profiles, recompute, api, bench, status.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run a scraping script (default: main).")
+    # An option, not a positional: the script's own option values (--concurrency 4)
+    # must not be taken for a script name.
+    run_parser.add_argument("--script", choices=list(RUN_SCRIPTS), default="main", help="Script to run (default: main).")
+    # Any other options (e.g. --headless) are passed on to the script.
+    run_parser.set_defaults(func=cmd_run, passthrough=True)
+
+    resume_parser = sub.add_parser("resume", help="Finish the unfinished work queue, if there is one.")
+    resume_parser.add_argument("--check", action="store_true", help="Only report; exit code 1 when there is something to resume.")
+    resume_parser.add_argument("--device", choices=["desktop", "mobile"], default="desktop", help="Only for queues written before the run's targets were stored in them.")
+    resume_parser.set_defaults(func=cmd_resume)
+
+    profile_parser = sub.add_parser("profile", help="Create or refresh the logged-in master Chrome profile.")
+    profile_parser.add_argument("action", choices=list(PROFILE_SCRIPTS))
+    profile_parser.set_defaults(func=cmd_profile)
+
+    # No -h of its own: `recompute -h` shows recompute.py's options.
+    recompute_parser = sub.add_parser("recompute", add_help=False, help="Recompute ranks from the SERP archive (see recompute.py).")
+    recompute_parser.set_defaults(func=cmd_recompute, passthrough=True)
+
+    api_parser = sub.add_parser("api", add_help=False, help="Serve single-keyword ranks over HTTP (see rank_api.py).")
+    api_parser.set_defaults(func=cmd_api, passthrough=True)
+
+    bench_parser = sub.add_parser("bench", help="Benchmark the offline SERP parser on archived pages.")
+    bench_parser.add_argument("--pages", type=int, default=200, help="Newest archived pages to parse (default: 200).")
+    bench_parser.add_argument("--device", choices=["desktop", "mobile"])
+    bench_parser.set_defaults(func=cmd_bench)
+
+    status_parser = sub.add_parser("status", help="Queue, archive, history and profile at a glance.")
+    status_parser.set_defaults(func=cmd_status)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args, extra = parser.parse_known_args()
+    if extra and not getattr(args, "passthrough", False):
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    args.passthrough = extra
+    sys.exit(args.func(args) or 0)
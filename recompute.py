@@ -0,0 +1,220 @@
+# recompute.py
+# Recomputes ranks from the SERP archive (serp_archive.py) instead of re-scraping.
+# Use it to backfill a newly added competitor URL, or to apply a changed
+# matching/parsing rule, across every archived keyword and date.
+#
+# The archive is streamed in chunks of SERPs to a ProcessPoolExecutor. A SERP is
+# one (keyword, run date, device, target) capture with all its pages. Ranks use
+# the same rule as find_competitor_ranks(): serp_parser.match_ranks() per page,
+# and the first page a URL is found on wins.
+#
+# Usage:
+#   python recompute.py                                   # competitors from the sheet, all dates
+#   python recompute.py --add "Axis=axismaxlife.com"      # ... plus a new competitor URL for every keyword
+#   python recompute.py --since 2024-01-01 --device mobile --out mobile_ranks.csv
+#   python recompute.py --reparse                         # re-run serp_parser on the archived HTML
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import config
+import fetch_planner
+import search_targets
+import serp_parser
+import serp_archive
+import rank_records
+
+OUTPUT_COLUMNS = ["keyword", "run_date", "device", "target", "competitor", "url", "page", "rank"]
+
+# Set in each worker process by _init_worker().
+_competitors_by_keyword = {}
+_extra_competitors = []
+_reparse = False
+
+
+# --- 1. COMPETITOR URLS ---
+def competitors_from_sheet():
+    # {keyword key: [(competitor name, url), ...]} from the current sheet (or local
+    # file). Keyed like fetch_planner, which archives all the spellings of a keyword
+    # under its first row's.
+    import storage
+    import sheet_io
+    worksheet = storage.open_worksheet()
+    df = sheet_io.get_data_from_sheet(worksheet)
+    competitors_by_keyword = {}
+    for _, row in df.iterrows():
+        pairs = competitors_by_keyword.setdefault(fetch_planner.keyword_key(row['Keyword']), [])
+        for name, data in sheet_io.competitors_for_row(row).items():
+            if data['url'] and (name, data['url']) not in pairs:
+                pairs.append((name, data['url']))
+    return competitors_by_keyword
+
+
+def parse_added_competitor(text):
+    # "Name=url-fragment"
+    name, sep, url = text.partition("=")
+    if not sep or not name.strip() or not url.strip():
+        raise argparse.ArgumentTypeError(f"Expected NAME=URL, got '{text}'.")
+    return name.strip(), url.strip()
+
+
+# --- 2. WORKERS ---
+def _init_worker(competitors_by_keyword, extra_competitors, reparse):
+    global _competitors_by_keyword, _extra_competitors, _reparse
+    _competitors_by_keyword = competitors_by_keyword
+    _extra_competitors = extra_competitors
+    _reparse = reparse
+
+
+def _result_urls(page):
+    if page["organic_urls"] is not None and not _reparse:
+        return json.loads(page["organic_urls"])
+    html = serp_archive.read_stored(page["html_sha256"], page["codec"]).decode("utf-8")
+    blocks, _ = serp_parser.parse_html_with_fallback(html, page["device"], base_url=config.SEARCH_URL)
+    return serp_parser.organic_urls(blocks)
+
+
+def rank_serps(serps):
+    # serps: [((keyword, run_date, device, target), [page, ...]), ...] -> a RankBatch.
+    # Competitors are interned as (name, url) and segments as (run_date, device, target),
+    # so a chunk goes back to the parent as a few typed arrays instead of millions of strings.
+    batch = rank_records.RankBatch()
+    for key, pages in serps:
+        competitors = _competitors_by_keyword.get(fetch_planner.keyword_key(key[0]), []) + _extra_competitors
+        if not competitors:
+            continue
+        ranks = rank_records.KeywordRanks([url for _, url in competitors])
+        for page in pages:
+            ranks.add_page(_result_urls(page), page["rank_offset"], page["page"])
+            if ranks.all_found():
+                break
+        for competitor in competitors:
+            url = competitor[1]
+            batch.add(key[0], competitor, key[1:], ranks.pages[ranks.urls.index(url)], ranks.get(url))
+    return batch
+
+
+def output_rows(batch):
+    for keyword, (name, url), (run_date, device, target), page, rank in batch.rows():
+        yield keyword, run_date, device, target, name, url, page, rank_records.rank_text(rank)
+
+
+# --- 3. STREAMING THE ARCHIVE ---
+def iter_serps(since=None, until=None, device=None):
+    # Yields (key, pages) per SERP, pages in page order. When a page was archived
+    # more than once on the same day, the latest capture is used.
+    clauses, params = [], []
+    for condition, value in (("p.run_date >= ?", since), ("p.run_date <= ?", until), ("p.device = ?", device)):
+        if value is not None:
+            clauses.append(condition)
+            params.append(value)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    # Our own read-only connection: serp_archive's shared one must not leak into forked workers.
+    connection = sqlite3.connect(f"file:{os.path.join(config.SERP_ARCHIVE_PATH, 'index.sqlite')}?mode=ro", uri=True)
+    connection.row_factory = sqlite3.Row
+    # Pages archived without a target (older Selenium runs) are the device's default market.
+    default = search_targets.default_target()
+    cursor = connection.execute(
+        "SELECT p.keyword, p.run_date, p.device, COALESCE(p.target, ? || '-' || ? || '-' || p.device) AS target, p.page, p.rank_offset,"
+        " p.organic_urls, p.html_sha256, b.codec"
+        " FROM pages p JOIN blobs b ON b.sha256 = p.html_sha256"
+        f" {where} ORDER BY p.keyword, p.run_date, p.device, target, p.page, p.id DESC",
+        [default.country, default.language] + params,
+    )
+    current_key, pages, last_page = None, [], None
+    try:
+        while True:
+            batch = cursor.fetchmany(1000)
+            if not batch:
+                break
+            for row in batch:
+                key = (row["keyword"], row["run_date"], row["device"], row["target"])
+                if key != current_key:
+                    if pages:
+                        yield current_key, pages
+                    current_key, pages, last_page = key, [], None
+                if row["page"] == last_page:
+                    continue  # an older capture of the same page
+                last_page = row["page"]
+                pages.append(dict(row))
+        if pages:
+            yield current_key, pages
+    finally:
+        connection.close()
+
+
+def chunked(serps, chunk_size):
+    chunk, page_count = [], 0
+    for serp in serps:
+        chunk.append(serp)
+        page_count += len(serp[1])
+        if page_count >= chunk_size:
+            yield chunk
+            chunk, page_count = [], 0
+    if chunk:
+        yield chunk
+
+
+def recompute(output_path, competitors_by_keyword, extra_competitors=(), since=None, until=None, device=None,
+              reparse=False, workers=None, chunk_size=None):
+    # Writes the rank table to output_path (CSV) and returns the number of rows.
+    chunk_size = chunk_size or config.RECOMPUTE_CHUNK_SIZE
+    workers = workers or config.RECOMPUTE_WORKERS or os.cpu_count()
+    start = time.time()
+    row_count = 0
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f, ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(competitors_by_keyword, list(extra_competitors), reparse)
+    ) as executor:
+        writer = csv.writer(f)
+        writer.writerow(OUTPUT_COLUMNS)
+        in_flight = set()
+        for chunk in chunked(iter_serps(since, until, device), chunk_size):
+            # Bounded: never more than two chunks per worker waiting in memory.
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = future.result()
+                    writer.writerows(output_rows(batch))
+                    row_count += len(batch)
+            in_flight.add(executor.submit(rank_serps, chunk))
+        for future in in_flight:
+            batch = future.result()
+            writer.writerows(output_rows(batch))
+            row_count += len(batch)
+    os.replace(tmp_path, output_path)
+    logging.info(f"Recomputed {row_count} ranks in {time.time() - start:.1f}s with {workers} processes -> '{output_path}'")
+    return row_count
+
+
+def main(argv=None):
+    # A function (not just the __main__ block) so rank_tracker.py can call it: the
+    # worker processes must import this module by name, not the launcher script.
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Recompute competitor ranks from the archived SERPs.")
+    parser.add_argument("--out", default=os.path.join(config.PROJECT_ROOT, "recomputed_ranks.csv"), help="CSV rank table to write.")
+    parser.add_argument("--add", action="append", default=[], type=parse_added_competitor, metavar="NAME=URL",
+                        help="Extra competitor URL to rank for every keyword (repeatable).")
+    parser.add_argument("--only-added", action="store_true", help="Skip the sheet's competitor URLs; rank only the --add ones.")
+    parser.add_argument("--since", help="First run date, YYYY-MM-DD.")
+    parser.add_argument("--until", help="Last run date, YYYY-MM-DD.")
+    parser.add_argument("--device", choices=["desktop", "mobile"])
+    parser.add_argument("--reparse", action="store_true", help="Re-extract the organic results from the archived HTML.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: config.RECOMPUTE_WORKERS or all CPUs).")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Archived pages per task (default: config.RECOMPUTE_CHUNK_SIZE).")
+    args = parser.parse_args(argv)
+
+    if args.only_added and not args.add:
+        parser.error("--only-added needs at least one --add NAME=URL.")
+    competitors = {} if args.only_added else competitors_from_sheet()
+    recompute(args.out, competitors, args.add, args.since, args.until, args.device, args.reparse, args.workers, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 # refresh_profile.py
 # RUN THIS SCRIPT whenever you feel the master profile is stale or logged out.
-# It will delete the old profile and guide you through creating a new one.
+# It guides you through logging in to a NEW profile, and only replaces the old
+# one (and the golden snapshot used for worker clones) once that has worked.
 
 import time
 import logging
@@ -13,6 +14,7 @@ from webdriver_manager.chrome import ChromeDriverManager
 
 # This assumes config.py exists and has PROJECT_ROOT and CHROME_PROFILE_PATH
 import config
+import profile_manager
 
 # --- Main Logic ---
 if __name__ == "__main__":
@@ -20,24 +22,26 @@ if __name__ == "__main__":
 
     # Use the path from the central config file
     MASTER_PROFILE_PATH = config.CHROME_PROFILE_PATH
+    # The new login happens here, so the current profile keeps working until it succeeds.
+    STAGING_PROFILE_PATH = MASTER_PROFILE_PATH + "-staging"
+    PREVIOUS_PROFILE_PATH = MASTER_PROFILE_PATH + "-previous"
 
-    # 1. Clean up any previous profile
-    if os.path.exists(MASTER_PROFILE_PATH):
-        logging.info(f"Removing existing master profile at: {MASTER_PROFILE_PATH}")
+    # 1. Clean up any leftover staging profile from an earlier attempt
+    if os.path.exists(STAGING_PROFILE_PATH):
+        logging.info(f"Removing leftover staging profile at: {STAGING_PROFILE_PATH}")
         try:
-            shutil.rmtree(MASTER_PROFILE_PATH)
-            logging.info("Successfully removed old profile.")
+            shutil.rmtree(STAGING_PROFILE_PATH)
             time.sleep(2) # Give the OS a moment to process the deletion
         except OSError as e:
-            logging.error(f"Could not remove profile. Is a Chrome window using it still open? Error: {e}")
+            logging.error(f"Could not remove staging profile. Is a Chrome window using it still open? Error: {e}")
             logging.error("Please close all Chrome windows and run this script again.")
             exit() # Stop the script if we can't delete the folder
 
     # 2. Launch the creation process (logic from create_master_profile.py)
-    logging.info(f"Creating new master profile at: {MASTER_PROFILE_PATH}")
+    logging.info(f"Creating new master profile at: {STAGING_PROFILE_PATH}")
     
     options = Options()
-    options.add_argument(f"--user-data-dir={MASTER_PROFILE_PATH}")
+    options.add_argument(f"--user-data-dir={STAGING_PROFILE_PATH}")
     options.add_argument("--no-first-run")
     
     service = Service(ChromeDriverManager().install())
@@ -56,9 +60,25 @@ if __name__ == "__main__":
 
     time.sleep(120) # Increased time to 2 minutes
     
+    # Seed the HTTP fetch tier with the new session's cookies (if the window is still open).
+    profile_manager.export_cookies(driver)
     try:
         driver.quit()
     except:
         pass
+
+    # 3. Promote the new login: golden snapshot first, then swap the master profile.
+    profile_manager.promote_snapshot(STAGING_PROFILE_PATH)
+    try:
+        if os.path.exists(PREVIOUS_PROFILE_PATH):
+            shutil.rmtree(PREVIOUS_PROFILE_PATH)
+        if os.path.exists(MASTER_PROFILE_PATH):
+            os.rename(MASTER_PROFILE_PATH, PREVIOUS_PROFILE_PATH)
+        os.rename(STAGING_PROFILE_PATH, MASTER_PROFILE_PATH)
+        shutil.rmtree(PREVIOUS_PROFILE_PATH, ignore_errors=True)
+    except OSError as e:
+        logging.error(f"Could not swap in the new profile. Is a Chrome window using it still open? Error: {e}")
+        logging.error(f"The new login is saved at {STAGING_PROFILE_PATH} and in the golden snapshot.")
+        exit()
         
     logging.info("Master profile has been refreshed. You can now run the main.py or ranking_automator.py script.")
\ No newline at end of file
@@ -0,0 +1,222 @@
+# replay.py
+# Reproducible runs: seeded randomness, a recorded timeline, and offline replay.
+#
+# SEEDING: every entry point calls start_run() first. It seeds Python's
+# `random` module - the keyword shuffle, the User-Agent choice and every pause
+# come from it - with config.RUN_SEED, or a fresh seed that is logged. Running
+# again with that seed and the same sheet gives the same keyword order,
+# User-Agents and pause lengths. (In the async engine the order in which
+# workers draw pauses still depends on timing.)
+#
+# RECORDING (config.RECORD_RUNS = True): each run gets a folder in
+# config.RECORDINGS_PATH with
+#   manifest.json    seed, script, device and the settings that affect ranks
+#   timeline.jsonl   one event per line with its time offset: every SERP page
+#                    (its HTML goes to the SERP archive, serp_archive.py, and
+#                    the event points at it), every pause, and every keyword's
+#                    final ranks
+#
+# REPLAY re-ranks every recorded keyword from the archived HTML with the
+# offline parser, at full speed and without a browser or sleeps. It reports
+# where the ranks or the organic result lists differ from the live run, and
+# where the run's time went. Parsing bugs and slow steps can then be bisected
+# offline. Recorded pages are only kept for SERP_ARCHIVE_RETENTION_DAYS.
+#
+# Usage:
+#   python replay.py list
+#   python replay.py replay 2024-05-01T10-30-00-main [--keyword "term plan"]
+#   python replay.py timing 2024-05-01T10-30-00-main
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import config
+
+_lock = threading.Lock()
+_recording = None  # {"dir", "file", "start"} while recording
+
+
+# --- 1. SEEDING & RECORDING ---
+def start_run(script, device="desktop"):
+    # Seeds all randomness and, if enabled, starts recording. Returns the seed.
+    global _recording
+    seed = config.RUN_SEED if config.RUN_SEED is not None else random.SystemRandom().randrange(2 ** 32)
+    random.seed(seed)
+    logging.info(f"Run seed: {seed} (set config.RUN_SEED = {seed} to repeat this keyword order and these pauses)")
+    if not config.RECORD_RUNS:
+        return seed
+
+    run_id = f"{datetime.datetime.now():%Y-%m-%dT%H-%M-%S}-{script}"
+    run_dir = os.path.join(config.RECORDINGS_PATH, run_id)
+    os.makedirs(run_dir, exist_ok=True)
+    manifest = {
+        "run_id": run_id,
+        "script": script,
+        "device": device,
+        "seed": seed,
+        "started_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "settings": {name: getattr(config, name) for name in (
+            "SEARCH_COUNTRY", "SEARCH_LANGUAGE", "MAX_PAGES_TO_CHECK", "KEYWORDS_PER_BATCH",
+            "COUNT_FEATURED_SNIPPET_AS_ORGANIC", "ENABLE_HUMAN_PACING", "HUMAN_PACING", "READINESS_TIMEOUT")},
+    }
+    with open(os.path.join(run_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    _recording = {"dir": run_dir, "file": open(os.path.join(run_dir, "timeline.jsonl"), "a", encoding="utf-8"), "start": time.monotonic()}
+    logging.info(f"Recording this run to '{run_dir}'.")
+    return seed
+
+
+def recording():
+    return _recording is not None
+
+
+def event(kind, **fields):
+    # Appends one timeline event. A no-op unless the run is being recorded.
+    if _recording is None:
+        return
+    with _lock:
+        fields = dict(fields, t=round(time.monotonic() - _recording["start"], 3), kind=kind)
+        _recording["file"].write(json.dumps(fields) + "\n")
+        _recording["file"].flush()
+
+
+# --- 2. LOADING RECORDINGS ---
+def list_recordings():
+    if not os.path.isdir(config.RECORDINGS_PATH):
+        return []
+    return sorted(d for d in os.listdir(config.RECORDINGS_PATH) if os.path.exists(os.path.join(config.RECORDINGS_PATH, d, "manifest.json")))
+
+
+def load_recording(run_id):
+    run_dir = os.path.join(config.RECORDINGS_PATH, run_id)
+    with open(os.path.join(run_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    with open(os.path.join(run_dir, "timeline.jsonl"), encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return manifest, events
+
+
+def event_key(e):
+    # (keyword, device, target key). Events without a target (the Selenium
+    # scripts' pages and ranks in older recordings) are the device's default market.
+    import search_targets
+    return e["keyword"], e["device"], e.get("target") or search_targets.default_target(e["device"]).key
+
+
+def keyword_pages(events):
+    # {(keyword, device, target): [page events in order]}, keeping the LAST attempt of a
+    # keyword (a keyword retried after a CAPTCHA is recorded more than once).
+    pages = {}
+    for e in events:
+        if e["kind"] != "page":
+            continue
+        key = event_key(e)
+        if e["page"] == 1:
+            pages[key] = []
+        pages.setdefault(key, []).append(e)
+    return pages
+
+
+# --- 3. REPLAY ---
+def replay(run_id, only_keyword=None):
+    # Returns the number of keywords whose replayed ranks differ from the live run.
+    import serp_parser
+    import serp_archive
+    import rank_records
+
+    manifest, events = load_recording(run_id)
+    config.COUNT_FEATURED_SNIPPET_AS_ORGANIC = manifest["settings"]["COUNT_FEATURED_SNIPPET_AS_ORGANIC"]
+    pages = keyword_pages(events)
+    live_ranks = {event_key(e): e["ranks"] for e in events if e["kind"] == "ranks"}
+
+    start = time.perf_counter()
+    mismatches = 0
+    for (keyword, device, target), live in live_ranks.items():
+        if only_keyword and keyword != only_keyword:
+            continue
+        ranks = rank_records.KeywordRanks(live.keys())
+        notes = []
+        for page in pages.get((keyword, device, target), []):
+            try:
+                html = serp_archive.read_blob(page["html_sha256"]).decode("utf-8")
+            except (KeyError, OSError):
+                notes.append(f"page {page['page']}: HTML no longer in the archive")
+                continue
+            blocks, _ = serp_parser.parse_html_with_fallback(html, device, base_url=page.get("page_url"))
+            result_urls = serp_parser.organic_urls(blocks)
+            if page.get("organic_urls") is not None and result_urls != page["organic_urls"]:
+                notes.append(f"page {page['page']}: offline parser found {len(result_urls)} organic results, the live page {len(page['organic_urls'])}")
+            ranks.add_page(result_urls, page["rank_offset"], page["page"])
+        replayed = ranks.to_dict()
+        # A URL the replay has no rank for (no page of it left) is Not Found.
+        differs = {url: (rank, replayed.get(url, rank_records.NOT_FOUND_RANK)) for url, rank in live.items()
+                   if replayed.get(url, rank_records.NOT_FOUND_RANK) != rank}
+        if differs or notes:
+            mismatches += bool(differs)
+            print(f"'{keyword}' ({target}):")
+            for url, (live_rank, replay_rank) in differs.items():
+                print(f"    {url}: live {rank_records.rank_text(live_rank)}, replay {rank_records.rank_text(replay_rank)}")
+            for note in notes:
+                print(f"    {note}")
+    print(f"Replayed {len(live_ranks)} keyword(s) from {run_id} in {time.perf_counter() - start:.2f}s; {mismatches} differ.")
+    return mismatches
+
+
+def _share(seconds, total):
+    # "-" for a run with no recorded time (one that stopped right away).
+    return f"{seconds / total:.0%}" if total > 0 else "-"
+
+
+def timing(run_id):
+    # Where the wall-clock time of the recorded run went.
+    manifest, events = load_recording(run_id)
+    if not events:
+        print("Empty timeline.")
+        return
+    total = events[-1]["t"]
+    paused = {}
+    for e in events:
+        if e["kind"] == "pause":
+            paused[e["step"]] = paused.get(e["step"], 0) + e["seconds"]
+    page_count = sum(1 for e in events if e["kind"] == "page")
+    keywords = [e for e in events if e["kind"] == "ranks"]
+    print(f"{run_id}: {total:.0f}s, {len(keywords)} keywords, {page_count} SERP pages, seed {manifest['seed']}")
+    for step, seconds in sorted(paused.items(), key=lambda item: -item[1]):
+        print(f"    pause {step:<18} {seconds:7.0f}s  ({_share(seconds, total)})")
+    other = total - sum(paused.values())
+    print(f"    {'page loads, waits, parsing':<24} {other:7.0f}s  ({_share(other, total)})")
+    previous = 0.0
+    slowest = []
+    for e in keywords:
+        slowest.append((e["t"] - previous, e["keyword"], e.get("tier", "browser")))
+        previous = e["t"]
+    print("    slowest keywords:")
+    for seconds, keyword, tier in sorted(slowest, reverse=True)[:5]:
+        print(f"        {seconds:6.1f}s  '{keyword}' ({tier})")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Inspect and replay recorded runs offline.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List the recorded runs.")
+    replay_parser = sub.add_parser("replay", help="Re-rank a recorded run from its archived pages and compare.")
+    replay_parser.add_argument("run_id")
+    replay_parser.add_argument("--keyword", default=None, help="Only this keyword.")
+    timing_parser = sub.add_parser("timing", help="Show where the recorded run spent its time.")
+    timing_parser.add_argument("run_id")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for run_id in list_recordings():
+            print(run_id)
+    elif args.command == "replay":
+        replay(args.run_id, args.keyword)
+    else:
+        timing(args.run_id)
@@ -0,0 +1,160 @@
+# resilience.py
+# Retries and circuit breakers, so one transient failure costs a retry (or at
+# worst one keyword) instead of the whole run.
+#
+# RETRIES: call() runs an operation under a named policy from
+# config.RETRY_POLICIES ("page_load", "element", "sheets"). A failed attempt is
+# retried after an exponential backoff with jitter: half of
+# min(max_delay, base_delay * 2^attempt) is fixed and half is random, so
+# parallel runs don't retry in lockstep. The jitter has its own random.Random,
+# which keeps the seeded keyword order and pauses (replay.py) reproducible.
+#
+# CIRCUIT BREAKERS: a Breaker owns ONE restartable component - the browser or
+# the Sheets client - and builds it lazily with its factory. The component is
+# thrown away and rebuilt (after config.BREAKER_COOLDOWN seconds) when:
+#   - an error shows it is broken for good (a dead WebDriver session, revoked
+#     Sheets credentials), or
+#   - BREAKER_FAILURE_THRESHOLD operations in a row have failed on it.
+# The other component is left alone. Rate limiting (HTTP 429, quota exceeded)
+# only backs off: a new client would be just as limited. Every
+# BREAKER_RESTART_DECAY successes in a row forgive one restart. A component
+# restarted more than BREAKER_MAX_RESTARTS times without that raises
+# CircuitOpenError: something is wrong beyond a transient hiccup, and the run
+# stops with the usual crash email.
+
+import logging
+import random
+import time
+
+import config
+import selector_registry
+
+# Messages of WebDriver errors after which the session can't be used again.
+DEAD_SESSION_MARKERS = (
+    "invalid session id", "no such window", "chrome not reachable", "disconnected",
+    "session deleted", "target window already closed", "session not created",
+)
+# HTTP statuses of a Sheets API error after which the client must re-authenticate.
+REAUTH_STATUSES = (401, 403)
+RATE_LIMIT_MARKERS = ("rate limit", "quota", "resource_exhausted", "too many requests")
+
+_jitter = random.Random()
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# --- 1. ERROR CLASSIFICATION ---
+def is_dead_session(error):
+    return type(error).__name__ in ("InvalidSessionIdException", "NoSuchWindowException") or \
+        any(marker in str(error).lower() for marker in DEAD_SESSION_MARKERS)
+
+
+def is_rate_limited(error):
+    # Sheets API 429s, and its 403 "quota exceeded" errors.
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) == 429 or any(marker in str(error).lower() for marker in RATE_LIMIT_MARKERS)
+
+
+def needs_reauth(error):
+    if is_rate_limited(error):
+        return False
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) in REAUTH_STATUSES or "invalid_grant" in str(error)
+
+
+def never_retry(error):
+    # Errors that must reach the caller as they are. A missing element is an
+    # answer (no CAPTCHA on the page), not a failure.
+    return isinstance(error, (selector_registry.SelectorDriftError, CircuitOpenError)) or \
+        type(error).__name__ == "NoSuchElementException"
+
+
+# --- 2. CIRCUIT BREAKER ---
+class Breaker:
+
+    def __init__(self, name, factory, close=None, is_broken=None):
+        self.name = name
+        self.factory = factory
+        self.close_component = close
+        self.is_broken = is_broken or (lambda error: False)
+        self.component = None
+        self.failures = 0
+        self.restarts = 0
+        self.successes = 0
+        self._open_until = 0.0
+
+    def get(self):
+        # The live component, started (after the cool-down of a restart) if needed.
+        if self.component is None:
+            wait = self._open_until - time.monotonic()
+            if wait > 0:
+                logging.info(f"Waiting {wait:.0f}s before restarting the {self.name}.")
+                time.sleep(wait)
+            self.component = self.factory()
+        return self.component
+
+    def success(self):
+        self.failures = 0
+        self.successes += 1
+        if self.restarts and self.successes >= config.BREAKER_RESTART_DECAY:
+            self.restarts -= 1
+            self.successes = 0
+            logging.info(f"The {self.name} has been stable again; {self.restarts} restart(s) now count against the limit.")
+
+    def failure(self, error):
+        # Records a failed operation; restarts the component if it is broken or keeps failing.
+        self.successes = 0
+        self.failures += 1
+        if self.component is not None and (self.is_broken(error) or self.failures >= config.BREAKER_FAILURE_THRESHOLD):
+            self.trip(error)
+
+    def trip(self, error):
+        self.restarts += 1
+        self.failures = 0
+        if self.restarts > config.BREAKER_MAX_RESTARTS:
+            raise CircuitOpenError(f"The {self.name} failed again after {config.BREAKER_MAX_RESTARTS} restarts: {error}") from error
+        logging.warning(f"Restarting the {self.name} (restart {self.restarts}/{config.BREAKER_MAX_RESTARTS}) after: {error}")
+        self.close()
+        self._open_until = time.monotonic() + config.BREAKER_COOLDOWN
+
+    def close(self):
+        component, self.component = self.component, None
+        if component is not None and self.close_component:
+            try:
+                self.close_component(component)
+            except Exception as e:
+                logging.warning(f"Could not close the old {self.name} cleanly: {e}")
+
+
+# --- 3. RETRIES ---
+def backoff(attempt, policy):
+    # Seconds to wait after failed attempt number `attempt` (1-based).
+    ceiling = min(policy["max_delay"], policy["base_delay"] * 2 ** (attempt - 1))
+    return ceiling / 2 + _jitter.uniform(0, ceiling / 2)
+
+
+def call(policy_name, operation, breaker=None, retry_on=(Exception,)):
+    # Runs operation() - or operation(component) with a breaker - under the named
+    # retry policy. Returns its result, or raises the last error.
+    policy = config.RETRY_POLICIES[policy_name]
+    for attempt in range(1, policy["attempts"] + 1):
+        try:
+            result = operation(breaker.get()) if breaker else operation()
+        except retry_on as e:
+            if never_retry(e):
+                raise
+            # Rate limits say nothing about the component: just back off.
+            if breaker and not is_rate_limited(e):
+                breaker.failure(e)
+            if attempt == policy["attempts"]:
+                raise
+            delay = backoff(attempt, policy)
+            logging.warning(f"{policy_name} failed ({type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}); "
+                            f"retry {attempt}/{policy['attempts'] - 1} in {delay:.1f}s")
+            time.sleep(delay)
+        else:
+            if breaker:
+                breaker.success()
+            return result
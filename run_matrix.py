@@ -0,0 +1,110 @@
+# run_matrix.py
+# One run, many markets: every keyword is ranked for every (country, language,
+# device) target in config.RUN_TARGETS, instead of running a separate script
+# per market and device.
+#
+# The scheduler expands the batch into keyword x target jobs - one per unique
+# keyword and target, shared by all of the keyword's rows (fetch_planner.py) -
+# and interleaves the targets, so the workers of the async engine spread their
+# requests across markets instead of hammering one after another. Each target's
+# ranks go to its own worksheet (see config.RESULT_WORKSHEET_TEMPLATE).
+#
+# Usage:
+#   python run_matrix.py [--concurrency N] [--headless]
+
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import traceback
+
+import config
+import async_engine
+import notifications
+import search_targets
+import selector_registry
+import sheet_io
+import storage
+import rank_analytics
+import replay
+import fetch_planner
+
+
+# --- 1. SCHEDULING ---
+def expand_jobs(df, indices_to_process, targets):
+    # Returns {target: [KeywordJob, ...]}: all rows of a keyword share one job,
+    # and so one page load, per target.
+    return fetch_planner.plan_fetches(df, indices_to_process, targets)
+
+
+def interleave(jobs_by_target):
+    # Round-robin over targets: t1 k1, t2 k1, t3 k1, t1 k2, ...
+    rounds = itertools.zip_longest(*jobs_by_target.values())
+    return [job for round_jobs in rounds for job in round_jobs if job is not None]
+
+
+def build_schedule(df, indices_to_process, targets):
+    jobs_by_target = expand_jobs(df, indices_to_process, targets)
+    schedule = interleave(jobs_by_target)
+    rows = sum(len(job.rows) for job in schedule)
+    logging.info(f"Run matrix: {len(indices_to_process)} keywords x {len(targets)} targets -> {len(schedule)} SERP fetches for {rows} row results.")
+    return schedule
+
+
+# --- 2. RESULT SHEETS ---
+def target_worksheet_title(target):
+    return config.RESULT_WORKSHEET_TEMPLATE.format(worksheet=config.WORKSHEET_NAME, target=target.key,
+                                                   country=target.country, language=target.language, device=target.device)
+
+
+def matrix_result_writer(base_worksheet, targets):
+    # Returns (on_result, {target: worksheet}). The analytics must read those same
+    # worksheet objects: a local one may still hold unflushed cells.
+    worksheets = {target: storage.worksheet_copy(base_worksheet, target_worksheet_title(target)) for target in targets}
+    lock = asyncio.Lock()
+
+    async def on_result(job, ranks):
+        worksheet = worksheets[job.target]
+        async with lock:
+            await asyncio.to_thread(sheet_io.write_job_ranks, worksheet, job, ranks)
+
+    return on_result, worksheets
+
+
+# --- 3. MAIN EXECUTION BLOCK ---
+async def main(concurrency=None, headless=None):
+    logging.info("--- Starting MATRIX Ranking Automation Run ---")
+    try:
+        targets = search_targets.load_targets()
+        logging.info(f"Targets: {', '.join(target.key for target in targets)}")
+
+        worksheet = await asyncio.to_thread(storage.open_worksheet)
+        df = await asyncio.to_thread(sheet_io.get_data_from_sheet, worksheet)
+
+        indices_to_process = list(df.index)
+        random.shuffle(indices_to_process)
+        indices_to_process = indices_to_process[:config.KEYWORDS_PER_BATCH]
+
+        schedule = build_schedule(df, indices_to_process, targets)
+        on_result, target_worksheets = await asyncio.to_thread(matrix_result_writer, worksheet, targets)
+        await async_engine.run_jobs(schedule, on_result, concurrency, headless)
+        for target in targets:
+            await asyncio.to_thread(rank_analytics.run_stage, target_worksheets[target], target.key)
+    except selector_registry.SelectorDriftError as e:
+        logging.critical(f"Stopping the run: {e}")
+    except Exception as e:
+        logging.critical(f"A critical, unhandled error occurred: {e}", exc_info=True)
+        await asyncio.to_thread(notifications.send_error_email, *notifications.crash_email(traceback.format_exc()))
+    finally:
+        logging.info("--- MATRIX Ranking Automation Run Finished ---")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank every keyword in every configured (country, language, device) target in one run.")
+    parser.add_argument("--concurrency", type=int, default=None, help="Number of SERP fetches in flight (default: config.ASYNC_CONCURRENCY).")
+    parser.add_argument("--headless", action="store_true", help="Run Chromium without a window.")
+    args = parser.parse_args()
+    async_engine.setup_logging()
+    replay.start_run("run_matrix")
+    asyncio.run(main(args.concurrency, True if args.headless else None))
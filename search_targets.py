@@ -0,0 +1,59 @@
+# search_targets.py
+# A search target is one market/device combination a keyword is ranked in:
+# (country, language, device). Google takes the country as gl= (two-letter
+# country code, e.g. "in") and the interface language as hl= (e.g. "en").
+
+import urllib.parse
+from dataclasses import dataclass
+
+import config
+
+DEVICES = ("desktop", "mobile")
+
+
+@dataclass(frozen=True)
+class Target:
+    country: str
+    language: str
+    device: str = "desktop"
+
+    @property
+    def key(self):
+        return f"{self.country}-{self.language}-{self.device}"
+
+    @property
+    def locale(self):
+        # Browser locale / Accept-Language, e.g. "en-IN".
+        return f"{self.language}-{self.country.upper()}"
+
+
+def make_target(country=None, language=None, device="desktop"):
+    country = (country or config.SEARCH_COUNTRY).strip().lower()
+    language = (language or config.SEARCH_LANGUAGE).strip().lower()
+    device = device.strip().lower()
+    if len(country) != 2 or not country.isalpha():
+        raise ValueError(f"'{country}' is not a two-letter country code (gl=). Use e.g. 'in' or 'us', not a locale like 'en-US'.")
+    if device not in DEVICES:
+        raise ValueError(f"Unknown device '{device}'. Expected one of {DEVICES}.")
+    return Target(country, language, device)
+
+
+def default_target(device="desktop"):
+    return make_target(device=device)
+
+
+def load_targets(raw_targets=None):
+    # Normalizes config.RUN_TARGETS (or the given list of dicts) and drops duplicates, keeping order.
+    raw_targets = config.RUN_TARGETS if raw_targets is None else raw_targets
+    targets = []
+    for raw in raw_targets:
+        target = make_target(raw.get("country"), raw.get("language"), raw.get("device", "desktop"))
+        if target not in targets:
+            targets.append(target)
+    return targets
+
+
+def search_url(keyword, target=None):
+    target = target or default_target()
+    query = urllib.parse.urlencode({"q": keyword, "gl": target.country, "hl": target.language})
+    return f"{config.SEARCH_URL}/search?{query}"
@@ -0,0 +1,116 @@
+# selector_registry.py
+# Picks the working selector set for each device and detects markup drift.
+#
+# serp_selectors.SELECTOR_SETS lists, per device, versioned selector sets from
+# newest to oldest. The registry remembers which version last worked, tries the
+# others in order when it finds no organic results, and - when NO set finds any
+# organic results on the first page of several keywords in a row - raises
+# SelectorDriftError and sends one drift alert. The run then stops at once
+# instead of reporting "Not Found" for every remaining keyword.
+
+import logging
+import threading
+
+import config
+import serp_selectors
+import serp_parser
+import notifications
+
+
+class SelectorDriftError(Exception):
+    pass
+
+
+_lock = threading.Lock()
+_active_version = {}
+_zero_organic_streak = {}
+_drift_alert_sent = False
+
+
+# --- 1. SELECTOR SETS ---
+def selector_sets(device="desktop"):
+    # Ordered for trying: the last working version first, then the rest in registry order.
+    sets = serp_selectors.SELECTOR_SETS[device]
+    active = _active_version.get(device)
+    return sorted(sets, key=lambda s: s["version"] != active)
+
+
+def readiness_selector(device="desktop"):
+    # Matches the results of ANY known version, or a CAPTCHA - whichever the page has.
+    containers = [s["result_container"] for s in serp_selectors.SELECTOR_SETS[device]]
+    return ", ".join(dict.fromkeys(containers + [serp_selectors.CAPTCHA_IFRAME]))
+
+
+def mark_working(device, selector_set):
+    with _lock:
+        if _active_version.get(device) != selector_set["version"]:
+            logging.info(f"Using '{selector_set['version']}' SERP selectors for {device}.")
+            _active_version[device] = selector_set["version"]
+
+
+# --- 2. DRIFT DETECTION ---
+def observe_page(device, blocks, rank_offset=0, keyword=None, page_url=None):
+    # Called after every page with the blocks of the best selector set. Only
+    # first pages count: deeper pages can legitimately run out of results.
+    global _drift_alert_sent
+    if rank_offset != 0:
+        return
+    with _lock:
+        if serp_parser.organic_count(blocks) > 0:
+            _zero_organic_streak[device] = 0
+            return
+        _zero_organic_streak[device] = _zero_organic_streak.get(device, 0) + 1
+        streak = _zero_organic_streak[device]
+        logging.warning(f"No organic results on page 1 for '{keyword}' ({device}) with any known selector set [{streak}/{config.SELECTOR_DRIFT_THRESHOLD}].")
+        if streak < config.SELECTOR_DRIFT_THRESHOLD:
+            return
+        send_alert = not _drift_alert_sent
+        _drift_alert_sent = True
+
+    versions = ", ".join(s["version"] for s in serp_selectors.SELECTOR_SETS[device])
+    message = f"Selector drift: {streak} keywords in a row returned zero organic results on {device} with every selector set ({versions}). Last keyword: '{keyword}', URL: {page_url}"
+    logging.critical(message)
+    if send_alert:
+        notifications.send_error_email(*notifications.selector_drift_email(device, versions, keyword, page_url, feature_summary=serp_parser.feature_summary(blocks)))
+    raise SelectorDriftError(message)
+
+
+# --- 3. SELENIUM HELPERS ---
+def extract_blocks(driver, device="desktop"):
+    # Returns the blocks of the first selector set that finds organic results
+    # (or of the last set tried, if none do).
+    blocks = []
+    for selector_set in selector_sets(device):
+        blocks = driver.execute_script(serp_parser.EXTRACT_BLOCKS_JS, *serp_parser.extraction_args(selector_set))
+        if serp_parser.organic_count(blocks) > 0:
+            mark_working(device, selector_set)
+            return blocks
+    return blocks
+
+
+def find_next_button(driver, device="desktop"):
+    # Returns the next-page link, or None at the end of the results.
+    for selector_set in selector_sets(device):
+        buttons = driver.find_elements("css selector", selector_set["next_page"])
+        if buttons:
+            return buttons[0]
+    return None
+
+
+# --- 4. PLAYWRIGHT (ASYNC) HELPERS ---
+async def extract_blocks_async(page, device="desktop"):
+    blocks = []
+    for selector_set in selector_sets(device):
+        blocks = await page.evaluate(serp_parser.EXTRACT_BLOCKS_FN, serp_parser.extraction_args(selector_set))
+        if serp_parser.organic_count(blocks) > 0:
+            mark_working(device, selector_set)
+            return blocks
+    return blocks
+
+
+async def find_next_button_async(page, device="desktop"):
+    for selector_set in selector_sets(device):
+        button = await page.query_selector(selector_set["next_page"])
+        if button:
+            return button
+    return None
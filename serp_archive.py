@@ -0,0 +1,328 @@
+# serp_archive.py
+# Keeps the raw HTML (and optionally a screenshot) of every results page, so a
+# rank that looks wrong can be checked against what Google actually showed.
+#
+# Layout under config.SERP_ARCHIVE_PATH:
+#   blobs/ab/<sha256>.zst   page contents, zstd-compressed (.gz when the optional
+#                           'zstandard' package is missing), named by the SHA-256
+#                           of the UNCOMPRESSED bytes - identical pages and
+#                           screenshots are stored once
+#   index.sqlite            one row per archived page, indexed by
+#                           (keyword, run_date, device, page), plus the blob table
+#
+# Retention: pages older than SERP_ARCHIVE_RETENTION_DAYS are dropped, then the
+# oldest days go until the blobs fit in SERP_ARCHIVE_MAX_MB, and blobs no page
+# refers to any more are deleted. It runs once per process, on the first archive.
+#
+# Usage:
+#   python serp_archive.py list "savings account" [--date 2024-05-01] [--device mobile]
+#   python serp_archive.py extract 42 page.html     # HTML of archived page id 42
+#   python serp_archive.py gc                       # apply the retention policy now
+
+import argparse
+import asyncio
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+import config
+import replay
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency: pip install zstandard (falls back to gzip)
+    zstandard = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    raw_bytes INTEGER NOT NULL,
+    stored_bytes INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    keyword TEXT NOT NULL,
+    run_date TEXT NOT NULL,
+    device TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    target TEXT,
+    captured_at TEXT NOT NULL,
+    page_url TEXT,
+    rank_offset INTEGER NOT NULL,
+    html_sha256 TEXT NOT NULL,
+    screenshot_sha256 TEXT,
+    organic_urls TEXT
+);
+CREATE INDEX IF NOT EXISTS pages_lookup ON pages (keyword, run_date, device, page);
+CREATE INDEX IF NOT EXISTS pages_run_date ON pages (run_date);
+CREATE INDEX IF NOT EXISTS pages_keyword_nocase ON pages (keyword COLLATE NOCASE, device, page);
+"""
+
+CODEC_EXTENSIONS = {"zstd": ".zst", "gzip": ".gz"}
+
+_lock = threading.Lock()
+_connection = None
+_retention_applied = False
+
+
+# --- 1. STORAGE ---
+def _connect():
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.join(config.SERP_ARCHIVE_PATH, "blobs"), exist_ok=True)
+        # One connection shared by the worker threads (guarded by _lock); WAL lets
+        # several scripts archive into the same index at once.
+        _connection = sqlite3.connect(os.path.join(config.SERP_ARCHIVE_PATH, "index.sqlite"), timeout=30, check_same_thread=False)
+        _connection.row_factory = sqlite3.Row
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.executescript(SCHEMA)
+    return _connection
+
+
+def _blob_path(sha256, codec):
+    return os.path.join(config.SERP_ARCHIVE_PATH, "blobs", sha256[:2], sha256 + CODEC_EXTENSIONS[codec])
+
+
+def _compress(data):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=config.SERP_ARCHIVE_ZSTD_LEVEL).compress(data)
+    return "gzip", gzip.compress(data, compresslevel=6)
+
+
+def _decompress(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This archive entry is zstd-compressed; pip install zstandard to read it.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def store_blob(data):
+    # Stores the bytes once and returns their SHA-256. Must be called with _lock held.
+    sha256 = hashlib.sha256(data).hexdigest()
+    connection = _connect()
+    if connection.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone():
+        return sha256
+    codec, stored = _compress(data)
+    path = _blob_path(sha256, codec)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"  # another process may be storing the same bytes
+    with open(tmp_path, "wb") as f:
+        f.write(stored)
+    os.replace(tmp_path, path)
+    # OR IGNORE: when another process stored the same bytes since the SELECT,
+    # its row stands and this page still gets archived.
+    connection.execute(
+        "INSERT OR IGNORE INTO blobs (sha256, codec, raw_bytes, stored_bytes, created_at) VALUES (?, ?, ?, ?, ?)",
+        (sha256, codec, len(data), len(stored), datetime.datetime.now().isoformat(timespec="seconds")),
+    )
+    return sha256
+
+
+def read_blob(sha256):
+    with _lock:
+        row = _connect().execute("SELECT codec FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+    if row is None:
+        raise KeyError(f"No archived blob {sha256}")
+    return read_stored(sha256, row["codec"])
+
+
+def read_stored(sha256, codec):
+    # Reads a blob without touching the index (safe in worker processes).
+    with open(_blob_path(sha256, codec), "rb") as f:
+        return _decompress(codec, f.read())
+
+
+# --- 2. ARCHIVING PAGES ---
+def enabled():
+    # Recorded runs (replay.py) archive their pages even with the archive turned off.
+    return config.ENABLE_SERP_ARCHIVE or replay.recording()
+
+
+def archive_page(keyword, device, page, html, screenshot=None, page_url=None, rank_offset=0, organic_urls=None, target=None):
+    # Returns the new page id, or None. Archiving never interrupts a scrape.
+    if not enabled():
+        return None
+    try:
+        apply_retention_once()
+        now = datetime.datetime.now()
+        with _lock:
+            connection = _connect()
+            html_sha256 = store_blob(html.encode("utf-8"))
+            screenshot_sha256 = store_blob(screenshot) if screenshot else None
+            cursor = connection.execute(
+                "INSERT INTO pages (keyword, run_date, device, page, target, captured_at, page_url, rank_offset, html_sha256, screenshot_sha256, organic_urls)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (keyword, now.date().isoformat(), device, page, target, now.isoformat(timespec="seconds"), page_url,
+                 rank_offset, html_sha256, screenshot_sha256, json.dumps(organic_urls) if organic_urls is not None else None),
+            )
+            connection.commit()
+        replay.event("page", keyword=keyword, device=device, target=target, page=page, rank_offset=rank_offset, page_url=page_url,
+                     html_sha256=html_sha256, organic_urls=organic_urls, archive_id=cursor.lastrowid)
+        return cursor.lastrowid
+    except Exception as e:
+        logging.warning(f"Could not archive page {page} of '{keyword}': {e}")
+        return None
+
+
+def archive_driver_page(driver, keyword, device, rank_offset, organic_urls=None, target=None):
+    # Selenium: archives the page the driver is on.
+    if not enabled():
+        return None
+    try:
+        html = driver.page_source
+        screenshot = driver.get_screenshot_as_png() if config.ARCHIVE_SCREENSHOTS else None
+        page_url = driver.current_url
+    except Exception as e:
+        logging.warning(f"Could not read the page for the archive: {e}")
+        return None
+    return archive_page(keyword, device, rank_offset // 10 + 1, html, screenshot, page_url, rank_offset, organic_urls, target)
+
+
+async def archive_playwright_page(page, keyword, device, rank_offset, organic_urls=None, target=None):
+    # Playwright: the compression and SQLite work runs off the event loop.
+    if not enabled():
+        return None
+    try:
+        html = await page.content()
+        screenshot = await page.screenshot(full_page=True) if config.ARCHIVE_SCREENSHOTS else None
+    except Exception as e:
+        logging.warning(f"Could not read the page for the archive: {e}")
+        return None
+    return await asyncio.to_thread(archive_page, keyword, device, rank_offset // 10 + 1, html, screenshot, page.url, rank_offset, organic_urls, target)
+
+
+# --- 3. LOOKUP ---
+def find_pages(keyword=None, run_date=None, device=None, page=None):
+    # Archived pages matching the given fields, newest first. The keyword matches
+    # in any case: the sheet's spelling is archived, queries may differ.
+    clauses, params = [], []
+    for column, value in (("keyword", keyword), ("run_date", run_date), ("device", device), ("page", page)):
+        if value is not None:
+            clauses.append(f"{column} = ? COLLATE NOCASE" if column == "keyword" else f"{column} = ?")
+            params.append(value)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with _lock:
+        rows = _connect().execute(f"SELECT * FROM pages {where} ORDER BY captured_at DESC, id DESC", params).fetchall()
+    pages = []
+    for row in rows:
+        entry = dict(row)
+        entry["organic_urls"] = json.loads(entry["organic_urls"]) if entry["organic_urls"] else None
+        pages.append(entry)
+    return pages
+
+
+def get_page(page_id):
+    with _lock:
+        row = _connect().execute("SELECT * FROM pages WHERE id = ?", (page_id,)).fetchone()
+    if row is None:
+        raise KeyError(f"No archived page with id {page_id}")
+    entry = dict(row)
+    entry["organic_urls"] = json.loads(entry["organic_urls"]) if entry["organic_urls"] else None
+    return entry
+
+
+def load_html(page_id):
+    return read_blob(get_page(page_id)["html_sha256"]).decode("utf-8")
+
+
+def load_screenshot(page_id):
+    sha256 = get_page(page_id)["screenshot_sha256"]
+    return read_blob(sha256) if sha256 else None
+
+
+# --- 4. RETENTION ---
+def apply_retention(retention_days=None, max_mb=None):
+    # Returns (pages removed, blobs removed).
+    retention_days = config.SERP_ARCHIVE_RETENTION_DAYS if retention_days is None else retention_days
+    max_bytes = (config.SERP_ARCHIVE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+    cutoff = (datetime.date.today() - datetime.timedelta(days=retention_days)).isoformat()
+    with _lock:
+        connection = _connect()
+        pages_removed = connection.execute("DELETE FROM pages WHERE run_date < ?", (cutoff,)).rowcount
+
+        # Still over the size budget: drop whole days, oldest first (never today).
+        today = datetime.date.today().isoformat()
+        while True:
+            total = connection.execute(
+                "SELECT COALESCE(SUM(stored_bytes), 0) FROM blobs WHERE sha256 IN"
+                " (SELECT html_sha256 FROM pages UNION SELECT screenshot_sha256 FROM pages)"
+            ).fetchone()[0]
+            oldest = connection.execute("SELECT MIN(run_date) FROM pages").fetchone()[0]
+            if total <= max_bytes or oldest is None or oldest >= today:
+                break
+            pages_removed += connection.execute("DELETE FROM pages WHERE run_date = ?", (oldest,)).rowcount
+
+        orphans = connection.execute(
+            "SELECT sha256, codec FROM blobs WHERE sha256 NOT IN"
+            " (SELECT html_sha256 FROM pages UNION SELECT screenshot_sha256 FROM pages WHERE screenshot_sha256 IS NOT NULL)"
+        ).fetchall()
+        for orphan in orphans:
+            try:
+                os.remove(_blob_path(orphan["sha256"], orphan["codec"]))
+            except FileNotFoundError:
+                pass
+            connection.execute("DELETE FROM blobs WHERE sha256 = ?", (orphan["sha256"],))
+        connection.commit()
+    if pages_removed or orphans:
+        logging.info(f"SERP archive retention: removed {pages_removed} page(s) and {len(orphans)} blob(s).")
+    return pages_removed, len(orphans)
+
+
+def apply_retention_once():
+    global _retention_applied
+    if not _retention_applied:
+        _retention_applied = True
+        apply_retention()
+
+
+def stats():
+    with _lock:
+        connection = _connect()
+        pages = connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        blobs, raw, stored = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(stored_bytes), 0) FROM blobs"
+        ).fetchone()
+    return {"pages": pages, "blobs": blobs, "raw_bytes": raw, "stored_bytes": stored}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Inspect and prune the archive of raw SERP pages.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_parser = sub.add_parser("list", help="List archived pages of a keyword.")
+    list_parser.add_argument("keyword")
+    list_parser.add_argument("--date", help="Run date, YYYY-MM-DD.")
+    list_parser.add_argument("--device", choices=["desktop", "mobile"])
+    list_parser.add_argument("--page", type=int)
+    extract_parser = sub.add_parser("extract", help="Write the HTML (and screenshot) of an archived page to disk.")
+    extract_parser.add_argument("page_id", type=int)
+    extract_parser.add_argument("output", help="Path of the .html file to write.")
+    sub.add_parser("gc", help="Apply the retention policy now.")
+    sub.add_parser("stats", help="Show the archive size and deduplication.")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for entry in find_pages(args.keyword, args.date, args.device, args.page):
+            print(f"{entry['id']:>6}  {entry['captured_at']}  {entry['device']:<7}  page {entry['page']}  {entry['page_url']}")
+    elif args.command == "extract":
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(load_html(args.page_id))
+        screenshot = load_screenshot(args.page_id)
+        if screenshot:
+            with open(os.path.splitext(args.output)[0] + ".png", "wb") as f:
+                f.write(screenshot)
+        print(f"Wrote {args.output}")
+    elif args.command == "gc":
+        apply_retention()
+    elif args.command == "stats":
+        summary = stats()
+        ratio = summary["raw_bytes"] / summary["stored_bytes"] if summary["stored_bytes"] else 0
+        print(f"{summary['pages']} pages, {summary['blobs']} distinct blobs, {summary['stored_bytes'] / 1024 / 1024:.1f} MB on disk ({ratio:.1f}x compression)")
@@ -0,0 +1,200 @@
+# serp_parser.py
+# Engine-independent SERP extraction and rank matching.
+# Both the Selenium scripts and the asyncio engine run the same extraction
+# script in the page and the same matching rules, so they report identical ranks.
+#
+# The extraction is ONE pass over the page that tags every result block with
+# its SERP feature type and records where it is:
+#   type            "ad", "featured_snippet", "local_pack", "paa", "organic" or "other"
+#   absolute_rank   position among ALL blocks on the page (ads and features included)
+#   organic_rank    position among organic results only (None for other blocks)
+#   top / height    pixel offset from the top of the document, and block height
+#   url, title      first link and h3 text of the block
+
+import urllib.parse
+from collections import Counter
+
+import config
+import serp_selectors
+import offline_dom
+
+NOT_FOUND = "Not Found"
+# NOT_FOUND as an integer rank (rank_records.py, rank_analytics.py).
+NOT_FOUND_RANK = 0
+
+FEATURE_TYPES = ("ad", "featured_snippet", "local_pack", "paa", "organic", "other")
+
+EXTRACT_BLOCKS_JS = """
+const [sel, countSnippetAsOrganic] = arguments;
+const classify = (el) => {
+    if (el.matches(sel.ad) || el.querySelector(sel.ad)) return "ad";
+    if (el.querySelector(sel.featuredSnippet)) return "featured_snippet";
+    if (el.querySelector(sel.localPack)) return "local_pack";
+    if (el.querySelector(sel.paa)) return "paa";
+    return "organic";
+};
+const blocks = [];
+const seen = [];
+let absoluteRank = 0;
+let organicRank = 0;
+for (const el of document.querySelectorAll(sel.container + ", " + sel.adBlock)) {
+    if (seen.some((outer) => outer.contains(el))) continue;
+    seen.push(el);
+    const h3 = el.querySelector("h3");
+    const title = h3 ? h3.innerText.trim() : "";
+    let type = classify(el);
+    if (type === "organic" && !title) type = "other";
+    const link = el.querySelector(sel.link);
+    const rect = el.getBoundingClientRect();
+    absoluteRank += 1;
+    const countsAsOrganic = type === "organic" || (type === "featured_snippet" && countSnippetAsOrganic && title);
+    blocks.push({
+        type: type,
+        absolute_rank: absoluteRank,
+        organic_rank: countsAsOrganic ? ++organicRank : null,
+        top: Math.round(rect.top + window.scrollY),
+        height: Math.round(rect.height),
+        url: link && link.href ? link.href : null,
+        title: title,
+    });
+}
+return blocks;
+"""
+
+# Playwright's page.evaluate() takes a function rather than a script body.
+EXTRACT_BLOCKS_FN = "(args) => (function() {" + EXTRACT_BLOCKS_JS + "}).apply(null, args)"
+
+
+def extraction_args(selector_set=None):
+    # selector_set is one entry of serp_selectors.SELECTOR_SETS (default: newest desktop set).
+    selector_set = selector_set or serp_selectors.SELECTOR_SETS["desktop"][0]
+    selectors = {
+        "container": selector_set["result_container"],
+        "link": selector_set["link"],
+        "ad": selector_set["ad"],
+        "adBlock": selector_set["ad_block"],
+        "paa": selector_set["paa"],
+        "localPack": selector_set["local_pack"],
+        "featuredSnippet": selector_set["featured_snippet"],
+    }
+    return [selectors, config.COUNT_FEATURED_SNIPPET_AS_ORGANIC]
+
+
+def organic_count(blocks):
+    return sum(1 for b in blocks if b["organic_rank"] is not None)
+
+
+# --- 1. OFFLINE PARSER ---
+# The same classification as EXTRACT_BLOCKS_JS, run on raw HTML (HTTP responses,
+# archived pages). There is no layout offline, so top/height are None.
+def resolve_result_url(href, base_url=None):
+    if not href:
+        return None
+    url = urllib.parse.urljoin(base_url or config.SEARCH_URL, href)
+    parsed = urllib.parse.urlparse(url)
+    if parsed.path == "/url":
+        # Non-JS result links go through Google's redirector: /url?q=<target>&sa=...
+        query = urllib.parse.parse_qs(parsed.query)
+        target = (query.get("q") or query.get("url") or [None])[0]
+        if target and target.startswith("http"):
+            return target
+    return url
+
+
+def parse_html(html, selector_set=None, base_url=None):
+    selector_set = selector_set or serp_selectors.SELECTOR_SETS["desktop"][0]
+    count_snippet_as_organic = config.COUNT_FEATURED_SNIPPET_AS_ORGANIC
+    root = offline_dom.parse(html) if isinstance(html, str) else html
+
+    def classify(el):
+        if el.matches(selector_set["ad"]) or el.select_one(selector_set["ad"]):
+            return "ad"
+        if el.select_one(selector_set["featured_snippet"]):
+            return "featured_snippet"
+        if el.select_one(selector_set["local_pack"]):
+            return "local_pack"
+        if el.select_one(selector_set["paa"]):
+            return "paa"
+        return "organic"
+
+    blocks = []
+    seen = []
+    organic_rank = 0
+    for el in root.select(f"{selector_set['result_container']}, {selector_set['ad_block']}"):
+        if any(outer.contains(el) for outer in seen):
+            continue
+        seen.append(el)
+        h3 = el.select_one("h3")
+        title = h3.text() if h3 else ""
+        block_type = classify(el)
+        if block_type == "organic" and not title:
+            block_type = "other"
+        link = el.select_one(selector_set["link"])
+        counts_as_organic = block_type == "organic" or (block_type == "featured_snippet" and count_snippet_as_organic and title)
+        if counts_as_organic:
+            organic_rank += 1
+        blocks.append({
+            "type": block_type,
+            "absolute_rank": len(blocks) + 1,
+            "organic_rank": organic_rank if counts_as_organic else None,
+            "top": None,
+            "height": None,
+            "url": resolve_result_url(link.get("href"), base_url) if link else None,
+            "title": title,
+        })
+    return blocks
+
+
+def parse_html_with_fallback(html, device="desktop", base_url=None):
+    # Tries each selector set for the device until one finds organic results.
+    # Returns (blocks, selector_set), or ([], None) when none matches.
+    root = offline_dom.parse(html)
+    for selector_set in serp_selectors.SELECTOR_SETS[device]:
+        blocks = parse_html(root, selector_set, base_url)
+        if organic_count(blocks) > 0:
+            return blocks, selector_set
+    return [], None
+
+
+# --- 2. BLOCK HELPERS ---
+def organic_urls(blocks):
+    # The ordered organic results, as match_ranks() expects them.
+    ordered = sorted((b for b in blocks if b["organic_rank"] is not None), key=lambda b: b["organic_rank"])
+    return [b["url"] for b in ordered]
+
+
+def feature_summary(blocks):
+    counts = Counter(b["type"] for b in blocks)
+    return ", ".join(f"{counts[t]} {t}" for t in FEATURE_TYPES if counts[t]) or "no result blocks"
+
+
+def competitor_positions(blocks, competitor_urls, rank_offset=0, absolute_offset=0):
+    # Where each competitor first appears on this page, including in ads and features.
+    positions = {}
+    for block in blocks:
+        if not block["url"]:
+            continue
+        for competitor_url in competitor_urls:
+            if competitor_url and competitor_url in block["url"] and competitor_url not in positions:
+                positions[competitor_url] = {
+                    "type": block["type"],
+                    "absolute_rank": block["absolute_rank"] + absolute_offset,
+                    "organic_rank": block["organic_rank"] + rank_offset if block["organic_rank"] is not None else None,
+                    "top": block["top"],
+                }
+    return positions
+
+
+# --- 3. RANK MATCHING ---
+def match_ranks(result_urls, competitor_urls, rank_offset=0):
+    # Same rule as find_competitor_ranks(): a competitor ranks at the first
+    # organic result whose URL contains the competitor URL. Returns one int per
+    # competitor URL, in order (NOT_FOUND_RANK when it is not on the page).
+    ranks = [NOT_FOUND_RANK] * len(competitor_urls)
+    for rank, url in enumerate(result_urls, start=1 + rank_offset):
+        if not url:
+            continue
+        for i, competitor_url in enumerate(competitor_urls):
+            if ranks[i] == NOT_FOUND_RANK and competitor_url in url:
+                ranks[i] = rank
+    return ranks
@@ -28,11 +28,19 @@
 # This is the most reliable way to isolate only the organic blue-link results.
 RESULT_CONTAINER = "div.MjjYud"
 
-# This selector is no longer needed because we will use a more robust filtering method.
-# AD_SELECTOR = "[data-text-ad]" # We will not use this directly anymore.
+# --- SERP FEATURE SELECTORS (used by serp_parser.py to tag each block) ---
+# An Ad block, inside a result container or in the top/bottom ad areas.
+AD_SELECTOR = "[data-text-ad]"
+AD_BLOCK = "#tads [data-text-ad], #tadsb [data-text-ad]"
 
-# This selector is also no longer needed.
-# PAA_SELECTOR = "div.related-question-pair" # We will not use this directly anymore.
+# A "People Also Ask" block.
+PAA_SELECTOR = "div.related-question-pair"
+
+# The map "local pack": its place cards, or its "More places" link.
+LOCAL_PACK_SELECTOR = 'div.VkpGBb, a[href*="tbm=lcl"]'
+
+# A featured snippet (the answer box above the blue links).
+FEATURED_SNIPPET_SELECTOR = "div.c2xzTb, div.ifM9O, block-component"
 
 # This is the selector for the clickable link within a result block.
 # It remains the same.
@@ -42,4 +50,38 @@ LINK_CONTAINER = "a"
 NEXT_PAGE_BUTTON = "#pnnext"
 
 # The selector for the "More results" button found on mobile SERPs.
-MOBILE_NEXT_PAGE_BUTTON_SELECTOR = 'a[aria-label="More results"]'
\ No newline at end of file
+# Not used for paging: it appends the next results to the SAME document, so
+# there is no new page to wait for and the offsets of the re-read blocks are off.
+MOBILE_NEXT_PAGE_BUTTON_SELECTOR = 'a[aria-label="More results"]'
+# Pagers that load a new document, for mobile too.
+NAVIGATING_NEXT_PAGE_BUTTON = f'{NEXT_PAGE_BUTTON}, a[aria-label="Next page"]'
+
+# The reCAPTCHA challenge iframe shown by Google's security check.
+CAPTCHA_IFRAME = 'iframe[title="reCAPTCHA"]'
+
+# --- VERSIONED SELECTOR REGISTRY (used by selector_registry.py) ---
+# Ordered fallback sets per device, newest markup first. When the first set finds
+# no organic results, the next one is tried; when none do, that is markup drift.
+# To support new Google markup, add a set at the TOP of the device's list.
+_FEATURE_SELECTORS = {
+    "ad": AD_SELECTOR,
+    "ad_block": AD_BLOCK,
+    "paa": PAA_SELECTOR,
+    "local_pack": LOCAL_PACK_SELECTOR,
+    "featured_snippet": FEATURED_SNIPPET_SELECTOR,
+}
+
+SELECTOR_SETS = {
+    "desktop": [
+        dict(_FEATURE_SELECTORS, version="2024-desktop", result_container=RESULT_CONTAINER, link=LINK_CONTAINER,
+             next_page=NEXT_PAGE_BUTTON),
+        dict(_FEATURE_SELECTORS, version="2022-desktop", result_container="div.g", link="div.yuRUbf a, a",
+             next_page='a[aria-label="Next page"], a#pnnext'),
+    ],
+    "mobile": [
+        dict(_FEATURE_SELECTORS, version="2024-mobile", result_container=RESULT_CONTAINER, link=LINK_CONTAINER,
+             next_page=NAVIGATING_NEXT_PAGE_BUTTON),
+        dict(_FEATURE_SELECTORS, version="2022-mobile", result_container="div.mnr-c, div.xpd", link="a",
+             next_page=NAVIGATING_NEXT_PAGE_BUTTON),
+    ],
+}
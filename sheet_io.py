@@ -0,0 +1,66 @@
+# sheet_io.py
+# Google Sheets helpers shared by the newer entry points (async engine, tools).
+# Mirrors connect_to_gsheet()/get_data_from_sheet() from the Selenium scripts.
+
+import logging
+
+import pandas as pd
+import gspread
+from gspread.cell import Cell
+from oauth2client.service_account import ServiceAccountCredentials
+
+import config
+import fetch_planner
+
+
+def connect_to_gsheet(worksheet_name=None):
+    logging.info(f"Connecting to Google Sheet: '{config.SHEET_NAME}'")
+    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+    creds = ServiceAccountCredentials.from_json_keyfile_name(config.GCP_CREDENTIALS_PATH, scope)
+    client = gspread.authorize(creds)
+    sheet = client.open(config.SHEET_NAME).worksheet(worksheet_name or config.WORKSHEET_NAME)
+    logging.info("Successfully connected to Google Sheet.")
+    return sheet
+
+
+def get_data_from_sheet(sheet):
+    logging.info("Fetching data from the worksheet...")
+    if hasattr(sheet, "to_dataframe"):
+        df = sheet.to_dataframe()  # storage.LocalWorksheet: skip the round trip through records
+    else:
+        df = pd.DataFrame(sheet.get_all_records())
+    df['original_index'] = df.index + 2
+    logging.info(f"Successfully fetched {len(df)} keywords.")
+    return df
+
+
+def competitors_for_row(row):
+    # {'ICICI': {'url': ..., 'col': 6}, ...} exactly like the scripts build it.
+    return {name: {'url': row[spec['url_column']], 'col': spec['col']} for name, spec in config.COMPETITORS.items()}
+
+
+def write_cells(worksheet, cells):
+    # cells: [(row, col, value), ...] written in ONE request instead of one per cell.
+    if not cells:
+        return
+    if isinstance(worksheet, gspread.Worksheet):
+        worksheet.update_cells([Cell(row, col, value) for row, col, value in cells])
+    else:
+        for row, col, value in cells:  # storage.LocalWorksheet buffers these itself
+            worksheet.update_cell(row, col, value)
+    logging.info(f"Wrote {len(cells)} cells to '{worksheet.title}'.")
+
+
+def write_job_ranks(worksheet, job, ranks):
+    # A fetch_planner.KeywordJob's ranks, to every row of its keyword, in one request.
+    write_cells(worksheet, fetch_planner.fan_out(job, ranks))
+
+
+def get_or_create_worksheet_copy(base_worksheet, title):
+    # A per-target results sheet with the same layout (and row numbers) as the base sheet.
+    spreadsheet = base_worksheet.spreadsheet
+    try:
+        return spreadsheet.worksheet(title)
+    except gspread.exceptions.WorksheetNotFound:
+        logging.info(f"Creating worksheet '{title}' as a copy of '{base_worksheet.title}'.")
+        return base_worksheet.duplicate(new_sheet_name=title)
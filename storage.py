@@ -0,0 +1,197 @@
+# storage.py
+# Where keywords are read from and ranks are written to.
+#
+# config.STORAGE_BACKEND = "sheets" talks to Google Sheets on every read and
+# write, as the scripts always have. "local" uses a CSV or Parquet file with
+# the sheet's layout instead. The default file name is what Sheets' own
+# "Download as CSV" produces: "<SHEET_NAME> - <worksheet>.csv" in
+# config.LOCAL_DATA_DIR. No network is needed and there are no quotas.
+#
+# A LocalWorksheet answers get_all_records()/update_cell() like a gspread
+# worksheet, so sheet_io.get_data_from_sheet() and write_cells() work unchanged.
+# - Reads are memory-mapped (pandas memory_map=True / pyarrow memory_map=True).
+# - Writes are buffered in memory. The file is rewritten atomically (temp file
+#   + os.replace) every LOCAL_FLUSH_EVERY cells, and again when the process
+#   exits. A crash therefore never leaves a half-written file behind.
+#
+# Usage:
+#   python storage.py pull                     # Sheet -> local file (to start working offline)
+#   python storage.py sync                     # local ranks -> Sheet, one batch request
+#   python storage.py sync --worksheet "Ranking - in-en-mobile"
+
+import argparse
+import atexit
+import logging
+import os
+import threading
+
+import pandas as pd
+
+import config
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Optional dependency: pip install pyarrow (only for LOCAL_DATA_FORMAT = "parquet")
+    pa = None
+    pq = None
+
+_open_worksheets = []
+
+
+# --- 1. LOCAL FILES ---
+def local_path(worksheet_name=None):
+    title = worksheet_name or config.WORKSHEET_NAME
+    return os.path.join(config.LOCAL_DATA_DIR, f"{config.SHEET_NAME} - {title}.{config.LOCAL_DATA_FORMAT}")
+
+
+def read_table(path):
+    # Every cell as a string, blanks as "", exactly as the sheet shows them.
+    if path.endswith(".parquet"):
+        if pq is None:
+            raise RuntimeError("Reading Parquet needs pyarrow: pip install pyarrow")
+        return pq.read_table(path, memory_map=True).to_pandas().fillna("").astype(str)
+    return pd.read_csv(path, dtype=str, keep_default_na=False, memory_map=True)
+
+
+def write_table(df, path):
+    # Atomic: readers see the old file or the new one, never a partial write.
+    tmp_path = f"{path}.tmp"
+    if path.endswith(".parquet"):
+        if pq is None:
+            raise RuntimeError("Writing Parquet needs pyarrow: pip install pyarrow")
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    else:
+        df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+class LocalWorksheet:
+    # The subset of gspread.Worksheet the scripts use, backed by a local file.
+
+    def __init__(self, path, title=None):
+        self.path = path
+        self.title = title or config.WORKSHEET_NAME
+        self._df = read_table(path)
+        self._lock = threading.Lock()
+        self._pending = 0
+        _open_worksheets.append(self)
+
+    def get_all_records(self):
+        return self._df.to_dict("records")
+
+    def to_dataframe(self):
+        return self._df.copy()
+
+    def update_cell(self, row, col, value):
+        # row/col are 1-based sheet coordinates; row 1 is the header.
+        if not 2 <= row < len(self._df) + 2 or not 1 <= col <= len(self._df.columns):
+            raise IndexError(f"Cell ({row}, {col}) is outside '{self.path}'.")
+        with self._lock:
+            self._df.iat[row - 2, col - 1] = str(value)
+            self._pending += 1
+            if self._pending >= config.LOCAL_FLUSH_EVERY:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._pending:
+            write_table(self._df, self.path)
+            self._pending = 0
+
+    def copy_as(self, title):
+        # Local equivalent of duplicating the worksheet (see worksheet_copy()).
+        path = local_path(title)
+        if not os.path.exists(path):
+            logging.info(f"Creating '{path}' as a copy of '{self.path}'.")
+            self.flush()
+            write_table(self._df, path)
+        return LocalWorksheet(path, title)
+
+
+def flush_all():
+    for worksheet in _open_worksheets:
+        try:
+            worksheet.flush()
+        except Exception as e:
+            logging.error(f"Could not save '{worksheet.path}': {e}")
+
+
+atexit.register(flush_all)
+
+
+# --- 2. BACKEND SELECTION ---
+def is_local():
+    return config.STORAGE_BACKEND == "local"
+
+
+def open_worksheet(worksheet_name=None):
+    if is_local():
+        path = local_path(worksheet_name)
+        logging.info(f"Using local storage: '{path}'")
+        return LocalWorksheet(path, worksheet_name)
+    import sheet_io
+    return sheet_io.connect_to_gsheet(worksheet_name)
+
+
+def worksheet_copy(base_worksheet, title):
+    # A per-target results table with the same layout and row numbers as the base one.
+    if isinstance(base_worksheet, LocalWorksheet):
+        return base_worksheet.copy_as(title)
+    import sheet_io
+    return sheet_io.get_or_create_worksheet_copy(base_worksheet, title)
+
+
+# --- 3. SYNC WITH GOOGLE SHEETS ---
+def rank_columns():
+    return sorted(spec['col'] for spec in config.COMPETITORS.values())
+
+
+def pull_from_sheets(worksheet_name=None):
+    # Downloads the worksheet into its local file.
+    import sheet_io
+    sheet = sheet_io.connect_to_gsheet(worksheet_name)
+    values = sheet.get_all_values()
+    df = pd.DataFrame(values[1:], columns=values[0])
+    path = local_path(worksheet_name)
+    write_table(df, path)
+    logging.info(f"Saved {len(df)} rows to '{path}'.")
+    return path
+
+
+def sync_to_sheets(worksheet_name=None):
+    # Pushes the local rank columns to the sheet in ONE request instead of one
+    # update_cell() per rank. Rows are matched by position, so the keywords must line up.
+    import sheet_io
+    from gspread.utils import rowcol_to_a1
+
+    title = worksheet_name or config.WORKSHEET_NAME
+    local = LocalWorksheet(local_path(title), title).to_dataframe()
+    base = sheet_io.connect_to_gsheet()
+    sheet = base if title == config.WORKSHEET_NAME else sheet_io.get_or_create_worksheet_copy(base, title)
+
+    remote_keywords = sheet.col_values(1)[1:]
+    local_keywords = list(local.iloc[:, 0])
+    if remote_keywords != local_keywords:
+        raise ValueError(f"The keywords in '{title}' differ from the local file; run 'python storage.py pull' first.")
+
+    first_col, last_col = rank_columns()[0], rank_columns()[-1]
+    values = local.iloc[:, first_col - 1:last_col].values.tolist()
+    cell_range = f"{rowcol_to_a1(2, first_col)}:{rowcol_to_a1(len(local) + 1, last_col)}"
+    sheet.batch_update([{"range": cell_range, "values": values}])
+    logging.info(f"Synced {len(values)} rows of ranks ({cell_range}) to '{title}'.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Move keyword data and ranks between Google Sheets and the local file.")
+    parser.add_argument("command", choices=["pull", "sync"])
+    parser.add_argument("--worksheet", default=None, help=f"Worksheet title (default: '{config.WORKSHEET_NAME}').")
+    args = parser.parse_args()
+    if args.command == "pull":
+        pull_from_sheets(args.worksheet)
+    else:
+        sync_to_sheets(args.worksheet)
@@ -0,0 +1,23 @@
+# conftest.py
+# The modules are flat scripts in the project root; make them importable.
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    # serp_archive on an empty archive in tmp_path, with its shared connection reset.
+    import config
+    import serp_archive
+    monkeypatch.setattr(config, "SERP_ARCHIVE_PATH", str(tmp_path / "SERP-Archive"))
+    monkeypatch.setattr(config, "ENABLE_SERP_ARCHIVE", True)
+    monkeypatch.setattr(serp_archive, "_connection", None)
+    monkeypatch.setattr(serp_archive, "_retention_applied", True)
+    yield serp_archive
+    if serp_archive._connection is not None:
+        serp_archive._connection.close()
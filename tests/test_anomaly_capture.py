@@ -0,0 +1,100 @@
+# test_anomaly_capture.py
+# Which pages count as anomalies, and the evidence saved for them.
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import anomaly_capture
+import config
+import fetch_planner
+import rank_analytics
+import search_targets
+
+NOT_FOUND = anomaly_capture.rank_records.NOT_FOUND_RANK
+DESKTOP = search_targets.default_target("desktop")
+US = search_targets.make_target("us", "en")
+
+
+@pytest.fixture(autouse=True)
+def settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "ENABLE_ANOMALY_CAPTURE", True)
+    monkeypatch.setattr(config, "ANOMALY_CAPTURE_PATH", str(tmp_path / "Anomalies"))
+    monkeypatch.setattr(config, "ANOMALY_RANK_MOVE", 10)
+    monkeypatch.setattr(config, "ANOMALY_MAX_CAPTURES", 50)
+    monkeypatch.setattr(config, "MAX_PAGES_TO_CHECK", 5)
+    monkeypatch.setattr(config, "RANK_HISTORY_PATH", str(tmp_path / "rank_history.csv"))
+    monkeypatch.setattr(anomaly_capture, "_captured", set())
+    monkeypatch.setattr(anomaly_capture, "_last_ranks_by_segment", {})
+
+
+def job(keyword, target=DESKTOP):
+    row = {spec["url_column"]: "" for spec in config.COMPETITORS.values()}
+    row.update({"ICICI URL": "icicibank.com", "Kotak URL": "kotak.com"})
+    return fetch_planner.KeywordJob(keyword, ["icicibank.com", "kotak.com"], target, [row])
+
+
+def test_rank_moves_treat_not_found_as_past_the_last_page():
+    # The floor is 51 with 5 pages checked.
+    previous = {"a": 3, "b": 5, "c": NOT_FOUND, "d": 48, "e": NOT_FOUND}
+    ranks = {"a": 20, "b": 12, "c": 45, "d": NOT_FOUND, "e": 2}
+    assert anomaly_capture.rank_moves(previous, ranks) == [
+        {"url": "a", "previous": "3", "rank": "20"},
+        {"url": "e", "previous": "Not Found", "rank": "2"},
+    ]
+
+
+def test_previous_ranks_come_from_the_newest_snapshot(monkeypatch):
+    for run_id, rank in (("2024-05-01T10-00-00", 9), ("2024-05-02T10-00-00", 4)):
+        snapshot = pd.DataFrame({"keyword": ["Home  Loan"], "competitor": ["ICICI"], "rank": [rank]})
+        rank_analytics.append_history(snapshot, "desktop", run_id)
+    assert anomaly_capture.previous_ranks(job("home loan")) == {"icicibank.com": 4}
+    assert anomaly_capture.previous_ranks(job("home loan", US)) == {}
+    monkeypatch.setattr(config, "ENABLE_ANOMALY_CAPTURE", False)
+    assert anomaly_capture.previous_ranks(job("home loan")) == {}
+
+
+@pytest.mark.parametrize("page_url, html, reason", [
+    ("https://consent.google.com/ml", "", anomaly_capture.CONSENT),
+    ("https://www.google.com/search", '<form action="https://consent.google.com/s">', anomaly_capture.CONSENT),
+    ("https://www.google.com/sorry/index", "", anomaly_capture.CAPTCHA),
+    (None, '<div class="g-recaptcha">', anomaly_capture.CAPTCHA),
+    ("https://www.google.com/search", "<p>No results</p>", anomaly_capture.NO_ORGANIC),
+])
+def test_empty_page_reason(page_url, html, reason):
+    assert anomaly_capture.empty_page_reason(page_url, html) == reason
+
+
+def test_dom_outline_has_markup_but_no_text():
+    html = '<div id="main" class="a b"><h3>Title</h3><br><script>x()</script></div><p>text</p>'
+    assert anomaly_capture.dom_outline(html) == ["div#main.a.b", "  h3", "  br", "  script", "p"]
+
+
+def test_capture_diffs_against_the_same_market(archive):
+    desktop_id = archive.archive_page("home loan", "desktop", 1, '<div class="old"></div>', target=DESKTOP.key)
+    archive.archive_page("home loan", "desktop", 1, '<div class="us"></div>', target=US.key)
+    folder = anomaly_capture.capture_html(anomaly_capture.NO_ORGANIC, "home loan", "desktop", 1, '<div class="new"></div>', target=DESKTOP.key)
+    with open(os.path.join(folder, "info.json")) as f:
+        info = json.load(f)
+    assert info["baseline"]["archive_id"] == desktop_id
+    with open(os.path.join(folder, "dom.diff")) as f:
+        diff = f.read()
+    assert "-div.old" in diff and "+div.new" in diff
+
+
+def test_identical_archived_page_is_no_baseline(archive):
+    html = '<div class="same"></div>'
+    archive.archive_page("home loan", "desktop", 1, html, target=DESKTOP.key)
+    assert anomaly_capture.baseline_page("home loan", "desktop", 1, html, DESKTOP.key) is None
+    folder = anomaly_capture.capture_html(anomaly_capture.CAPTCHA, "home loan", "desktop", 1, html, target=DESKTOP.key)
+    assert not os.path.exists(os.path.join(folder, "dom.diff"))
+
+
+def test_each_anomaly_is_saved_once_and_captures_are_capped(archive, monkeypatch):
+    monkeypatch.setattr(config, "ANOMALY_MAX_CAPTURES", 2)
+    assert anomaly_capture.capture_html(anomaly_capture.CAPTCHA, "home loan", "desktop", 1, "<p></p>")
+    assert anomaly_capture.capture_html(anomaly_capture.CAPTCHA, "home loan", "desktop", 1, "<p></p>") is None
+    assert anomaly_capture.capture_html(anomaly_capture.CAPTCHA, "car loan", "desktop", 1, "<p></p>")
+    assert anomaly_capture.capture_html(anomaly_capture.CAPTCHA, "gold loan", "desktop", 1, "<p></p>") is None
@@ -0,0 +1,64 @@
+# test_context_pool.py
+# ContextPools: one cap on the live contexts of all the markets together.
+
+import asyncio
+
+import config
+import context_pool
+import search_targets
+
+IN = search_targets.make_target("in", "en", "desktop")
+US = search_targets.make_target("us", "en", "desktop")
+
+
+class FakeContext:
+    closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.contexts = []
+
+    async def new_context(self, **options):
+        self.contexts.append(FakeContext())
+        return self.contexts[-1]
+
+    def live(self):
+        return sum(not context.closed for context in self.contexts)
+
+
+def test_other_market_takes_over_an_idle_context():
+    async def run():
+        browser = FakeBrowser()
+        pools = context_pool.ContextPools(browser, size=2)
+        first = await pools.acquire(IN)
+        await pools.acquire(IN)
+        waiting = asyncio.ensure_future(pools.acquire(US))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        await pools.release(IN, first)
+        await waiting
+        assert first.closed
+        assert browser.live() == 2
+
+    asyncio.run(run())
+
+
+def test_idle_context_is_reused_until_used_up(monkeypatch):
+    monkeypatch.setattr(config, "MAX_KEYWORDS_PER_CONTEXT", 2)
+
+    async def run():
+        browser = FakeBrowser()
+        pools = context_pool.ContextPools(browser, size=1)
+        context = await pools.acquire(IN)
+        await pools.release(IN, context)
+        assert await pools.acquire(IN) is context
+        await pools.release(IN, context)
+        fresh = await pools.acquire(IN)
+        assert fresh is not context and context.closed
+        assert browser.live() == 1
+
+    asyncio.run(run())
@@ -0,0 +1,56 @@
+# test_fetch_planner.py
+# One fetch per unique keyword and target, fanned out to every row.
+
+import pandas as pd
+
+import fetch_planner
+import rank_records
+import search_targets
+
+DESKTOP = search_targets.make_target("in", "en", "desktop")
+MOBILE = search_targets.make_target("in", "en", "mobile")
+
+
+def sheet(*rows):
+    # rows: (keyword, ICICI URL, Kotak URL); the other competitors are empty.
+    df = pd.DataFrame([{"Keyword": keyword, "ICICI URL": icici, "Kotak URL": kotak, "HDFC URL": "", "SBI URL": ""}
+                       for keyword, icici, kotak in rows])
+    df["original_index"] = df.index + 2
+    return df
+
+
+def test_one_job_per_keyword_and_target():
+    df = sheet(("Home Loan", "icici.com/a", "kotak.com/a"),
+               ("home  loan", "icici.com/a", "kotak.com/b"),
+               ("car loan", "icici.com/c", ""))
+    jobs = fetch_planner.plan_fetches(df, [0, 1, 2], [DESKTOP, MOBILE])
+    assert [job.keyword for job in jobs[DESKTOP]] == ["Home Loan", "car loan"]
+    assert [job.target for job in jobs[MOBILE]] == [MOBILE, MOBILE]
+    home = jobs[DESKTOP][0]
+    assert home.urls_to_find == ["icici.com/a", "kotak.com/a", "kotak.com/b"]
+    assert len(home.rows) == 2
+    assert jobs[MOBILE][0].urls_to_find is home.urls_to_find
+
+
+def test_rows_outside_the_batch_share_the_fetch():
+    df = sheet(("home loan", "icici.com/a", ""), ("car loan", "icici.com/c", ""), ("Home Loan", "", "kotak.com/a"))
+    jobs = fetch_planner.plan_for_target(df, [0], DESKTOP)
+    assert len(jobs) == 1
+    assert [int(row["original_index"]) for row in jobs[0].rows] == [2, 4]
+
+
+def test_keywords_without_urls_are_skipped():
+    df = sheet(("home loan", "", ""), ("car loan", "icici.com/c", ""))
+    assert [job.keyword for job in fetch_planner.plan_for_target(df, [0, 1], DESKTOP)] == ["car loan"]
+
+
+def test_fan_out_uses_each_rows_own_urls():
+    df = sheet(("home loan", "icici.com/a", "kotak.com/a"), ("home loan", "", "kotak.com/b"))
+    job = fetch_planner.plan_for_target(df, [0], DESKTOP)[0]
+    ranks = rank_records.KeywordRanks(job.urls_to_find)
+    ranks.add_page(["https://www.kotak.com/b", "https://www.icici.com/a"], 0, 1)
+    assert fetch_planner.fan_out(job, ranks) == [
+        (2, 6, "2"),
+        (2, 7, "Not Found"),
+        (3, 7, "1"),
+    ]
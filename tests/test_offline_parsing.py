@@ -0,0 +1,93 @@
+# test_offline_parsing.py
+# The browser-free parsing path: offline_dom, serp_parser.parse_html and http_fetch.classify_response.
+
+from types import SimpleNamespace
+
+import pytest
+
+import config
+import http_fetch
+import offline_dom
+import serp_parser
+
+SERP = """
+<div id="tads"><div data-text-ad><a href="https://ads.example/"><h3>Ad</h3></a></div></div>
+<script>var x = "<div class='MjjYud'><h3>not a result</h3></div>";</script>
+<div class="MjjYud"><a href="/url?q=https://www.icicibank.com/loans&sa=U"><h3>ICICI loans</h3></a></div>
+<div class="MjjYud"><div class="related-question-pair"><h3>Question</h3></div></div>
+<div class="MjjYud"><a href="https://www.hdfcbank.com/"><br><h3>HDFC <b>Bank</b></h3></a></div>
+<div class="MjjYud"><a href="https://no-title.example/">no title</a></div>
+"""
+
+
+@pytest.fixture(autouse=True)
+def no_snippets(monkeypatch):
+    monkeypatch.setattr(config, "COUNT_FEATURED_SNIPPET_AS_ORGANIC", False)
+
+
+def test_selectors():
+    root = offline_dom.parse('<div id="a" class="x y"><p><a href="https://site.example/p" data-k>t</a></p></div><a href="/q">u</a>')
+    assert [n.get("href") for n in root.select("div a")] == ["https://site.example/p"]
+    assert root.select_one("div#a.y").tag == "div"
+    assert len(root.select('a[href^="https"], a[href$="q"]')) == 2
+    assert root.select('a[href*="site"][data-k]')[0].text() == "t"
+    assert root.select("span, div.z") == []
+
+
+def test_tree_survives_void_and_stray_tags():
+    root = offline_dom.parse("<div><img src=x><p>one<br>two</p></span></div><p>three</p>")
+    div, p = root.children
+    assert [n.tag for n in div.children] == ["img", "p"]
+    assert div.text() == "one two"
+    assert p.text() == "three"
+
+
+def test_script_content_is_not_markup():
+    root = offline_dom.parse(SERP)
+    assert "not a result" not in root.text()
+    assert root.select_one("script").children == []
+
+
+def test_parse_html_classifies_and_ranks_blocks():
+    blocks = serp_parser.parse_html(SERP)
+    assert [b["type"] for b in blocks] == ["ad", "organic", "paa", "organic", "other"]
+    assert [b["organic_rank"] for b in blocks] == [None, 1, None, 2, None]
+    assert serp_parser.organic_urls(blocks) == ["https://www.icicibank.com/loans", "https://www.hdfcbank.com/"]
+    assert blocks[3]["title"] == "HDFC Bank"
+
+
+def test_fallback_to_older_markup():
+    html = '<div class="g"><div class="yuRUbf"><a href="https://www.sbi.co.in/"><h3>SBI</h3></a></div></div>'
+    blocks, selector_set = serp_parser.parse_html_with_fallback(html)
+    assert selector_set["version"] == "2022-desktop"
+    assert serp_parser.organic_urls(blocks) == ["https://www.sbi.co.in/"]
+    assert serp_parser.parse_html_with_fallback("<p>nothing here</p>") == ([], None)
+
+
+def test_match_ranks():
+    urls = ["https://a.example/", None, "https://www.kotak.com/x", "https://www.kotak.com/y"]
+    assert serp_parser.match_ranks(urls, ["kotak.com", "icici"], rank_offset=10) == [13, serp_parser.NOT_FOUND_RANK]
+
+
+def response(text, url="https://www.google.com/search?q=x", status_code=200):
+    return SimpleNamespace(text=text, url=url, status_code=status_code)
+
+
+@pytest.mark.parametrize("reply, problem", [
+    (response("", status_code=429), http_fetch.CAPTCHA),
+    (response("", url="https://www.google.com/sorry/index?continue=x"), http_fetch.CAPTCHA),
+    (response('<div class="g-recaptcha"></div>'), http_fetch.CAPTCHA),
+    (response("", url="https://consent.google.com/ml?continue=x"), http_fetch.CONSENT),
+    (response('<form action="https://consent.google.com/save">'), http_fetch.CONSENT),
+    (response("", status_code=500), http_fetch.HTTP_ERROR),
+    (response("<p>no results</p>"), http_fetch.UNPARSEABLE),
+])
+def test_classify_response_problems(reply, problem):
+    assert http_fetch.classify_response(reply) == (problem, [])
+
+
+def test_classify_response_resolves_links_against_the_final_url():
+    html = SERP + '<div class="MjjYud"><a href="/travel/hotels"><h3>Hotels</h3></a></div>'
+    problem, blocks = http_fetch.classify_response(response(html, url="https://www.google.co.in/search?q=x"))
+    assert problem is None
+    assert serp_parser.organic_urls(blocks)[2] == "https://www.google.co.in/travel/hotels"
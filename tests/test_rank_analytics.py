@@ -0,0 +1,68 @@
+# test_rank_analytics.py
+# Typed ranks, the rank history and the movers of a run.
+
+import pandas as pd
+import pytest
+
+import config
+import rank_analytics
+import serp_parser
+
+NOT_FOUND = serp_parser.NOT_FOUND_RANK
+
+
+@pytest.fixture(autouse=True)
+def settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "RANK_HISTORY_PATH", str(tmp_path / "rank_history.csv"))
+    monkeypatch.setattr(config, "MAX_PAGES_TO_CHECK", 5)
+    monkeypatch.setattr(config, "RANK_CHANGE_ALERT_THRESHOLD", 5)
+
+
+def sheet(*rows):
+    # rows: (keyword, ICICI rank cell, Kotak rank cell), in the sheet's column layout.
+    return pd.DataFrame([{"Keyword": keyword, "ICICI URL": "i", "Kotak URL": "k", "HDFC URL": "", "SBI URL": "",
+                          "ICICI Ranking": icici, "Kotak Ranking": kotak, "HDFC Ranking": "", "SBI Ranking": ""}
+                         for keyword, icici, kotak in rows])
+
+
+def ranks_of(current):
+    return {(r.keyword, r.competitor): r.rank for r in current.itertuples(index=False)}
+
+
+def test_to_rank_array():
+    assert rank_analytics.to_rank_array(["3", " 12 ", "Not Found", "", 7]).tolist() == [3, 12, NOT_FOUND, rank_analytics.BLANK_RANK, 7]
+
+
+def test_current_ranks_skips_blanks_and_repeated_keywords():
+    current = rank_analytics.current_ranks(sheet(("home loan", "3", "Not Found"), ("car loan", "", "8"), ("home loan", "1", "1")))
+    assert ranks_of(current) == {("home loan", "ICICI"): 3, ("home loan", "Kotak"): NOT_FOUND, ("car loan", "Kotak"): 8}
+
+
+def test_history_is_kept_per_segment():
+    current = rank_analytics.current_ranks(sheet(("home loan", "3", "4")))
+    rank_analytics.append_history(current, "desktop", "2026-01-01T10:00:00")
+    rank_analytics.append_history(current, "in-en-mobile", "2026-01-01T11:00:00")
+    history = rank_analytics.load_history("desktop")
+    assert history["run_date"].unique().tolist() == ["2026-01-01"]
+    assert history["rank"].tolist() == [3, 4]
+    assert len(rank_analytics.load_history()) == 4
+
+
+def test_analyze_reports_movers_past_the_threshold():
+    previous = rank_analytics.current_ranks(sheet(("home loan", "3", "2"), ("car loan", "9", "Not Found")))
+    rank_analytics.append_history(previous, "desktop", "2026-01-01T10:00:00")
+    current = rank_analytics.current_ranks(sheet(("home loan", "4", "20"), ("car loan", "2", "10")))
+    report = rank_analytics.analyze(current, rank_analytics.load_history("desktop"), "2026-01-02T10:00:00")
+    movers = {(r.keyword, r.competitor): r.change for r in report["movers"].itertuples(index=False)}
+    # Not found counts as rank 51 (5 pages + 1): 51 -> 10 is up 41.
+    assert movers == {("car loan", "Kotak"): 41, ("home loan", "Kotak"): -18, ("car loan", "ICICI"): 7}
+    assert list(report["movers"]["change"].abs()) == [41, 18, 7]
+    assert report["top10_share"].to_dict() == {"ICICI": 1.0, "Kotak": 0.5}
+    assert "Compared with the run of 2026-01-01T10:00:00." in rank_analytics.summary_text(report, "desktop")
+
+
+def test_first_run_has_nothing_to_compare():
+    current = rank_analytics.current_ranks(sheet(("home loan", "3", "4")))
+    report = rank_analytics.analyze(current, rank_analytics.load_history("desktop"), "2026-01-01T10:00:00")
+    assert report["previous_run"] is None
+    assert report["movers"].empty
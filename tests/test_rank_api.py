@@ -0,0 +1,110 @@
+# test_rank_api.py
+# Answers from the SERP archive, and one shared fetch per question.
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import config
+import rank_api
+import search_targets
+
+DESKTOP = search_targets.default_target("desktop")
+US = search_targets.make_target("us", "en")
+ICICI, HDFC = "icicibank.com", "hdfcbank.com"
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(config, "MAX_PAGES_TO_CHECK", 3)
+    monkeypatch.setattr(config, "RANK_API_CACHE_TTL", 900)
+
+
+def capture(archive, keyword, *pages, target=DESKTOP):
+    # Archives one run of result pages; each page is its list of organic URLs.
+    for page, urls in enumerate(pages, start=1):
+        archive.archive_page(keyword, target.device, page, "<p></p>", rank_offset=(page - 1) * 10, organic_urls=urls, target=target.key)
+
+
+def test_settled_capture(archive):
+    capture(archive, "Term Plan", ["https://www.hdfcbank.com/"], ["https://x.example/", "https://www.icicibank.com/"])
+    ranks = rank_api.archived_ranks("term plan", [ICICI, HDFC], DESKTOP)
+    assert ranks.to_dict() == {ICICI: 12, HDFC: 1}
+
+
+def test_unsettled_capture_until_every_page_is_checked(archive):
+    capture(archive, "term plan", ["https://www.hdfcbank.com/"])
+    assert rank_api.archived_ranks("term plan", [ICICI, HDFC], DESKTOP) is None
+    capture(archive, "term plan", ["https://www.hdfcbank.com/"], ["https://x.example/"], ["https://y.example/"])
+    assert rank_api.archived_ranks("term plan", [ICICI, HDFC], DESKTOP).to_dict() == {ICICI: 0, HDFC: 1}
+
+
+def test_newest_capture_of_the_same_market(archive):
+    capture(archive, "term plan", ["https://www.icicibank.com/"])
+    capture(archive, "term plan", ["https://www.hdfcbank.com/", "https://www.icicibank.com/"])
+    capture(archive, "term plan", ["https://www.icicibank.com/", "https://www.hdfcbank.com/"], target=US)
+    assert rank_api.archived_ranks("term plan", [ICICI, HDFC], DESKTOP).to_dict() == {ICICI: 2, HDFC: 1}
+    assert rank_api.archived_ranks("term plan", [ICICI], search_targets.make_target("gb", "en")) is None
+
+
+def test_old_or_incomplete_captures_are_not_used(archive):
+    capture(archive, "term plan", ["https://www.icicibank.com/"])
+    archive._connect().execute("UPDATE pages SET captured_at = '2020-01-01T00:00:00'")
+    assert rank_api.archived_ranks("term plan", [ICICI], DESKTOP) is None
+    capture(archive, "term plan", None)
+    assert rank_api.archived_ranks("term plan", [ICICI], DESKTOP, max_age=10 ** 10) is None
+
+
+@pytest.fixture
+def service(monkeypatch):
+    # A RankService whose fetches take a moment and are counted.
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(rank_api, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    service = rank_api.RankService(concurrency=1)
+    service.fetches = []
+    service.clock = clock
+
+    async def fetch(keyword, urls, target):
+        service.fetches.append(keyword)
+        await asyncio.sleep(0.05)
+        if keyword == "fails":
+            raise RuntimeError("CAPTCHA")
+        return {"keyword": keyword, "target": target.key, "source": "http"}
+
+    service._fetch = fetch
+    yield service
+    service.stop()
+
+
+def rank_at_once(service, *requests):
+    # Starts every (keyword, urls) request before any fetch finishes.
+    async def together():
+        return await asyncio.gather(*(service._rank(keyword, urls, DESKTOP) for keyword, urls in requests))
+    return asyncio.run_coroutine_threadsafe(together(), service.loop).result(timeout=5)
+
+
+def test_concurrent_requests_share_one_fetch(service):
+    answers = rank_at_once(service, ("term plan", [ICICI, HDFC]), ("Term  Plan", [HDFC, ICICI]), ("term plan", [ICICI]))
+    assert service.fetches == ["term plan", "term plan"]
+    assert answers[0] is answers[1] and answers[2] is not answers[0]
+    assert service.rank("TERM PLAN", [HDFC, ICICI], DESKTOP)["source"] == "cache"
+    assert len(service.fetches) == 2
+    assert not service._in_flight
+
+
+def test_failed_fetch_is_not_cached(service):
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            service.rank("fails", [ICICI], DESKTOP)
+    assert service.fetches == ["fails", "fails"]
+    assert not service._in_flight and not service._cache
+
+
+def test_expired_answers_are_fetched_again_and_evicted(service):
+    service.rank("term plan", [ICICI], DESKTOP)
+    service.rank("car loan", [ICICI], US)
+    service.clock.now += config.RANK_API_CACHE_TTL
+    assert service.rank("term plan", [ICICI], DESKTOP)["source"] == "http"
+    assert [key[0] for key in service._cache] == ["term plan"]
+    assert len(service.fetches) == 3
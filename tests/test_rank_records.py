@@ -0,0 +1,30 @@
+# test_rank_records.py
+# KeywordRanks.add_page: the first rank found for a URL is kept.
+
+import rank_records
+
+NOT_FOUND = rank_records.NOT_FOUND_RANK
+
+
+def test_add_page_returns_only_the_new_ranks():
+    ranks = rank_records.KeywordRanks(["icici.com", "kotak.com", "hdfc.com"])
+    assert ranks.add_page(["https://x.com", "https://www.kotak.com/loan"], 0, 1) == {"kotak.com": 2}
+    assert ranks.add_page(["https://www.icici.com/", "https://kotak.com/other"], 10, 2) == {"icici.com": 11}
+    assert list(ranks.ranks) == [11, 2, NOT_FOUND]
+    assert list(ranks.pages) == [2, 1, 0]
+    assert not ranks.all_found()
+
+
+def test_add_page_keeps_the_first_match_on_a_page():
+    ranks = rank_records.KeywordRanks(["icici.com"])
+    ranks.add_page(["https://icici.com/a", "https://icici.com/b"], 0, 1)
+    assert ranks.get("icici.com") == 1
+    assert ranks.all_found()
+
+
+def test_duplicate_and_empty_urls_are_dropped():
+    ranks = rank_records.KeywordRanks(["icici.com", "", "icici.com"])
+    assert ranks.urls == ["icici.com"]
+    assert ranks.add_page(["", "https://icici.com"], 0, 1) == {"icici.com": 2}
+    assert ranks.text("icici.com") == "2"
+    assert ranks.text("kotak.com") == "Not Found"
@@ -0,0 +1,50 @@
+# test_recompute.py
+# Ranks recomputed from archived pages, without the sheet.
+
+import csv
+
+import recompute
+
+
+def archive_serp(archive, keyword, device, pages, target=None):
+    # pages: one list of organic URLs per results page.
+    for page, urls in enumerate(pages, start=1):
+        archive.archive_page(keyword, device, page, f"<html>{keyword} {page} {urls}</html>",
+                             rank_offset=(page - 1) * 10, organic_urls=urls, target=target)
+
+
+def test_iter_serps_groups_pages_and_keeps_the_latest_capture(archive):
+    archive_serp(archive, "home loan", "desktop", [["https://old.com"], ["https://b.com"]], "in-en-desktop")
+    archive_serp(archive, "home loan", "desktop", [["https://new.com"]], "in-en-desktop")
+    serps = list(recompute.iter_serps())
+    assert len(serps) == 1
+    key, pages = serps[0]
+    assert key[0] == "home loan" and key[2:] == ("desktop", "in-en-desktop")
+    assert [(p["page"], p["organic_urls"]) for p in pages] == [(1, '["https://new.com"]'), (2, '["https://b.com"]')]
+
+
+def test_pages_without_a_target_are_the_default_market(archive):
+    archive_serp(archive, "home loan", "mobile", [["https://a.com"]])
+    archive_serp(archive, "home loan", "mobile", [["https://b.com"]], "in-en-mobile")
+    assert [key[3] for key, _ in recompute.iter_serps()] == ["in-en-mobile"]
+
+
+def test_rank_serps_matches_any_spelling_of_the_keyword(archive, monkeypatch):
+    for name in ("_competitors_by_keyword", "_extra_competitors", "_reparse"):
+        monkeypatch.setattr(recompute, name, getattr(recompute, name))  # restored after the test
+    archive_serp(archive, "Home  Loan", "desktop", [["https://x.com", "https://www.icici.com/a"], ["https://kotak.com/b"]], "in-en-desktop")
+    recompute._init_worker({"home loan": [("ICICI", "icici.com/a"), ("Kotak", "kotak.com/b")]}, [("SBI", "sbi.co.in")], False)
+    rows = list(recompute.output_rows(recompute.rank_serps(recompute.iter_serps())))
+    assert [(name, page, rank) for _, _, _, _, name, _, page, rank in rows] == [
+        ("ICICI", 1, "2"), ("Kotak", 2, "11"), ("SBI", 0, "Not Found"),
+    ]
+
+
+def test_recompute_writes_the_rank_table(archive, tmp_path):
+    archive_serp(archive, "home loan", "desktop", [["https://www.icici.com/a"]], "in-en-desktop")
+    archive_serp(archive, "car loan", "desktop", [["https://x.com"]], "in-en-desktop")
+    out = str(tmp_path / "ranks.csv")
+    assert recompute.recompute(out, {"home loan": [("ICICI", "icici.com/a")]}, workers=1) == 1
+    with open(out, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [(r["keyword"], r["target"], r["competitor"], r["rank"]) for r in rows] == [("home loan", "in-en-desktop", "ICICI", "1")]
@@ -0,0 +1,92 @@
+# test_replay.py
+# Seeded runs, recorded timelines, and the offline replay that re-ranks them.
+
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import config
+import replay
+import search_targets
+
+SERP = """
+<div class="MjjYud"><a href="https://www.icicibank.com/loans"><h3>ICICI</h3></a></div>
+<div class="MjjYud"><a href="https://www.hdfcbank.com/"><h3>HDFC</h3></a></div>
+"""
+ICICI, HDFC = "icicibank.com", "hdfcbank.com"
+
+
+@pytest.fixture
+def recording(archive, tmp_path, monkeypatch):
+    # Records into tmp_path; yields the run id.
+    monkeypatch.setattr(config, "RECORD_RUNS", True)
+    monkeypatch.setattr(config, "RECORDINGS_PATH", str(tmp_path / "Recordings"))
+    monkeypatch.setattr(config, "RUN_SEED", 7)
+    monkeypatch.setattr(config, "COUNT_FEATURED_SNIPPET_AS_ORGANIC", False)
+    monkeypatch.setattr(replay, "_recording", None)
+    replay.start_run("test")
+    yield replay.list_recordings()[0]
+    replay._recording["file"].close()
+
+
+def test_seed_repeats_the_random_choices(monkeypatch):
+    monkeypatch.setattr(config, "RUN_SEED", 42)
+    monkeypatch.setattr(config, "RECORD_RUNS", False)
+    replay.start_run("test")
+    first = [random.random() for _ in range(3)]
+    replay.start_run("test")
+    assert [random.random() for _ in range(3)] == first
+
+
+def test_events_without_a_target_are_the_default_market():
+    default = search_targets.default_target("mobile").key
+    assert replay.event_key({"keyword": "term plan", "device": "mobile"}) == ("term plan", "mobile", default)
+    assert replay.event_key({"keyword": "term plan", "device": "mobile", "target": "us-en-mobile"})[2] == "us-en-mobile"
+
+
+def test_matching_replay(recording, archive, capsys):
+    archive.archive_page("term plan", "desktop", 1, SERP, organic_urls=["https://www.icicibank.com/loans", "https://www.hdfcbank.com/"])
+    replay.event("ranks", keyword="term plan", device="desktop", ranks={ICICI: 1, HDFC: 2})
+    assert replay.replay(recording) == 0
+    assert "0 differ" in capsys.readouterr().out
+
+
+def test_rank_and_result_differences(recording, archive, capsys):
+    archive.archive_page("term plan", "desktop", 1, SERP, organic_urls=["https://www.hdfcbank.com/"])
+    replay.event("ranks", keyword="term plan", device="desktop", ranks={ICICI: 0, HDFC: 1})
+    assert replay.replay(recording) == 1
+    out = capsys.readouterr().out
+    assert f"{ICICI}: live Not Found, replay 1" in out
+    assert f"{HDFC}: live 1, replay 2" in out
+    assert "offline parser found 2 organic results, the live page 1" in out
+
+
+def test_retried_keyword_replays_the_last_attempt(recording, archive):
+    archive.archive_page("term plan", "desktop", 1, "<p>CAPTCHA</p>")
+    archive.archive_page("term plan", "desktop", 1, SERP)
+    replay.event("ranks", keyword="term plan", device="desktop", ranks={ICICI: 1, HDFC: 2})
+    pages = replay.keyword_pages(replay.load_recording(recording)[1])
+    assert len(pages[replay.event_key({"keyword": "term plan", "device": "desktop"})]) == 1
+    assert replay.replay(recording) == 0
+
+
+def test_pages_gone_from_the_archive_are_not_found(recording, capsys):
+    replay.event("page", keyword="term plan", device="desktop", page=1, rank_offset=0, html_sha256="0" * 64)
+    replay.event("ranks", keyword="term plan", device="desktop", ranks={ICICI: 3})
+    assert replay.replay(recording, only_keyword="term plan") == 1
+    out = capsys.readouterr().out
+    assert "page 1: HTML no longer in the archive" in out
+    assert f"{ICICI}: live 3, replay Not Found" in out
+
+
+def test_timing_of_a_run_that_stopped_at_once(recording, capsys, monkeypatch):
+    start = replay._recording["start"]
+    monkeypatch.setattr(replay, "time", SimpleNamespace(monotonic=lambda: start, perf_counter=time.perf_counter))
+    replay.event("pause", step="before_search", seconds=0)
+    replay.event("ranks", keyword="term plan", device="desktop", ranks={})
+    replay.timing(recording)
+    out = capsys.readouterr().out
+    assert "1 keywords, 0 SERP pages, seed 7" in out
+    assert "(-)" in out
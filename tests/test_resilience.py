@@ -0,0 +1,104 @@
+# test_resilience.py
+# Retries with backoff, and circuit breakers that restart only the broken component.
+
+import pytest
+
+import config
+import resilience
+
+
+@pytest.fixture(autouse=True)
+def no_waiting(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(resilience.time, "sleep", sleeps.append)
+    monkeypatch.setattr(config, "RETRY_POLICIES", {"test": {"attempts": 3, "base_delay": 1, "max_delay": 4}})
+    monkeypatch.setattr(config, "BREAKER_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(config, "BREAKER_MAX_RESTARTS", 2)
+    monkeypatch.setattr(config, "BREAKER_RESTART_DECAY", 3)
+    monkeypatch.setattr(config, "BREAKER_COOLDOWN", 0)
+    return sleeps
+
+
+class Flaky:
+    # Fails with the given errors, then returns "ok".
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, component=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+class RateLimited(Exception):
+    class response:
+        status_code = 429
+
+
+class NoSuchElementException(Exception):
+    pass
+
+
+def counting_breaker():
+    built = []
+    return resilience.Breaker("browser", lambda: built.append(len(built)) or f"browser {len(built)}",
+                              is_broken=resilience.is_dead_session), built
+
+
+def test_retries_with_growing_capped_backoff(no_waiting):
+    operation = Flaky(ValueError("a"), ValueError("b"))
+    assert resilience.call("test", operation) == "ok"
+    assert operation.calls == 3
+    assert 0.5 <= no_waiting[0] <= 1 and 1 <= no_waiting[1] <= 2
+
+
+def test_last_error_is_raised():
+    with pytest.raises(ValueError, match="c"):
+        resilience.call("test", Flaky(ValueError("a"), ValueError("b"), ValueError("c")))
+
+
+def test_missing_element_is_not_retried():
+    operation = Flaky(NoSuchElementException())
+    with pytest.raises(NoSuchElementException):
+        resilience.call("test", operation)
+    assert operation.calls == 1
+
+
+def test_breaker_restarts_after_failures_in_a_row():
+    breaker, built = counting_breaker()
+    assert resilience.call("test", Flaky(ValueError(), ValueError()), breaker) == "ok"
+    assert built == [0, 1]
+    assert breaker.restarts == 1
+
+
+def test_dead_session_restarts_at_once():
+    breaker, built = counting_breaker()
+    resilience.call("test", Flaky(RuntimeError("invalid session id")), breaker)
+    assert built == [0, 1]
+
+
+def test_rate_limit_only_backs_off():
+    breaker, built = counting_breaker()
+    assert resilience.call("test", Flaky(RateLimited(), RateLimited()), breaker) == "ok"
+    assert built == [0]
+    assert breaker.failures == 0
+    assert not resilience.needs_reauth(Exception("403 Quota exceeded for quota metric"))
+
+
+def test_too_many_restarts_open_the_circuit():
+    breaker, _ = counting_breaker()
+    with pytest.raises(resilience.CircuitOpenError):
+        for _ in range(3):
+            resilience.call("test", Flaky(RuntimeError("chrome not reachable")), breaker)
+
+
+def test_successes_forgive_a_restart():
+    breaker, _ = counting_breaker()
+    # The retry that follows the restart is the first success.
+    resilience.call("test", Flaky(RuntimeError("invalid session id")), breaker)
+    resilience.call("test", Flaky(), breaker)
+    assert breaker.restarts == 1
+    resilience.call("test", Flaky(), breaker)
+    assert breaker.restarts == 0
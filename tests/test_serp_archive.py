@@ -0,0 +1,61 @@
+# test_serp_archive.py
+# Content-addressed pages: deduplication, lookup and retention.
+
+import datetime
+import hashlib
+import os
+import sqlite3
+
+import config
+
+HTML = "<html><body><div class='g'>result</div></body></html>"
+
+
+def test_identical_pages_share_one_blob(archive):
+    first = archive.archive_page("home loan", "desktop", 1, HTML, organic_urls=["https://a.com"], target="in-en-desktop")
+    second = archive.archive_page("home loan", "desktop", 1, HTML, organic_urls=["https://a.com"], target="in-en-desktop")
+    assert first != second
+    assert archive.stats()["pages"] == 2
+    assert archive.stats()["blobs"] == 1
+    assert archive.load_html(second) == HTML
+    assert archive.get_page(first)["organic_urls"] == ["https://a.com"]
+
+
+def test_blob_stored_by_another_process_meanwhile(archive, monkeypatch):
+    # Another process inserts the same blob between the SELECT and the INSERT.
+    archive._connect()
+    other = sqlite3.connect(os.path.join(config.SERP_ARCHIVE_PATH, "index.sqlite"))
+    compress = archive._compress
+
+    def racing_compress(data):
+        sha256 = hashlib.sha256(data).hexdigest()
+        other.execute("INSERT INTO blobs (sha256, codec, raw_bytes, stored_bytes, created_at) VALUES (?, 'gzip', 1, 1, 'now')", (sha256,))
+        other.commit()
+        return compress(data)
+
+    monkeypatch.setattr(archive, "_compress", racing_compress)
+    assert archive.archive_page("home loan", "desktop", 1, HTML) is not None
+    assert archive.stats() == {"pages": 1, "blobs": 1, "raw_bytes": 1, "stored_bytes": 1}
+    other.close()
+
+
+def test_find_pages_newest_first_in_any_case(archive):
+    archive.archive_page("Home Loan", "desktop", 1, HTML)
+    archive.archive_page("Home Loan", "desktop", 2, HTML + " ")
+    archive.archive_page("Home Loan", "mobile", 1, HTML)
+    archive.archive_page("car loan", "desktop", 1, HTML)
+    pages = archive.find_pages(keyword="home loan", device="desktop")
+    assert [p["page"] for p in pages] == [2, 1]
+    assert [p["page"] for p in archive.find_pages(keyword="HOME LOAN", device="desktop", page=1)] == [1]
+
+
+def test_retention_drops_old_pages_and_their_blobs(archive):
+    old = archive.archive_page("home loan", "desktop", 1, HTML)
+    archive.archive_page("home loan", "desktop", 1, HTML + "<!-- today -->")
+    long_ago = (datetime.date.today() - datetime.timedelta(days=40)).isoformat()
+    archive._connect().execute("UPDATE pages SET run_date = ? WHERE id = ?", (long_ago, old))
+    archive._connect().commit()
+    blob = archive.get_page(old)["html_sha256"]
+    assert archive.apply_retention(retention_days=30, max_mb=100) == (1, 1)
+    assert archive.stats()["pages"] == 1
+    assert not any(name.startswith(blob) for _, _, names in os.walk(config.SERP_ARCHIVE_PATH) for name in names)
@@ -0,0 +1,53 @@
+# test_storage.py
+# LocalWorksheet: the gspread subset the scripts use, on a CSV file.
+
+import pandas as pd
+import pytest
+
+import config
+import storage
+
+
+@pytest.fixture
+def worksheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "LOCAL_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "LOCAL_DATA_FORMAT", "csv")
+    monkeypatch.setattr(config, "LOCAL_FLUSH_EVERY", 2)
+    monkeypatch.setattr(storage, "_open_worksheets", [])
+    path = storage.local_path("Ranking")
+    pd.DataFrame({"Keyword": ["home loan", "car loan"], "ICICI URL": ["icici.com/a", ""], "ICICI": ["", ""]}).to_csv(path, index=False)
+    return storage.LocalWorksheet(path, "Ranking")
+
+
+def test_reads_every_cell_as_text(worksheet):
+    assert worksheet.get_all_records() == [
+        {"Keyword": "home loan", "ICICI URL": "icici.com/a", "ICICI": ""},
+        {"Keyword": "car loan", "ICICI URL": "", "ICICI": ""},
+    ]
+
+
+def test_writes_are_flushed_every_few_cells(worksheet):
+    worksheet.update_cell(2, 3, 7)
+    assert storage.read_table(worksheet.path)["ICICI"].tolist() == ["", ""]
+    worksheet.update_cell(3, 3, "Not Found")
+    assert storage.read_table(worksheet.path)["ICICI"].tolist() == ["7", "Not Found"]
+
+
+def test_flush_all_saves_the_rest(worksheet):
+    worksheet.update_cell(2, 3, 4)
+    storage.flush_all()
+    assert storage.read_table(worksheet.path)["ICICI"].tolist() == ["4", ""]
+
+
+def test_cells_outside_the_table_are_refused(worksheet):
+    for row, col in ((1, 1), (4, 1), (2, 4)):
+        with pytest.raises(IndexError):
+            worksheet.update_cell(row, col, "x")
+
+
+def test_copy_keeps_layout_and_pending_writes(worksheet):
+    worksheet.update_cell(2, 3, 1)
+    copy = worksheet.copy_as("Ranking - us-en-desktop")
+    assert copy.title == "Ranking - us-en-desktop"
+    assert copy.to_dataframe()["ICICI"].tolist() == ["1", ""]
+    assert worksheet.copy_as("Ranking - us-en-desktop").to_dataframe().equals(copy.to_dataframe())
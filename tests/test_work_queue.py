@@ -0,0 +1,128 @@
+# test_work_queue.py
+# JobQueue lease, expiry and retry transitions, on a temporary SQLite file.
+
+import pytest
+
+import config
+import work_queue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(work_queue.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(config, "QUEUE_VISIBILITY_TIMEOUT", 120)
+    monkeypatch.setattr(config, "QUEUE_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(config, "QUEUE_RETRY_DELAY", 60)
+    queue = work_queue.JobQueue(str(tmp_path / "queue.sqlite"))
+    queue.enqueue([{"keyword": "home loan"}], {"targets": ["in-en-desktop"]})
+    return queue
+
+
+def state(queue):
+    return {s: n for s, n in queue.stats().items() if n}
+
+
+def test_lease_hands_a_job_to_one_worker(queue):
+    job = queue.lease("a")
+    assert job["payload"] == {"keyword": "home loan"}
+    assert job["attempt"] == 1
+    assert queue.lease("b") is None
+    assert state(queue) == {work_queue.LEASED: 1}
+
+
+def test_heartbeat_keeps_the_lease(queue, clock):
+    job = queue.lease("a")
+    clock.now += 100
+    assert queue.heartbeat(job["id"], "a")
+    clock.now += 100
+    assert queue.lease("b") is None
+
+
+def test_expired_lease_goes_to_another_worker(queue, clock):
+    job = queue.lease("a")
+    clock.now += 121
+    again = queue.lease("b")
+    assert again["id"] == job["id"]
+    assert again["attempt"] == 2
+    assert not queue.heartbeat(job["id"], "a")
+    assert queue.heartbeat(job["id"], "b")
+
+
+def test_expired_last_attempt_fails_the_job(queue, clock):
+    for worker in ("a", "b", "c"):
+        assert queue.lease(worker) is not None
+        clock.now += 121
+    assert queue.pending() == 0
+    assert state(queue) == {work_queue.FAILED: 1}
+
+
+def test_failed_job_is_retried_after_the_delay(queue, clock):
+    job = queue.lease("a")
+    assert queue.fail(job["id"], "a", "captcha")
+    assert state(queue) == {work_queue.QUEUED: 1}
+    clock.now += 59
+    assert queue.lease("b") is None
+    clock.now += 1
+    assert queue.lease("b")["attempt"] == 2
+
+
+def test_fail_on_the_last_attempt_is_final(queue, clock):
+    for attempt in range(1, 4):
+        job = queue.lease("a")
+        assert job["attempt"] == attempt
+        queue.fail(job["id"], "a", "captcha")
+        clock.now += 60 * attempt
+    assert state(queue) == {work_queue.FAILED: 1}
+    assert queue.lease("a") is None
+
+
+def test_fail_from_a_worker_that_lost_the_lease_is_ignored(queue, clock):
+    job = queue.lease("a")
+    clock.now += 121
+    queue.lease("b")
+    assert not queue.fail(job["id"], "a", "timeout")
+    assert state(queue) == {work_queue.LEASED: 1}
+
+
+def test_only_the_lease_holder_completes(queue, clock):
+    job = queue.lease("a")
+    clock.now += 121
+    queue.lease("b")
+    assert not queue.complete(job["id"], "a", {"url": 3})
+    assert queue.complete(job["id"], "b", {"url": 4})
+    assert not queue.complete(job["id"], "b", {"url": 5})
+    assert state(queue) == {work_queue.DONE: 1}
+
+
+def test_failed_job_takes_no_result(queue, clock):
+    for worker in ("a", "b", "c"):
+        queue.lease(worker)
+        clock.now += 121
+    queue.pending()
+    assert not queue.complete(1, "c", {"url": 3})
+    assert state(queue) == {work_queue.FAILED: 1}
+
+
+def test_jobs_stay_until_written(queue):
+    job = queue.lease("a")
+    queue.complete(job["id"], "a", {"url": 3})
+    assert queue.unwritten() == 1
+    assert len(queue.finished_jobs()) == 1
+    queue.mark_written()
+    assert queue.unwritten() == 0
+    assert queue.finished_jobs() == []
+    assert queue.run_settings() == {"targets": ["in-en-desktop"]}
@@ -0,0 +1,497 @@
+# work_queue.py
+# Coordinator/worker mode for scraping from many machines (and so many IPs).
+#
+# The COORDINATOR reads the sheet, turns the batch into SERP jobs (the same
+# deduplicated, interleaved schedule as run_matrix.py) and keeps them in a
+# SQLite queue (config.WORK_QUEUE_PATH), served to the workers over HTTP:
+#   - a job is LEASED to one worker for QUEUE_VISIBILITY_TIMEOUT seconds; the
+#     worker's heartbeats extend the lease while it scrapes (CAPTCHA waits included)
+#   - a lease that expires (worker crashed, machine lost) makes the job
+#     visible again, so another worker picks it up
+#   - a failed job (CAPTCHA timeout, error) is retried after QUEUE_RETRY_DELAY
+#     x attempt seconds, up to QUEUE_MAX_ATTEMPTS attempts in total
+# When every job is done or failed, the coordinator writes all the ranks in one
+# batch per worksheet and runs the rank analytics. Jobs stay in the queue until
+# their ranks are written. Restarting a coordinator resumes an unfinished queue
+# - scraping the jobs left, or just writing the results - with the targets and
+# worksheet mode stored in the queue, whatever flags it was restarted with.
+#
+# WORKERS run the async engine's scrape_keyword() with their own Chromium and
+# context pools, pulling jobs until the queue is empty.
+#
+# Usage:
+#   python work_queue.py coordinator [--matrix] [--device mobile] [--fresh]
+#   python work_queue.py worker --coordinator http://10.0.0.5:8765 [--concurrency 4] [--headless]
+#   python work_queue.py stats [--coordinator http://10.0.0.5:8765]
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+import pacing
+import search_targets
+import selector_registry
+import rank_records
+import replay
+import log_setup
+import fetch_planner
+import anomaly_capture
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    written INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, available_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+QUEUED, LEASED, DONE, FAILED = "queued", "leased", "done", "failed"
+
+
+class SheetChangedError(Exception):
+    pass
+
+
+# --- 1. THE QUEUE (SQLITE) ---
+class JobQueue:
+
+    def __init__(self, path=None):
+        self.path = path or config.WORK_QUEUE_PATH
+        self._lock = threading.Lock()
+        # Autocommit mode; lease() takes the write lock itself with BEGIN IMMEDIATE.
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        # Queues created before the `written` column.
+        if "written" not in [row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")]:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN written INTEGER NOT NULL DEFAULT 0")
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM jobs")
+            self._db.execute("DELETE FROM meta")
+            self._db.execute("COMMIT")
+
+    def enqueue(self, payloads, settings=None):
+        # settings: what the results need besides the jobs (targets, worksheet mode), see run_settings().
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT INTO jobs (payload, available_at, updated_at) VALUES (?, ?, ?)",
+                                 [(json.dumps(p), now, now) for p in payloads])
+            self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                 [(key, json.dumps(value)) for key, value in (settings or {}).items()])
+            self._db.execute("COMMIT")
+
+    def run_settings(self):
+        # {key: value} stored by enqueue(); {} for a queue from an older version.
+        with self._lock:
+            rows = self._db.execute("SELECT key, value FROM meta").fetchall()
+        return {row["key"]: json.loads(row["value"]) for row in rows}
+
+    def unwritten(self):
+        # Jobs whose ranks have not reached the sheet yet, finished or not.
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE written = 0").fetchone()[0]
+
+    def mark_written(self):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET written = 1 WHERE state IN (?, ?)", (DONE, FAILED))
+
+    def lease(self, worker, visibility_timeout=None):
+        # Returns {"id", "payload", "attempt"} or None when nothing is available right now.
+        visibility_timeout = visibility_timeout or config.QUEUE_VISIBILITY_TIMEOUT
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._fail_expired(now)
+                row = self._db.execute(
+                    "SELECT id, payload, attempts FROM jobs"
+                    " WHERE (state = ? AND available_at <= ?) OR (state = ? AND lease_expires < ?)"
+                    " ORDER BY attempts, id LIMIT 1",
+                    (QUEUED, now, LEASED, now)).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET state = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                        (LEASED, worker, now + visibility_timeout, now, row["id"]))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {"id": row["id"], "payload": json.loads(row["payload"]), "attempt": row["attempts"] + 1}
+
+    def _fail_expired(self, now):
+        # Expired leases that used their last attempt will never come back. Call with _lock held.
+        self._db.execute(
+            "UPDATE jobs SET state = ?, error = 'lease expired', updated_at = ? WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+            (FAILED, now, LEASED, now, config.QUEUE_MAX_ATTEMPTS))
+
+    def heartbeat(self, job_id, worker, visibility_timeout=None):
+        # False when the lease was lost (expired and taken by another worker).
+        visibility_timeout = visibility_timeout or config.QUEUE_VISIBILITY_TIMEOUT
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND state = ? AND lease_owner = ?",
+                (now + visibility_timeout, now, job_id, LEASED, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker, result):
+        # Only from the worker holding the lease: a job that failed for good, or
+        # went to another worker, keeps its state.
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = NULL, updated_at = ? WHERE id = ? AND state = ? AND lease_owner = ?",
+                (DONE, json.dumps(result), time.time(), job_id, LEASED, worker))
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, worker, error):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT attempts FROM jobs WHERE id = ? AND state = ? AND lease_owner = ?",
+                                   (job_id, LEASED, worker)).fetchone()
+            if row is None:
+                return False
+            if row["attempts"] >= config.QUEUE_MAX_ATTEMPTS:
+                self._db.execute("UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE id = ?", (FAILED, error, now, job_id))
+            else:
+                retry_at = now + config.QUEUE_RETRY_DELAY * row["attempts"]
+                self._db.execute("UPDATE jobs SET state = ?, error = ?, available_at = ?, lease_owner = NULL, updated_at = ? WHERE id = ?",
+                                 (QUEUED, error, retry_at, now, job_id))
+        return True
+
+    def stats(self):
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = {state: 0 for state in (QUEUED, LEASED, DONE, FAILED)}
+        counts.update({state: count for state, count in rows})
+        return counts
+
+    def pending(self):
+        with self._lock:
+            self._fail_expired(time.time())
+        counts = self.stats()
+        return counts[QUEUED] + counts[LEASED]
+
+    def finished_jobs(self):
+        # [(payload, result or None, error)] for every done or failed job not written yet.
+        with self._lock:
+            rows = self._db.execute("SELECT payload, state, result, error FROM jobs WHERE state IN (?, ?) AND written = 0 ORDER BY id", (DONE, FAILED)).fetchall()
+        return [(json.loads(r["payload"]), json.loads(r["result"]) if r["state"] == DONE else None, r["error"]) for r in rows]
+
+
+# --- 2. HTTP FRONT END ---
+class _QueueHandler(BaseHTTPRequestHandler):
+    queue = None  # set by serve()
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        if config.QUEUE_TOKEN and self.headers.get("X-Queue-Token") != config.QUEUE_TOKEN:
+            self._reply(403, {"error": "bad token"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/stats":
+            self._reply(200, self.queue.stats())
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            worker = body["worker"]
+            if self.path == "/lease":
+                self._reply(200, {"job": self.queue.lease(worker), "pending": self.queue.pending()})
+            elif self.path == "/heartbeat":
+                self._reply(200, {"ok": self.queue.heartbeat(body["job_id"], worker)})
+            elif self.path == "/complete":
+                self._reply(200, {"ok": self.queue.complete(body["job_id"], worker, body["result"])})
+            elif self.path == "/fail":
+                self._reply(200, {"ok": self.queue.fail(body["job_id"], worker, body.get("error", ""))})
+            else:
+                self._reply(404, {"error": "not found"})
+        except (KeyError, ValueError) as e:
+            self._reply(400, {"error": f"bad request: {e}"})
+
+    def log_message(self, format, *args):
+        logging.debug(f"queue http: {format % args}")
+
+
+def serve(queue, host=None, port=None):
+    # Serves the queue from a background thread. Returns the server (call .shutdown()).
+    handler = type("QueueHandler", (_QueueHandler,), {"queue": queue})
+    server = ThreadingHTTPServer((host or config.QUEUE_HOST, port or config.QUEUE_PORT), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Work queue listening on http://{server.server_address[0]}:{server.server_address[1]}")
+    if server.server_address[0] not in ("127.0.0.1", "localhost") and not config.QUEUE_TOKEN:
+        logging.warning("The work queue accepts remote workers without a token. Set config.QUEUE_TOKEN.")
+    return server
+
+
+class QueueClient:
+    # The worker side of the HTTP API.
+
+    def __init__(self, base_url, worker):
+        self.base_url = base_url.rstrip("/")
+        self.worker = worker
+
+    def _request(self, path, body=None):
+        data = json.dumps(dict(body or {}, worker=self.worker)).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers={"Content-Type": "application/json", "X-Queue-Token": config.QUEUE_TOKEN})
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read())
+
+    def lease(self):
+        return self._request("/lease", {})
+
+    def heartbeat(self, job_id):
+        return self._request("/heartbeat", {"job_id": job_id})["ok"]
+
+    def complete(self, job_id, result):
+        return self._request("/complete", {"job_id": job_id, "result": result})["ok"]
+
+    def fail(self, job_id, error):
+        return self._request("/fail", {"job_id": job_id, "error": error})["ok"]
+
+    def stats(self):
+        return self._request("/stats")
+
+
+# --- 3. COORDINATOR ---
+def target_fields(target):
+    # JSON form of a search_targets.Target; search_targets.make_target(**fields) reverses it.
+    return {"country": target.country, "language": target.language, "device": target.device}
+
+
+def job_payloads(df, indices_to_process, targets):
+    import run_matrix
+    payloads = []
+    for job in run_matrix.build_schedule(df, indices_to_process, targets):
+        payloads.append({
+            "keyword": job.keyword,
+            "urls_to_find": job.urls_to_find,
+            "target": target_fields(job.target),
+            "rows": [int(row['original_index']) for row in job.rows],
+            # Workers have no rank history of their own (anomaly_capture.py).
+            "previous_ranks": anomaly_capture.previous_ranks(job),
+        })
+    return payloads
+
+
+def write_results(queue, base_worksheet, df, targets, per_target_worksheets):
+    # One batched write per worksheet, then the analytics for each.
+    import run_matrix
+    import sheet_io
+    import storage
+    import rank_analytics
+
+    rows_by_index = {int(row['original_index']): row for _, row in df.iterrows()}
+    cells = {target: [] for target in targets}
+    failed, moved = [], []
+    for payload, result, error in queue.finished_jobs():
+        target = search_targets.make_target(**payload["target"])
+        if result is None:
+            failed.append(f"'{payload['keyword']}' ({target.key}): {error}")
+            continue
+        # The rows are sheet row numbers from when the queue was filled.
+        key = fetch_planner.keyword_key(payload["keyword"])
+        missing = [i for i in payload["rows"] if i not in rows_by_index or fetch_planner.keyword_key(rows_by_index[i]['Keyword']) != key]
+        if missing:
+            moved.extend(missing)
+            continue
+        ranks = rank_records.KeywordRanks.from_dict(result["ranks"])
+        job = fetch_planner.KeywordJob(payload["keyword"], payload["urls_to_find"], target, [rows_by_index[i] for i in payload["rows"]])
+        cells.setdefault(target, []).extend(fetch_planner.fan_out(job, ranks))
+    if moved:
+        # Nothing written: the ranks would land on the wrong rows.
+        raise SheetChangedError(f"Sheet rows {sorted(set(moved))} no longer hold the keywords queued for them; the sheet changed "
+                                f"since the queue was filled. Rerun the coordinator with --fresh to queue the current sheet.")
+    if failed:
+        logging.warning(f"{len(failed)} job(s) failed after {config.QUEUE_MAX_ATTEMPTS} attempts:\n  " + "\n  ".join(failed))
+
+    for target in cells:
+        worksheet = storage.worksheet_copy(base_worksheet, run_matrix.target_worksheet_title(target)) if per_target_worksheets else base_worksheet
+        sheet_io.write_cells(worksheet, cells[target])
+        rank_analytics.run_stage(worksheet, target.key if per_target_worksheets else target.device)
+
+
+def run_coordinator(targets, per_target_worksheets=False, fresh=False, host=None, port=None):
+    import sheet_io
+    import storage
+
+    queue = JobQueue()
+    worksheet = storage.open_worksheet()
+    df = sheet_io.get_data_from_sheet(worksheet)
+    if fresh or queue.unwritten() == 0:
+        queue.clear()
+        indices_to_process = list(df.index)
+        random.shuffle(indices_to_process)
+        indices_to_process = indices_to_process[:config.KEYWORDS_PER_BATCH]
+        queue.enqueue(job_payloads(df, indices_to_process, targets),
+                      {"targets": [target_fields(t) for t in targets], "per_target_worksheets": per_target_worksheets})
+    else:
+        # The queued run's own targets and worksheet mode, not this command line's.
+        settings = queue.run_settings()
+        if settings:
+            targets = [search_targets.make_target(**fields) for fields in settings["targets"]]
+            per_target_worksheets = settings["per_target_worksheets"]
+        logging.info(f"Resuming the unfinished queue in '{queue.path}' ({', '.join(t.key for t in targets)}"
+                     f"{', one worksheet per target' if per_target_worksheets else ''}).")
+
+    server = serve(queue, host, port)
+    try:
+        while queue.pending():
+            logging.info(f"Queue: {queue.stats()}")
+            time.sleep(config.QUEUE_POLL_INTERVAL)
+    finally:
+        server.shutdown()
+    logging.info(f"All jobs finished: {queue.stats()}")
+    write_results(queue, worksheet, df, targets, per_target_worksheets)
+    # Only now may a new batch replace them: a failed write resumes on the next start.
+    queue.mark_written()
+
+
+# --- 4. WORKER ---
+async def _keep_leased(client, job_id):
+    while True:
+        await asyncio.sleep(config.QUEUE_HEARTBEAT_INTERVAL)
+        try:
+            leased = await asyncio.to_thread(client.heartbeat, job_id)
+        except OSError as e:  # URLError, timeouts, dropped connections
+            logging.warning(f"Could not renew the lease on job {job_id} ({e}); retrying in {config.QUEUE_HEARTBEAT_INTERVAL}s.")
+            continue
+        if not leased:
+            logging.warning(f"Lost the lease on job {job_id}; another worker may take it over.")
+            return
+
+
+async def queue_worker(worker_id, pools, client):
+    import async_engine
+    while True:
+        try:
+            response = await asyncio.to_thread(client.lease)
+        except urllib.error.URLError as e:
+            logging.warning(f"[worker {worker_id}] Coordinator unreachable ({e}); stopping.")
+            return
+        lease = response["job"]
+        if lease is None:
+            if response["pending"] == 0:
+                return  # nothing queued, nothing in flight anywhere
+            await asyncio.sleep(config.QUEUE_POLL_INTERVAL)  # jobs may come back from retries or expired leases
+            continue
+
+        payload = lease["payload"]
+        target = search_targets.make_target(**payload["target"])
+        log_setup.set_context(worker=worker_id, keyword=payload["keyword"], target=target.key, device=target.device)
+        logging.info(f"[worker {worker_id}] --- Processing keyword: '{payload['keyword']}' ({target.key}), attempt {lease['attempt']} ---")
+        heartbeat = asyncio.ensure_future(_keep_leased(client, lease["id"]))
+        context = await pools.acquire(target)
+        error = "CAPTCHA not solved"
+        try:
+            ranks = await async_engine.scrape_keyword(context, payload["keyword"], payload["urls_to_find"], target, payload.get("previous_ranks"))
+        except selector_registry.SelectorDriftError as e:
+            await asyncio.to_thread(client.fail, lease["id"], str(e))
+            raise
+        except Exception as e:
+            logging.error(f"[worker {worker_id}] Error while scraping '{payload['keyword']}': {e}", exc_info=True)
+            ranks, error = None, str(e)
+        finally:
+            heartbeat.cancel()
+            await pools.release(target, context)
+
+        if ranks is None:
+            await asyncio.to_thread(client.fail, lease["id"], error)
+        else:
+            logging.info(f"Finished scraping for '{payload['keyword']}' ({target.key}). Final ranks: {ranks}")
+            replay.event("ranks", keyword=payload["keyword"], device=target.device, target=target.key, ranks=ranks.to_dict())
+            if not await asyncio.to_thread(client.complete, lease["id"], {"ranks": ranks.to_dict()}):
+                logging.warning(f"[worker {worker_id}] Job {lease['id']} is no longer leased to this worker; its ranks were discarded.")
+
+        await pacing.human_pause_async("between_keywords")
+
+
+async def run_worker(coordinator_url, concurrency=None, headless=None):
+    import async_engine
+    concurrency = concurrency or config.ASYNC_CONCURRENCY
+    host = f"{socket.gethostname()}-{os.getpid()}"
+    async with async_engine.browser_pools(concurrency, headless) as pools:
+        await async_engine.run_workers(
+            queue_worker(i + 1, pools, QueueClient(coordinator_url, f"{host}-{i + 1}")) for i in range(concurrency))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape one batch of keywords with workers on many machines.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    coordinator_parser = sub.add_parser("coordinator", help="Queue the batch, serve it to workers, then write the ranks.")
+    coordinator_parser.add_argument("--matrix", action="store_true", help="Every target in config.RUN_TARGETS, each to its own worksheet.")
+    coordinator_parser.add_argument("--device", choices=["desktop", "mobile"], default="desktop", help="Single-target mode device (default: desktop).")
+    coordinator_parser.add_argument("--fresh", action="store_true", help="Discard an unfinished queue instead of resuming it.")
+    coordinator_parser.add_argument("--host", default=None, help=f"Listen address (default: config.QUEUE_HOST = {config.QUEUE_HOST}).")
+    coordinator_parser.add_argument("--port", type=int, default=None, help=f"Port (default: {config.QUEUE_PORT}).")
+    worker_parser = sub.add_parser("worker", help="Pull and scrape jobs until the queue is empty.")
+    worker_parser.add_argument("--coordinator", default=f"http://127.0.0.1:{config.QUEUE_PORT}")
+    worker_parser.add_argument("--concurrency", type=int, default=None, help="Jobs in flight on this machine (default: config.ASYNC_CONCURRENCY).")
+    worker_parser.add_argument("--headless", action="store_true", help="Run Chromium without a window.")
+    stats_parser = sub.add_parser("stats", help="Show the job counts of a running coordinator.")
+    stats_parser.add_argument("--coordinator", default=f"http://127.0.0.1:{config.QUEUE_PORT}")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print(QueueClient(args.coordinator, "stats").stats())
+    else:
+        import async_engine
+        # Workers of one machine each get their own log files (one writer per rotating file).
+        async_engine.setup_logging(f"queue_{args.command}", per_process=args.command == "worker")
+        replay.start_run(args.command)
+        if args.command == "coordinator":
+            targets = search_targets.load_targets() if args.matrix else [search_targets.default_target(args.device)]
+            try:
+                run_coordinator(targets, per_target_worksheets=args.matrix, fresh=args.fresh, host=args.host, port=args.port)
+            except SheetChangedError as e:
+                logging.critical(f"Not writing the ranks: {e}")
+        else:
+            try:
+                asyncio.run(run_worker(args.coordinator, args.concurrency, True if args.headless else None))
+            except selector_registry.SelectorDriftError as e:
+                logging.critical(f"Stopping this worker: {e}")